@@ -1,31 +1,45 @@
 import os
 import json
+import asyncio
 import uuid
+import hashlib
 import random
+import shutil
 import pytz
-import threading
 import time
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException, Depends, status
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse
+from fastapi import FastAPI, Request, Form, File, UploadFile, HTTPException, Depends, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, JSONResponse, Response, StreamingResponse
+from email.utils import formatdate, parsedate_to_datetime
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import starlette.formparsers as _formparsers
-
-# Aumenta limite de upload de partes multipart para 50 MB (padrão é 1 MB)
-_orig_multipart_init = _formparsers.MultiPartParser.__init__
-def _patched_multipart_init(self, *args, max_part_size: int = 50 * 1024 * 1024, **kwargs):
-    _orig_multipart_init(self, *args, max_part_size=max_part_size, **kwargs)
-_formparsers.MultiPartParser.__init__ = _patched_multipart_init
 from starlette.middleware.sessions import SessionMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
 
-from picture import picture_frame, resize_cover
-from PIL import Image
+from picture import render_to_file, warm_render_resources, QUALITY_PRESETS
+from layout import available_layouts
+from render_engine import RenderEngine, RenderBusy, RenderTimeout
+import eink
+import delta
+import bundle
+import variants
+from notifier import VersionNotifier
+from state_store import open_state_store
+from scheduler import Scheduler
+from uploads import save_upload, UploadRejected, BodySizeLimit
+from photo_store import PerceptualIndex, dhash, file_sha256
+from batch import BatchRunner
+from render_cache import render_cache, render_key
+import thumbnails
+import fleet
+import metrics
+import cluster
+from starlette.concurrency import run_in_threadpool
 
 load_dotenv(override=True)
 
@@ -40,13 +54,78 @@ PASSWORD = os.getenv("PASSWORD", "admin")
 
 UPLOAD_FOLDER = "uploads"
 IMAGES_FOLDER = "static/images"
-DATA_FILE = "data/latest.json"
-SCHEDULE_FILE = "data/schedule.json"
-ALBUM_FILE = "data/album.json"
-MESSAGES_FILE = "data/messages.json"
-AUTO_SCHEDULER_FILE = "data/auto_scheduler.json"
-
-for d in [UPLOAD_FOLDER, IMAGES_FOLDER, "data", "templates", "static/thumbnails"]:
+THUMBNAILS_FOLDER = "static/thumbnails"
+BATCH_FOLDER = "batches"  # fora de static/: downloads só com login
+DATA_DIR = "data"
+
+# Estado (album/messages/schedule/auto_scheduler/latest) fica em memória;
+# >0 agrupa as gravações em disco numa janela de N segundos (só fora de transação;
+# com o lock entre workers abaixo cada transação grava ao terminar)
+STATE_FLUSH_DELAY = float(os.getenv("STATE_FLUSH_DELAY", "0"))
+
+# Backend de persistência: "json" (data/*.json) ou "sqlite" (WAL, importa os JSON na 1ª vez)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "picture_frame.db"))
+
+# Render engine: processos dedicados (0 = thread única), fila limitada e timeout por job
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_QUEUE_SIZE = int(os.getenv("RENDER_QUEUE_SIZE", "8"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+
+# Framebuffers e-ink pré-gerados a cada publicação (ex.: "bw,gray4"); outros sob demanda
+EINK_PANELS = [p.strip() for p in os.getenv("EINK_PANELS", "bw").split(",") if p.strip() in eink.PANELS]
+EINK_DITHER = os.getenv("EINK_DITHER", "floyd")
+
+# Refresh parcial: diff por tiles (8 ou 16 px) contra o frame anterior a cada publicação;
+# acima desta fração da área suja o device recebe o frame inteiro
+DELTA_TILE = int(os.getenv("DELTA_TILE", "16"))
+DELTA_MAX_RATIO = float(os.getenv("DELTA_MAX_RATIO", "0.5"))
+
+# Codificações extras geradas na publicação (/api/image?format=...) e memória
+# para servir os frames publicados sem ler o disco
+FRAME_VARIANTS = [v.strip() for v in os.getenv("FRAME_VARIANTS", ",".join(variants.VARIANTS)).split(",")
+                  if v.strip() in variants.VARIANTS]
+HOT_FRAMES_MB = int(os.getenv("HOT_FRAMES_MB", "32"))
+
+# Long-poll / SSE: espera máxima por requisição e intervalo de keep-alive do SSE
+LONGPOLL_MAX_TIMEOUT = float(os.getenv("LONGPOLL_MAX_TIMEOUT", "55"))
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+
+# Execuções perdidas com o servidor parado (além da tolerância em segundos):
+# all = roda todas, latest = só o job manual mais recente, skip = descarta e reagenda
+SCHEDULER_CATCHUP = os.getenv("SCHEDULER_CATCHUP", "all")
+if SCHEDULER_CATCHUP not in ("all", "latest", "skip"):
+    SCHEDULER_CATCHUP = "all"
+SCHEDULER_CATCHUP_GRACE = float(os.getenv("SCHEDULER_CATCHUP_GRACE", "300"))
+
+# Distância de Hamming máxima (bits do dHash de 64) para marcar fotos quase iguais
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", "6"))
+
+# Render em lote: itens por requisição
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+# Pré-render: o próximo frame agendado é renderizado em staging N segundos antes
+# do prazo e, no prazo, só é movido para images/ e publicado (0 = desativado)
+PRERENDER_LEAD = float(os.getenv("PRERENDER_LEAD", "300"))
+STAGING_FOLDER = os.path.join(IMAGES_FOLDER, "staging")
+
+# Playlist offline (/api/bundle): máximo de frames por download; frames ficam
+# fora de static/ (só com bearer) e são reaproveitados entre downloads
+BUNDLE_MAX_COUNT = int(os.getenv("BUNDLE_MAX_COUNT", "48"))
+BUNDLE_FOLDER = "bundles"
+
+# /metrics (Prometheus): vazio = aberto; definido = exige "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Vários workers (uvicorn --workers N): só o dono do lock roda o scheduler e os
+# outros tentam assumir a cada N segundos se ele morrer. Toda mutação de estado
+# roda em state.transaction() sob o flock de data/cluster/state.lock (relê o que
+# outro worker gravou antes de alterar) e é avisada aos outros por socket unix
+CLUSTER_DIR = os.path.join(DATA_DIR, "cluster")
+SCHEDULER_LEADER_RETRY = float(os.getenv("SCHEDULER_LEADER_RETRY", "5"))
+
+for d in [UPLOAD_FOLDER, IMAGES_FOLDER, STAGING_FOLDER, DATA_DIR, CLUSTER_DIR, BUNDLE_FOLDER, "templates",
+          THUMBNAILS_FOLDER]:
     os.makedirs(d, exist_ok=True)
 
 # ---------------------------------------------------------------------------
@@ -55,38 +134,44 @@ for d in [UPLOAD_FOLDER, IMAGES_FOLDER, "data", "templates", "static/thumbnails"
 
 app = FastAPI(title="Picture Frame")
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
+app.add_middleware(BodySizeLimit)
+app.add_middleware(metrics.MetricsMiddleware)  # por último = mais externo: conta também os 413
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.mount("/uploads", StaticFiles(directory=UPLOAD_FOLDER), name="uploads")
 templates = Jinja2Templates(directory="templates")
 
-# ---------------------------------------------------------------------------
-# Helpers JSON
-# ---------------------------------------------------------------------------
+render_engine = RenderEngine(
+    RENDER_WORKERS, RENDER_QUEUE_SIZE, RENDER_TIMEOUT, initializer=warm_render_resources
+)
+hot_frames = variants.HotFrames(HOT_FRAMES_MB * 1024 * 1024)
 
-def _init_json(path, default):
-    if not os.path.exists(path):
-        with open(path, "w") as f:
-            json.dump(default, f, indent=2)
+@app.on_event("startup")
+def _startup_render_engine():
+    warm_render_resources()
+    render_engine.warmup()
 
-_init_json(ALBUM_FILE, [])
-_init_json(MESSAGES_FILE, [])
-_init_json(SCHEDULE_FILE, [])
-_init_json(AUTO_SCHEDULER_FILE, {
-    "enabled": False, "interval_hours": 1, "dark_mode": False,
-    "last_photo_id": None, "last_message_id": None, "next_run": None,
-    "cleanup_enabled": False, "cleanup_interval_hours": 24, "cleanup_next_run": None
-})
+@app.on_event("shutdown")
+def _shutdown_render_engine():
+    render_engine.shutdown(wait=False)
 
-def _read_json(path, default):
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except Exception:
-        return default
+def _render_http_error(e):
+    if isinstance(e, RenderBusy):
+        return HTTPException(503, str(e), headers={"Retry-After": "5"})
+    if isinstance(e, RenderTimeout):
+        return HTTPException(504, str(e))
+    return HTTPException(500, str(e))
 
-def _write_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+# ---------------------------------------------------------------------------
+# Estado (JSON em memória com gravação atômica, ou SQLite)
+# ---------------------------------------------------------------------------
+
+state = open_state_store(STORAGE_BACKEND, DATA_DIR, flush_delay=STATE_FLUSH_DELAY, sqlite_path=SQLITE_PATH,
+                         lock_path=os.path.join(CLUSTER_DIR, "state.lock"))
+
+# Lotes usam no máximo um job por worker; o resto da fila fica para as rotas.
+# Registro do job no estado e saídas em batches/<job_id>: qualquer worker responde
+batch_runner = BatchRunner(render_engine, BATCH_FOLDER, state.batch_jobs, max_in_flight=RENDER_WORKERS,
+                           cache=render_cache)
 
 # ---------------------------------------------------------------------------
 # Tempo
@@ -101,12 +186,12 @@ def get_now_gmt3():
 # ---------------------------------------------------------------------------
 
 def get_next_version(today_str: str) -> str:
-    if not os.path.exists(DATA_FILE):
-        return f"{today_str}_1"
+    data = state.latest.get()
+    return _version_after(data.get("versao", "") if data else "", today_str)
+
+def _version_after(last, today_str):
+    # Contador reinicia a cada dia: "<dia>_1", "<dia>_2", ...
     try:
-        with open(DATA_FILE) as f:
-            data = json.load(f)
-        last = data.get("versao", "")
         if last.startswith(today_str):
             parts = last.split("_")
             if len(parts) >= 2:
@@ -122,65 +207,394 @@ def save_metadata(now, version, filename):
         "versao": version,
         "arquivo": filename,
     }
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=2)
+    state.latest.set(data)
+    state.history.append(dict(data, created_at=now.isoformat()))
+    version_notifier.publish(data)
     return data
 
+version_notifier = VersionNotifier()
+version_notifier.publish(state.latest.get())
+
 # ---------------------------------------------------------------------------
 # Geração de imagem
 # ---------------------------------------------------------------------------
 
-def process_image_generation_from_path(foto_path, frase_superior, frase_inferior, dark_mode, raw=False):
+def _new_output():
     now = get_now_gmt3()
-    today_str = now.strftime("%Y-%m-%d")
-    timestamp_str = now.strftime("%Y-%m-%d_%H-%M-%S")
-    filename = f"{timestamp_str}.png"
-    output_path = os.path.join(IMAGES_FOLDER, filename)
-
-    if raw:
-        img = Image.open(foto_path).convert("RGB")
-        img = resize_cover(img, 800, 480)
-        img.save(output_path, "PNG")
-    else:
-        picture_frame(
-            foto_path=foto_path,
-            frase_superior=frase_superior,
-            frase_inferior=frase_inferior,
-            dark_mode=dark_mode,
-            output_path=output_path,
-        )
+    filename = f"{now.strftime('%Y-%m-%d_%H-%M-%S')}.png"
+    return now, filename, os.path.join(IMAGES_FOLDER, filename)
+
+def _source(foto_path, frase_superior, frase_inferior, dark_mode, raw=False, quality=None, layout=None):
+    # Entradas do render, guardadas para refazer o frame nos perfis dos devices
+    return {
+        "foto_path": foto_path, "frase_superior": frase_superior, "frase_inferior": frase_inferior,
+        "dark_mode": bool(dark_mode), "raw": bool(raw), "quality": quality, "layout": layout,
+    }
+
+def _publish(now, filename, source):
+    # Versão + gravação na mesma transação: publicações concorrentes (de qualquer worker) não repetem versão
+    with state.transaction():
+        version = get_next_version(now.strftime("%Y-%m-%d"))
+        data = save_metadata(now, version, filename)
+        _fan_out(data, source)
+    return data
+
+def _render_cached(output_path, foto_path, frase_superior, frase_inferior, dark_mode, raw=False, quality=None,
+                   layout=None, panels=None):
+    # Frame idêntico já renderizado (preview, álbum pequeno em ciclo): só um link no destino
+    panels = EINK_PANELS if panels is None else panels
+    key = render_key(foto_path, frase_superior, frase_inferior, dark_mode, raw, quality, layout=layout)
+    if render_cache.fetch(key, output_path, panels, EINK_DITHER):
+        missing = _missing_framebuffers(output_path, panels)
+        for panel in missing:
+            render_engine.run(eink.write_framebuffer, output_path,
+                              eink.framebuffer_path(output_path, panel, EINK_DITHER), panel, EINK_DITHER)
+        if missing:
+            render_cache.store(key, output_path, panels, EINK_DITHER)  # completa a entrada do cache
+        return
+    render_engine.run(
+        render_to_file, foto_path, frase_superior, frase_inferior, dark_mode, output_path, raw, quality,
+        panels=panels, dither=EINK_DITHER, layout=layout,
+    )
+    render_cache.store(key, output_path, panels, EINK_DITHER)
+
+def _missing_framebuffers(output_path, panels):
+    # Entrada do cache gravada sem estes painéis (ex.: preview, que não gera framebuffer)
+    return [p for p in panels if not os.path.exists(eink.framebuffer_path(output_path, p, EINK_DITHER))]
+
+async def _render_cached_async(output_path, foto_path, frase_superior, frase_inferior, dark_mode, raw=False,
+                               quality=None, layout=None, panels=None):
+    panels = EINK_PANELS if panels is None else panels
+    key = await run_in_threadpool(
+        render_key, foto_path, frase_superior, frase_inferior, dark_mode, raw, quality, layout=layout,
+    )
+    if await run_in_threadpool(render_cache.fetch, key, output_path, panels, EINK_DITHER):
+        missing = _missing_framebuffers(output_path, panels)
+        await asyncio.gather(*(
+            render_engine.run_async(eink.write_framebuffer, output_path,
+                                    eink.framebuffer_path(output_path, panel, EINK_DITHER), panel, EINK_DITHER)
+            for panel in missing
+        ))
+        if missing:
+            await run_in_threadpool(render_cache.store, key, output_path, panels, EINK_DITHER)
+        return
+    await render_engine.run_async(
+        render_to_file, foto_path, frase_superior, frase_inferior, dark_mode, output_path, raw, quality,
+        panels=panels, dither=EINK_DITHER, layout=layout,
+    )
+    await run_in_threadpool(render_cache.store, key, output_path, panels, EINK_DITHER)
+
+def _delta_job(output_path, base, panels):
+    if not base or not base.get("arquivo") or not panels:
+        return None
+    base_path = os.path.join(IMAGES_FOLDER, base["arquivo"])
+    if not os.path.exists(base_path):
+        return None
+    return (delta.write_deltas, base_path, output_path, list(panels), EINK_DITHER, base["versao"],
+            DELTA_TILE, DELTA_MAX_RATIO)
+
+def _encode_jobs(output_path, base, panels, encode_variants):
+    jobs = []
+    if encode_variants and FRAME_VARIANTS:
+        jobs.append((variants.encode_variants, output_path, FRAME_VARIANTS))
+    job = _delta_job(output_path, base, EINK_PANELS if panels is None else panels)
+    if job:
+        jobs.append(job)
+    return jobs
+
+def _encode_frame(output_path, base, panels=None, encode_variants=True):
+    """Estágio de publicação: variantes codificadas e delta contra ``base`` (frame anterior).
+
+    Os jobs rodam em paralelo no render engine; falha só deixa a variante para
+    ser gerada sob demanda (e o device recebe o frame inteiro no lugar do
+    delta), nunca impede a publicação. Fila cheia também: não espera vaga.
+    """
+    futures = []
+    for fn, *args in _encode_jobs(output_path, base, panels, encode_variants):
+        try:
+            futures.append(render_engine.submit(fn, *args))
+        except RenderBusy:
+            print(f"[Publicação] Fila cheia, {fn.__name__} fica para depois ({os.path.basename(output_path)})")
+        except Exception as e:
+            print(f"[Publicação] Erro ao enfileirar {fn.__name__}: {e}")
+    for future in futures:
+        try:
+            future.result(timeout=RENDER_TIMEOUT)
+        except Exception as e:
+            print(f"[Publicação] Erro em {os.path.basename(output_path)}: {e}")
+
+async def _encode_frame_async(output_path, base, panels=None):
+    futures = []
+    for fn, *args in _encode_jobs(output_path, base, panels, True):
+        try:
+            futures.append(asyncio.wrap_future(render_engine.submit(fn, *args)))
+        except Exception as e:
+            print(f"[Publicação] Erro ao enfileirar {fn.__name__}: {e}")
+    if futures:
+        done, pending = await asyncio.wait(futures, timeout=RENDER_TIMEOUT)
+        for future in done:
+            if future.exception():
+                print(f"[Publicação] Erro em {os.path.basename(output_path)}: {future.exception()}")
+
+def _frame_files(frame, panels=None):
+    """(caminho, content-type) de tudo que /api/image serve para ``frame``."""
+    filepath = os.path.join(IMAGES_FOLDER, frame["arquivo"])
+    return [
+        (filepath, "image/png"),
+        *((variants.variant_path(filepath, name), variants.VARIANTS[name][1]) for name in FRAME_VARIANTS),
+        *((eink.framebuffer_path(filepath, panel, EINK_DITHER), "application/octet-stream")
+          for panel in (EINK_PANELS if panels is None else panels)),
+    ]
+
+def _preload_frame(frame, panels=None):
+    # Frame recém-publicado já na memória antes da primeira leva de devices
+    for path, media_type in _frame_files(frame, panels):
+        try:
+            hot_frames.load(path, frame["versao"], media_type)
+        except OSError:
+            pass
+
+def process_image_generation_from_path(foto_path, frase_superior, frase_inferior, dark_mode, raw=False):
+    # Versão síncrona (scheduler): espera vaga na fila do render engine
+    now, filename, output_path = _new_output()
+    _render_cached(output_path, foto_path, frase_superior, frase_inferior, dark_mode, raw)
+    _encode_frame(output_path, state.latest.get())
+    data = _publish(now, filename, _source(foto_path, frase_superior, frase_inferior, dark_mode, raw))
+    _preload_frame(data)
+    return data
+
+async def process_image_generation_async(foto_path, frase_superior, frase_inferior, dark_mode, raw=False, quality=None,
+                                         layout=None):
+    # Versão para rotas: RenderBusy/RenderTimeout sobem para o chamador
+    now, filename, output_path = _new_output()
+    await _render_cached_async(output_path, foto_path, frase_superior, frase_inferior, dark_mode, raw, quality, layout)
+    await _encode_frame_async(output_path, state.latest.get())
+    data = _publish(now, filename, _source(foto_path, frase_superior, frase_inferior, dark_mode, raw, quality, layout))
+    await run_in_threadpool(_preload_frame, data)
+    return data
+
+# ---------------------------------------------------------------------------
+# Frota de devices (um render por perfil distinto, não por device)
+# ---------------------------------------------------------------------------
 
-    version = get_next_version(today_str)
-    metadata = save_metadata(now, version, filename)
-    return metadata
+# chave de perfil → VersionNotifier; o perfil principal usa version_notifier
+profile_notifiers = {}
+# Renders dos perfis rodam fora de quem publicou (rota ou scheduler)
+fleet_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fleet")
+
+def _profile_notifier(key):
+    with state.lock:
+        notifier = profile_notifiers.get(key)
+        if notifier is None:
+            notifier = profile_notifiers[key] = VersionNotifier()
+            notifier.publish(state.fleet.get()["profiles"].get(key))
+        return notifier
+
+def _device_profile(device, source):
+    """(chave, perfil) do device; chave None = frame principal (state.latest)."""
+    profile = fleet.profile_of(device, source or {})
+    if not source or fleet.is_default(profile, source):
+        return None, profile
+    return fleet.profile_key(profile), profile
+
+def _device_frame(device):
+    """(frame, modified, notifier) vistos por ``device``; None = token global."""
+    if device is not None:
+        fleet_state = state.fleet.get()
+        key, _ = _device_profile(device, fleet_state["source"])
+        if key is not None:
+            return fleet_state["profiles"].get(key), state.fleet.modified, _profile_notifier(key)
+    return state.latest.get(), state.latest.modified, version_notifier
+
+def _profiles_for(devices, source):
+    # chave → (perfil, painéis): devices com perfil igual compartilham o render
+    profiles = {}
+    for device in devices:
+        key, profile = _device_profile(device, source)
+        if key is not None:
+            profiles.setdefault(key, (profile, set()))[1].add(device.get("panel") or "bw")
+    return profiles
+
+def _fan_out(data, source):
+    """Registra a publicação e agenda o render de cada perfil distinto dos devices."""
+    source = dict(source, versao=data["versao"])
+    profiles = _profiles_for(state.devices.all(), source)
+    with state.transaction():
+        pointers = state.fleet.get()["profiles"]
+        # Perfis sem device (removido ou que mudou de modo) saem do ponteiro
+        state.fleet.set({"source": source, "profiles": {k: v for k, v in pointers.items() if k in profiles}})
+    if profiles:
+        fleet_executor.submit(_render_profiles, data, source, profiles)
+
+def _ensure_device_frame(device):
+    # Device novo: renderiza a publicação atual no perfil dele, se ainda não existe
+    with state.lock:
+        fleet_state = state.fleet.get()
+        data = state.latest.get()
+    source = fleet_state["source"]
+    if not source or not data or data["versao"] != source["versao"]:
+        return
+    profiles = _profiles_for([device], source)
+    profiles = {k: v for k, v in profiles.items()
+                if (fleet_state["profiles"].get(k) or {}).get("versao") != data["versao"]}
+    if profiles:
+        fleet_executor.submit(_render_profiles, data, source, profiles)
+
+def _render_profiles(data, source, profiles):
+    stem = os.path.splitext(data["arquivo"])[0]
+    futures = {}
+    for key, (profile, panels) in profiles.items():
+        # Mesmo stem do frame principal: o cleanup mantém/remove tudo junto
+        filename = f"{stem}.{key}.png"
+        output_path = os.path.join(IMAGES_FOLDER, filename)
+        panels = sorted(p for p in panels if p in eink.PANELS)
+        size = (profile["width"], profile["height"])
+        try:
+            cache_key = render_key(
+                source["foto_path"], source["frase_superior"], source["frase_inferior"], profile["dark_mode"],
+                profile["raw"], source.get("quality"), size, profile["rotation"], source.get("layout"),
+            )
+            if render_cache.fetch(cache_key, output_path, panels, EINK_DITHER):
+                for panel in _missing_framebuffers(output_path, panels):
+                    render_engine.run(eink.write_framebuffer, output_path,
+                                      eink.framebuffer_path(output_path, panel, EINK_DITHER), panel, EINK_DITHER)
+                _finish_profile_frame(key, dict(data, arquivo=filename), panels)
+                continue
+            future = render_engine.submit(
+                render_to_file, source["foto_path"], source["frase_superior"], source["frase_inferior"],
+                profile["dark_mode"], output_path, profile["raw"], source.get("quality"),
+                panels=panels, dither=EINK_DITHER, size=size, rotation=profile["rotation"],
+                layout=source.get("layout"), block=True,
+            )
+        except Exception as e:
+            print(f"[Frota] Erro ao enfileirar {key}: {e}")
+            continue
+        futures[future] = (key, filename, cache_key, panels)
+    for future in as_completed(futures):
+        key, filename, cache_key, panels = futures[future]
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[Frota] Erro ao renderizar {key}: {e}")
+            continue
+        render_cache.store(cache_key, os.path.join(IMAGES_FOLDER, filename), panels, EINK_DITHER)
+        _finish_profile_frame(key, dict(data, arquivo=filename), panels)
+
+def _finish_profile_frame(key, frame, panels):
+    _encode_frame(os.path.join(IMAGES_FOLDER, frame["arquivo"]), state.fleet.get()["profiles"].get(key), panels)
+    _set_profile_frame(key, frame)
+    _preload_frame(frame, panels)
+
+def _set_profile_frame(key, frame):
+    with state.transaction():
+        fleet_state = state.fleet.get()
+        current = fleet_state["profiles"].get(key)
+        # Um render atrasado de uma publicação anterior não volta o ponteiro
+        if current and (current["dia"], current["horario"]) > (frame["dia"], frame["horario"]):
+            return
+        state.fleet.update(profiles=dict(fleet_state["profiles"], **{key: frame}))
+    _profile_notifier(key).publish(frame)
 
 # ---------------------------------------------------------------------------
 # Álbum de Fotos
 # ---------------------------------------------------------------------------
 
-def album_add_photo(foto_path: str, original_filename: str):
-    album = _read_json(ALBUM_FILE, [])
-    existing_paths = {item["path"] for item in album}
-    if foto_path in existing_paths:
-        return next(item for item in album if item["path"] == foto_path)
-    entry = {
-        "id": str(uuid.uuid4()),
-        "filename": os.path.basename(foto_path),
-        "original_name": original_filename,
-        "path": foto_path,
-        "created_at": get_now_gmt3().isoformat(),
-    }
-    album.append(entry)
-    _write_json(ALBUM_FILE, album)
+# Uploads são endereçados por conteúdo (uploads/<sha[:2]>/<sha256>.<ext>):
+# reenviar a mesma foto devolve a entrada existente e o blob só é apagado
+# quando nenhuma entrada do álbum nem job agendado o referencia.
+photo_index = PerceptualIndex(state.album.all())
+
+# Miniaturas geradas em segundo plano no upload (uma thread; o Pillow solta o GIL)
+thumbnail_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbs")
+
+def _generate_thumbnails(foto_path, version):
+    try:
+        thumbnails.make_thumbnails(foto_path, THUMBNAILS_FOLDER, version)
+    except Exception as e:
+        print(f"[Thumbnails] Erro em {foto_path}: {e}")
+
+def _backfill_album_hashes():
+    """Entradas anteriores aos uploads por conteúdo ganham sha256/phash: reenvio da mesma foto deduplica."""
+    count = 0
+    for photo in state.album.all():
+        if photo.get("sha256") and photo.get("phash"):
+            continue
+        try:
+            sha256 = photo.get("sha256") or file_sha256(photo["path"])
+            phash = photo.get("phash") or dhash(photo["path"])
+        except Exception:
+            continue  # arquivo sumiu ou ilegível
+        old_version = thumbnails.thumbnail_version(photo["path"], photo.get("sha256"))
+        with state.transaction():
+            current = state.album.get(photo["id"])
+            if not current or current["path"] != photo["path"]:
+                continue
+            state.album.update(photo["id"], sha256=sha256, phash=phash)
+            photo_index.add(photo["id"], phash)
+        # Miniaturas são endereçadas pela versão, que agora é o sha256
+        if old_version != sha256:
+            _generate_thumbnails(photo["path"], sha256)
+            thumbnails.remove_thumbnails(THUMBNAILS_FOLDER, old_version)
+        count += 1
+    if count:
+        print(f"[Álbum] sha256/phash calculados para {count} foto(s) antiga(s)")
+
+def _thumbnail_urls(photo):
+    version = thumbnails.thumbnail_version(photo["path"], photo.get("sha256"))
+    if not version:
+        return {}
+    # ?v= muda junto com o conteúdo: a URL pode ser cacheada como imutável
+    return {str(size): f"/thumbs/{photo['id']}/{size}.webp?v={version[:16]}" for size in thumbnails.THUMB_SIZES}
+
+def album_add_photo(stored: dict, original_filename: str):
+    foto_path = stored["path"]
+    with state.transaction():
+        existing = state.album.find("path", foto_path) or state.album.find("sha256", stored["sha256"])
+        if existing:
+            if existing["path"] != foto_path:
+                _release_photo(foto_path)  # entrada antiga (nome de arquivo) com o mesmo conteúdo
+            return existing
+        entry_id = str(uuid.uuid4())
+        entry = state.album.add({
+            "id": entry_id,
+            "filename": os.path.relpath(foto_path, UPLOAD_FOLDER),
+            "original_name": original_filename,
+            "path": foto_path,
+            "sha256": stored["sha256"],
+            "phash": stored["phash"],
+            "near_duplicates": photo_index.near(stored["phash"], NEAR_DUPLICATE_DISTANCE, exclude=entry_id),
+            "created_at": get_now_gmt3().isoformat(),
+        })
+        photo_index.add(entry_id, stored["phash"])
+    thumbnail_executor.submit(_generate_thumbnails, foto_path, stored["sha256"])
+    scheduler.wake()  # auto scheduler pode estar esperando álbum não vazio
     return entry
 
+def _photo_in_use(foto_path):
+    return bool(state.album.find("path", foto_path)) or any(
+        job["foto_path"] == foto_path for job in state.schedule.all()
+    )
+
+def _release_photo(foto_path):
+    """Apaga o arquivo da foto se nada mais o referencia (álbum ou agendamentos)."""
+    with state.transaction():
+        if _photo_in_use(foto_path) or not os.path.exists(foto_path):
+            return False
+        version = thumbnails.thumbnail_version(foto_path)
+        try:
+            os.remove(foto_path)
+            thumbnails.remove_thumbnails(THUMBNAILS_FOLDER, version)
+            return True
+        except OSError:
+            return False
+
 # ---------------------------------------------------------------------------
 # Agendamento manual
 # ---------------------------------------------------------------------------
 
 def save_schedule(foto_path, frase_superior, frase_inferior, dark_mode, target_time_str):
-    schedule_data = _read_json(SCHEDULE_FILE, [])
-    schedule_data.append({
+    state.schedule.add({
+        "id": str(uuid.uuid4()),
         "foto_path": foto_path,
         "frase_superior": frase_superior,
         "frase_inferior": frase_inferior,
@@ -188,20 +602,18 @@ def save_schedule(foto_path, frase_superior, frase_inferior, dark_mode, target_t
         "target_time": target_time_str,
         "created_at": get_now_gmt3().isoformat(),
     })
-    _write_json(SCHEDULE_FILE, schedule_data)
+    scheduler.wake()
 
 # ---------------------------------------------------------------------------
 # Auto Scheduler
 # ---------------------------------------------------------------------------
 
 def _get_auto_cfg():
-    return _read_json(AUTO_SCHEDULER_FILE, {
-        "enabled": False, "interval_hours": 1, "dark_mode": False,
-        "last_photo_id": None, "last_message_id": None, "next_run": None,
-    })
+    return state.auto_cfg.get()
 
 def _save_auto_cfg(cfg):
-    _write_json(AUTO_SCHEDULER_FILE, cfg)
+    state.auto_cfg.set(cfg)
+    scheduler.wake()
 
 def _pick_next(items, last_id):
     if not items:
@@ -211,47 +623,106 @@ def _pick_next(items, last_id):
     candidates = [i for i in items if i["id"] != last_id]
     return random.choice(candidates if candidates else items)
 
-def _run_auto_scheduler():
-    cfg = _get_auto_cfg()
-    album = _read_json(ALBUM_FILE, [])
-    messages = _read_json(MESSAGES_FILE, [])
+def _planned_pairs(cfg):
+    # Rotação planejada por /api/bundle, sem os pares cuja foto/mensagem saiu do álbum
+    pairs = []
+    for entry in cfg.get("upcoming") or []:
+        photo = state.album.get(entry["photo_id"])
+        message = state.messages.get(entry["message_id"])
+        if photo and message and os.path.exists(photo["path"]):
+            pairs.append((photo, message))
+    return pairs
+
+def _pick_auto_pair(cfg):
+    album = state.album.all()
+    messages = state.messages.all()
     if not album or not messages:
         print("[Auto Scheduler] Álbum ou mensagens vazios, pulando.")
-        return
+        return None, None
+    planned = _planned_pairs(cfg)
+    if planned:
+        # Sequência já entregue aos devices no bundle: segue o plano em vez de sortear
+        return planned[0]
     photo = _pick_next(album, cfg.get("last_photo_id"))
     message = _pick_next(messages, cfg.get("last_message_id"))
+    if photo and not os.path.exists(photo["path"]):
+        print(f"[Auto Scheduler] Foto não encontrada: {photo['path']}")
+        return None, None
+    return photo, message
+
+def _run_auto_scheduler():
+    cfg = _get_auto_cfg()
+    staged = _take_staged("auto", partial(_auto_fingerprint, dark_mode=cfg.get("dark_mode", False)))
+    if staged:
+        photo, message = staged["photo"], staged["message"]
+    else:
+        photo, message = _pick_auto_pair(cfg)
     if not photo or not message:
         return
     foto_path = photo["path"]
-    if not os.path.exists(foto_path):
-        print(f"[Auto Scheduler] Foto não encontrada: {foto_path}")
-        return
-    print(f"[Auto Scheduler] Foto: {photo['filename']} | Msg: {message['frase_superior']}")
+    print(f"[Auto Scheduler] Foto: {photo.get('original_name') or photo['filename']} | Msg: {message['frase_superior']}"
+          f"{' (pré-render)' if staged else ''}")
+    changes = {}
     try:
-        process_image_generation_from_path(
-            foto_path, message["frase_superior"], message["frase_inferior"],
-            cfg.get("dark_mode", False)
-        )
-        cfg["last_photo_id"] = photo["id"]
-        cfg["last_message_id"] = message["id"]
+        if staged:
+            _publish_staged(staged)
+        else:
+            process_image_generation_from_path(
+                foto_path, message["frase_superior"], message["frase_inferior"],
+                cfg.get("dark_mode", False)
+            )
+        changes = {"last_photo_id": photo["id"], "last_message_id": message["id"]}
     except Exception as e:
         print(f"[Auto Scheduler] Erro: {e}")
-    now = get_now_gmt3()
-    cfg["next_run"] = (now + timedelta(hours=int(cfg.get("interval_hours", 1)))).isoformat()
-    _save_auto_cfg(cfg)
+    # Atualização parcial: não sobrescreve toggles/config feitos durante o render
+    with state.transaction():
+        cfg = _get_auto_cfg()
+        interval = int(cfg.get("interval_hours", 1))
+        changes["next_run"] = (get_now_gmt3() + timedelta(hours=interval)).isoformat()
+        if changes.get("last_photo_id") and cfg.get("upcoming"):
+            changes["upcoming"] = _after_planned(cfg["upcoming"], photo, message)
+        state.auto_cfg.update(**changes)
+
+def _after_planned(upcoming, photo, message):
+    # Par publicado sai do plano, junto com os que ficaram para trás (removidos do álbum)
+    for i, entry in enumerate(upcoming):
+        if entry["photo_id"] == photo["id"] and entry["message_id"] == message["id"]:
+            return upcoming[i + 1:]
+    return upcoming
+
+def _plan_rotation(count):
+    """Os próximos ``count`` pares (foto, mensagem) do auto scheduler, sorteados com as regras de
+    ``_pick_next`` e gravados em ``upcoming`` para o scheduler publicar exatamente essa sequência."""
+    with state.transaction():
+        cfg = _get_auto_cfg()
+        album = [p for p in state.album.all() if os.path.exists(p["path"])]
+        messages = state.messages.all()
+        if not album or not messages:
+            return []
+        pairs = _planned_pairs(cfg)
+        last_photo, last_message = (
+            (pairs[-1][0]["id"], pairs[-1][1]["id"]) if pairs
+            else (cfg.get("last_photo_id"), cfg.get("last_message_id"))
+        )
+        while len(pairs) < count:
+            photo, message = _pick_next(album, last_photo), _pick_next(messages, last_message)
+            pairs.append((photo, message))
+            last_photo, last_message = photo["id"], message["id"]
+        upcoming = [{"photo_id": p["id"], "message_id": m["id"]} for p, m in pairs]
+        if upcoming != (cfg.get("upcoming") or []):
+            state.auto_cfg.update(upcoming=upcoming)
+            scheduler.wake()  # pré-render do "auto" passa a seguir o plano
+    return pairs[:count]
 
 def _cleanup_images():
-    """Remove todos os PNGs da pasta images, exceto o arquivo atual (latest.json)."""
-    latest = ""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE) as f:
-                latest = json.load(f).get("arquivo", "")
-        except Exception:
-            pass
+    """Remove PNGs e framebuffers da pasta images, exceto os frames atuais (latest e perfis dos devices)."""
+    frames = [state.latest.get() or {}, *state.fleet.get()["profiles"].values()]
+    keep = {f["arquivo"].split(".", 1)[0] for f in frames if f.get("arquivo")}
     removed = 0
     for fname in os.listdir(IMAGES_FOLDER):
-        if fname.endswith(".png") and fname != latest and fname != "preview.png":
+        if not fname.endswith((".png", ".bin", ".webp")) or fname == "preview.png":
+            continue
+        if fname.split(".", 1)[0] not in keep:
             try:
                 os.remove(os.path.join(IMAGES_FOLDER, fname))
                 removed += 1
@@ -259,68 +730,278 @@ def _cleanup_images():
                 print(f"[Cleanup] Erro ao remover {fname}: {e}")
     print(f"[Cleanup] {removed} arquivo(s) removido(s) de {IMAGES_FOLDER}")
 
-def scheduler_worker():
-    while True:
+# ---------------------------------------------------------------------------
+# Pré-render (look-ahead em STAGING_FOLDER)
+# ---------------------------------------------------------------------------
+
+# key ("auto" ou "job:<id>") → {"path", "fingerprint", ...}; só a thread do
+# scheduler renderiza/publica, o dict é protegido por state.lock
+_staged = {}
+
+def _render_day():
+    # Mesmo relógio que picture_frame usa para o contador de dias
+    return datetime.now().strftime("%Y-%m-%d")
+
+def _stage_fingerprint(foto_path, frase_superior, frase_inferior, dark_mode):
+    # Tudo que altera o frame final: arquivo da foto, textos, modo e o dia
+    try:
+        st = os.stat(foto_path)
+        sig = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+    return (foto_path, sig, frase_superior, frase_inferior, bool(dark_mode), _render_day())
+
+def _job_fingerprint(job, staged=None):
+    return _stage_fingerprint(job["foto_path"], job["frase_superior"], job["frase_inferior"], job["dark_mode"])
+
+def _auto_fingerprint(staged, dark_mode):
+    # Foto/mensagem removidas ou editadas no álbum invalidam o par escolhido
+    photo = state.album.get(staged["photo"]["id"])
+    message = state.messages.get(staged["message"]["id"])
+    if not photo or not message:
+        return None
+    planned = _planned_pairs(_get_auto_cfg())
+    if planned and (planned[0][0]["id"], planned[0][1]["id"]) != (photo["id"], message["id"]):
+        return None  # par sorteado antes de /api/bundle planejar outro
+    return _stage_fingerprint(photo["path"], message["frase_superior"], message["frase_inferior"], dark_mode)
+
+def _remove_staged_files(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for fname in os.listdir(STAGING_FOLDER):
+        if fname.split(".", 1)[0] == stem:
+            try:
+                os.remove(os.path.join(STAGING_FOLDER, fname))
+            except OSError:
+                pass
+
+def _valid_staged(key, fingerprint_of, pop=False):
+    """Retorna o pré-render de ``key`` se ainda bate com o estado atual; descarta se obsoleto."""
+    with state.lock:
+        staged = _staged.get(key)
+        if staged is None:
+            return None
+        valid = staged["fingerprint"] is not None and staged["fingerprint"] == fingerprint_of(staged)
+        if valid and not pop:
+            return staged
+        del _staged[key]
+    if valid and os.path.exists(staged["path"]):
+        return staged
+    _remove_staged_files(staged["path"])
+    return None
+
+def _take_staged(key, fingerprint_of):
+    return _valid_staged(key, fingerprint_of, pop=True)
+
+def _stage(key, foto_path, frase_superior, frase_inferior, dark_mode, **meta):
+    fingerprint = _stage_fingerprint(foto_path, frase_superior, frase_inferior, dark_mode)
+    if fingerprint is None:
+        return
+    output_path = os.path.join(STAGING_FOLDER, f"{key.replace(':', '_')}.png")
+    _render_cached(output_path, foto_path, frase_superior, frase_inferior, dark_mode)
+    if FRAME_VARIANTS:
+        # Variantes também saem prontas; o delta depende do frame anterior e fica para a publicação
         try:
-            # --- Jobs manuais ---
-            jobs = _read_json(SCHEDULE_FILE, [])
-            if jobs:
-                now_str = get_now_gmt3().strftime("%Y-%m-%dT%H:%M")
-                remaining, executed = [], False
-                for job in jobs:
-                    if job["target_time"] <= now_str:
-                        try:
-                            process_image_generation_from_path(
-                                job["foto_path"], job["frase_superior"],
-                                job["frase_inferior"], job["dark_mode"]
-                            )
-                            executed = True
-                        except Exception as e:
-                            print(f"[Scheduler] Erro no job manual: {e}")
-                    else:
-                        remaining.append(job)
-                if executed:
-                    _write_json(SCHEDULE_FILE, remaining)
+            render_engine.run(variants.encode_variants, output_path, FRAME_VARIANTS)
+        except Exception as e:
+            print(f"[Pré-render] Erro nas variantes de {key}: {e}")
+    source = _source(foto_path, frase_superior, frase_inferior, dark_mode)
+    with state.lock:
+        _staged[key] = dict(meta, path=output_path, fingerprint=fingerprint, source=source)
+    print(f"[Pré-render] {key} pronto em {output_path}")
+
+def _publish_staged(staged):
+    # Só renomeia arquivos já renderizados (mesmo filesystem): publicação em milissegundos
+    now, filename, output_path = _new_output()
+    for panel in EINK_PANELS:
+        src = eink.framebuffer_path(staged["path"], panel, EINK_DITHER)
+        if os.path.exists(src):
+            os.replace(src, eink.framebuffer_path(output_path, panel, EINK_DITHER))
+    for name in FRAME_VARIANTS:
+        src = variants.variant_path(staged["path"], name)
+        if os.path.exists(src):
+            os.replace(src, variants.variant_path(output_path, name))
+    os.replace(staged["path"], output_path)
+    missing = any(not os.path.exists(variants.variant_path(output_path, n)) for n in FRAME_VARIANTS)
+    _encode_frame(output_path, state.latest.get(), encode_variants=missing)
+    data = _publish(now, filename, staged["source"])
+    _preload_frame(data)
+    return data
+
+def _prerender_job(job):
+    _stage(f"job:{job['id']}", job["foto_path"], job["frase_superior"], job["frase_inferior"], job["dark_mode"])
+
+def _prerender_auto():
+    cfg = _get_auto_cfg()
+    if not cfg.get("enabled"):
+        return
+    photo, message = _pick_auto_pair(cfg)
+    if photo and message:
+        _stage("auto", photo["path"], message["frase_superior"], message["frase_inferior"],
+               cfg.get("dark_mode", False), photo=photo, message=message)
+
+def _next_render_day():
+    tomorrow = datetime.now() + timedelta(days=1)
+    return tomorrow.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+def _prerender_entries(jobs, cfg, auto_deadline):
+    entries = []
+    for job in jobs:
+        key = f"job:{job['id']}"
+        if not _valid_staged(key, partial(_job_fingerprint, job)):
+            deadline = _parse_deadline(job.get("target_time")) - PRERENDER_LEAD
+            entries.append((f"prerender:{key}", deadline, partial(_prerender_job, job)))
+    if auto_deadline is not None:
+        fingerprint_of = partial(_auto_fingerprint, dark_mode=cfg.get("dark_mode", False))
+        if not _valid_staged("auto", fingerprint_of):
+            entries.append(("prerender:auto", auto_deadline - PRERENDER_LEAD, _prerender_auto))
+    if _staged:
+        # Virada do dia muda o contador de dias: reavalia (e refaz) os pré-renders
+        entries.append(("prerender:rollover", _next_render_day(), lambda: None))
+    return entries
 
+# ---------------------------------------------------------------------------
+# Scheduler (heap de prazos; acordado pela API em vez de polling)
+# ---------------------------------------------------------------------------
+
+def _parse_deadline(value):
+    # target_time ("%Y-%m-%dT%H:%M", horário local) ou ISO com offset → epoch;
+    # ausente/inválido = vence agora
+    try:
+        dt = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return time.time()
+    if dt.tzinfo is None:
+        dt = pytz.timezone("America/Sao_Paulo").localize(dt)
+    return dt.timestamp()
+
+def _run_manual_job(job):
+    try:
+        staged = _take_staged(f"job:{job['id']}", partial(_job_fingerprint, job))
+        if staged:
+            _publish_staged(staged)
+        else:
+            process_image_generation_from_path(
+                job["foto_path"], job["frase_superior"],
+                job["frase_inferior"], job["dark_mode"]
+            )
+    except Exception as e:
+        print(f"[Scheduler] Erro no job manual: {e}")
+    state.schedule.remove(job["id"])
+    _release_photo(job["foto_path"])  # foto removida do álbum enquanto o job esperava
+
+def _run_auto_job():
+    if _get_auto_cfg().get("enabled"):
+        _run_auto_scheduler()
+
+def _run_cleanup_job():
+    cfg = _get_auto_cfg()
+    if not cfg.get("cleanup_enabled"):
+        return
+    _cleanup_images()
+    with state.transaction():
+        hours = int(_get_auto_cfg().get("cleanup_interval_hours", 24))
+        state.auto_cfg.update(cleanup_next_run=(get_now_gmt3() + timedelta(hours=hours)).isoformat())
+
+def _scheduler_entries():
+    jobs = state.schedule.all()
+    entries = [
+        (f"job:{job['id']}", _parse_deadline(job.get("target_time")), partial(_run_manual_job, job))
+        for job in jobs
+    ]
+    cfg = _get_auto_cfg()
+    auto_deadline = None
+    if cfg.get("enabled"):
+        auto_deadline = _parse_deadline(cfg.get("next_run"))
+        entries.append(("auto", auto_deadline, _run_auto_job))
+    if cfg.get("cleanup_enabled"):
+        entries.append(("cleanup", _parse_deadline(cfg.get("cleanup_next_run")), _run_cleanup_job))
+    if PRERENDER_LEAD > 0:
+        entries += _prerender_entries(jobs, cfg, auto_deadline)
+    return entries
+
+def _apply_catchup_policy():
+    """Trata prazos que venceram com o servidor parado, conforme SCHEDULER_CATCHUP."""
+    if SCHEDULER_CATCHUP == "all":
+        return
+    cutoff = time.time() - SCHEDULER_CATCHUP_GRACE
+    missed = sorted(
+        (j for j in state.schedule.all() if _parse_deadline(j.get("target_time")) < cutoff),
+        key=lambda j: _parse_deadline(j.get("target_time")),
+    )
+    if SCHEDULER_CATCHUP == "latest":
+        missed = missed[:-1]
+    if missed:
+        state.schedule.remove_many([j["id"] for j in missed])
+        print(f"[Scheduler] {len(missed)} job(s) perdido(s) descartado(s) ({SCHEDULER_CATCHUP})")
+    if SCHEDULER_CATCHUP == "skip":
+        with state.transaction():
             cfg = _get_auto_cfg()
             now = get_now_gmt3()
+            changes = {}
+            if cfg.get("enabled") and cfg.get("next_run") and _parse_deadline(cfg["next_run"]) < cutoff:
+                changes["next_run"] = (now + timedelta(hours=int(cfg.get("interval_hours", 1)))).isoformat()
+            if cfg.get("cleanup_enabled") and cfg.get("cleanup_next_run") and _parse_deadline(cfg["cleanup_next_run"]) < cutoff:
+                changes["cleanup_next_run"] = (now + timedelta(hours=int(cfg.get("cleanup_interval_hours", 24)))).isoformat()
+            if changes:
+                state.auto_cfg.update(**changes)
 
-            # --- Auto scheduler ---
-            if cfg.get("enabled"):
-                next_run_str = cfg.get("next_run")
-                should_run = not next_run_str
-                if not should_run:
-                    try:
-                        if now >= datetime.fromisoformat(next_run_str):
-                            should_run = True
-                    except Exception:
-                        should_run = True
-                if should_run:
-                    _run_auto_scheduler()
-                    cfg = _get_auto_cfg()  # recarrega após _run_auto_scheduler salvar
-
-            # --- Limpeza de imagens ---
-            if cfg.get("cleanup_enabled"):
-                cleanup_next_str = cfg.get("cleanup_next_run")
-                should_cleanup = not cleanup_next_str
-                if not should_cleanup:
-                    try:
-                        if now >= datetime.fromisoformat(cleanup_next_str):
-                            should_cleanup = True
-                    except Exception:
-                        should_cleanup = True
-                if should_cleanup:
-                    _cleanup_images()
-                    cfg["cleanup_next_run"] = (
-                        now + timedelta(hours=int(cfg.get("cleanup_interval_hours", 24)))
-                    ).isoformat()
-                    _save_auto_cfg(cfg)
+scheduler = Scheduler(_scheduler_entries)
 
-        except Exception as e:
-            print(f"[Scheduler Worker] Erro: {e}")
-        time.sleep(30)
+# ---------------------------------------------------------------------------
+# Vários workers (líder do scheduler + avisos de mudança de estado)
+# ---------------------------------------------------------------------------
 
-threading.Thread(target=scheduler_worker, daemon=True).start()
+def _remove_orphan_batches():
+    # Jobs de workers que morreram viram "failed"; saídas sem job registrado (lotes
+    # podados ou do layout antigo, batches/<pid>) são removidas
+    failed = batch_runner.fail_orphans()
+    if failed:
+        print(f"[Lotes] {failed} lote(s) interrompido(s) marcado(s) como falho(s)")
+    for entry in os.scandir(BATCH_FOLDER):
+        if batch_runner.known(entry.name):
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def _become_leader():
+    state.refresh()  # o líder anterior pode ter gravado até morrer
+    # Pré-renders são só do líder (_staged em memória): os do líder anterior são órfãos.
+    # Limpeza aqui, e não no import, para um worker que sobe não apagar arquivos em uso
+    shutil.rmtree(STAGING_FOLDER, ignore_errors=True)
+    os.makedirs(STAGING_FOLDER, exist_ok=True)
+    _remove_orphan_batches()
+    thumbnail_executor.submit(_backfill_album_hashes)  # uma vez, no líder; os outros recebem pelo peer_bus
+    _apply_catchup_policy()
+    scheduler.start()
+
+def _republish(notifier, data):
+    # Só acorda long-poll/SSE se a versão mudou de fato
+    if (data or {}).get("versao") != (notifier.current or {}).get("versao"):
+        notifier.publish(data)
+
+def _on_peer_change():
+    # Outro worker gravou estado: relê do disco e acorda quem depende dele. Sem
+    # depender do retorno de refresh(): uma transação deste worker pode ter relido antes
+    with state.lock:  # album_add_photo grava o álbum e o índice sob o mesmo lock
+        state.refresh()
+        photo_index.rebuild(state.album.all())
+    _republish(version_notifier, state.latest.get())
+    profiles = state.fleet.get()["profiles"]
+    for key, notifier in list(profile_notifiers.items()):
+        _republish(notifier, profiles.get(key))
+    scheduler.wake()  # sem efeito fora do líder (thread não iniciada)
+
+peer_bus = cluster.PeerBus(os.path.join(CLUSTER_DIR, "peers"), _on_peer_change)
+peer_bus.start()
+state.on_commit = peer_bus.notify
+leader = cluster.LeaderLock(os.path.join(CLUSTER_DIR, "scheduler.lock"), _become_leader,
+                            retry=SCHEDULER_LEADER_RETRY)
+leader.start()
 
 # ---------------------------------------------------------------------------
 # Autenticação (sessão para web, bearer para device API)
@@ -334,11 +1015,17 @@ def require_login(request: Request):
         raise HTTPException(status_code=307, headers={"Location": "/login"})
 
 def require_bearer(request: Request):
+    # Token global → None (frame principal); token de device → o device (lookup O(1) pelo hash)
     auth = request.headers.get("Authorization", "")
     if not auth.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
-    if auth.replace("Bearer ", "", 1).strip() != API_BEARER_TOKEN:
+    token = auth.replace("Bearer ", "", 1).strip()
+    if token == API_BEARER_TOKEN:
+        return None
+    device = state.devices.find("token_hash", fleet.hash_token(token)) if token else None
+    if device is None:
         raise HTTPException(status_code=401, detail="Invalid token")
+    return device
 
 # ---------------------------------------------------------------------------
 # Pydantic models
@@ -357,6 +1044,28 @@ class AutoSchedulerConfigBody(BaseModel):
 class SendRawBody(BaseModel):
     photo_id: str
 
+class BatchItem(BaseModel):
+    photo_id: str
+    message_id: Optional[str] = None
+    frase_superior: Optional[str] = None
+    frase_inferior: Optional[str] = None
+    dark_mode: bool = False
+    target_time: Optional[str] = None
+    quality: Optional[str] = None
+    layout: Optional[str] = None
+
+class BatchRenderBody(BaseModel):
+    items: list[BatchItem]
+    zip: bool = True
+
+class DeviceBody(BaseModel):
+    name: str
+    width: int = fleet.DEFAULT_SIZE[0]
+    height: int = fleet.DEFAULT_SIZE[1]
+    panel: Optional[str] = None
+    dark_mode: Optional[bool] = None  # None = segue o modo de cada publicação
+    rotation: int = 0
+
 # ---------------------------------------------------------------------------
 # ROTAS WEB
 # ---------------------------------------------------------------------------
@@ -411,34 +1120,39 @@ async def index_post(
     msg = None
     preview_mode = False
     foto_path = ""
+    status_code = 200
 
     # Resolver foto
     if foto and foto.filename:
-        filename = secure_filename(foto.filename)
-        foto_path = os.path.join(UPLOAD_FOLDER, filename)
-        content = await foto.read()
-        with open(foto_path, "wb") as f:
-            f.write(content)
-        cached_foto = filename
-        album_add_photo(foto_path, foto.filename)
+        try:
+            stored = await save_upload(foto, UPLOAD_FOLDER)
+            entry = album_add_photo(stored, foto.filename)
+            foto_path, cached_foto = entry["path"], entry["filename"]
+        except UploadRejected as e:
+            msg = str(e)
+            status_code = e.status_code
     elif album_photo_id:
-        album = _read_json(ALBUM_FILE, [])
-        found = next((p for p in album if p["id"] == album_photo_id), None)
+        found = state.album.get(album_photo_id)
         if found:
             foto_path = found["path"]
             cached_foto = found["filename"]
     elif cached_foto:
-        foto_path = os.path.join(UPLOAD_FOLDER, cached_foto)
+        foto_path = os.path.normpath(os.path.join(UPLOAD_FOLDER, cached_foto))
+        if not foto_path.startswith(UPLOAD_FOLDER + os.sep):
+            foto_path = ""
 
     if not foto_path or not os.path.exists(foto_path):
-        msg = "Por favor, envie uma foto ou selecione uma do álbum."
+        msg = msg or "Por favor, envie uma foto ou selecione uma do álbum."
     elif action == "preview":
         output_path = os.path.join(IMAGES_FOLDER, "preview.png")
         try:
-            picture_frame(foto_path, frase_superior, frase_inferior,
-                          dark_mode=dark_mode, output_path=output_path)
+            # Vai para o cache de render: "instant" com os mesmos dados publica sem renderizar de novo
+            await _render_cached_async(output_path, foto_path, frase_superior, frase_inferior, dark_mode, panels=())
             image_url = "/static/images/preview.png"
             preview_mode = True
+        except (RenderBusy, RenderTimeout) as e:
+            msg = f"Servidor ocupado: {e}"
+            status_code = 503
         except Exception as e:
             msg = f"Erro ao gerar preview: {e}"
     elif action == "schedule" and schedule_time:
@@ -446,16 +1160,22 @@ async def index_post(
         msg = f"Agendado para {schedule_time}!"
     elif action == "instant":
         try:
-            metadata = process_image_generation_from_path(foto_path, frase_superior, frase_inferior, dark_mode)
+            metadata = await process_image_generation_async(foto_path, frase_superior, frase_inferior, dark_mode)
             image_url = f"/static/images/{metadata['arquivo']}"
             msg = "Imagem enviada com sucesso!"
+        except (RenderBusy, RenderTimeout) as e:
+            msg = f"Servidor ocupado: {e}"
+            status_code = 503
         except Exception as e:
             msg = f"Erro ao enviar: {e}"
     elif action == "send_raw":
         try:
-            metadata = process_image_generation_from_path(foto_path, "", "", False, raw=True)
+            metadata = await process_image_generation_async(foto_path, "", "", False, raw=True)
             image_url = f"/static/images/{metadata['arquivo']}"
             msg = "Foto enviada diretamente (sem overlay)!"
+        except (RenderBusy, RenderTimeout) as e:
+            msg = f"Servidor ocupado: {e}"
+            status_code = 503
         except Exception as e:
             msg = f"Erro ao enviar foto direta: {e}"
 
@@ -464,38 +1184,69 @@ async def index_post(
         "frase_superior": frase_superior, "frase_inferior": frase_inferior,
         "dark_mode": dark_mode, "schedule_time": schedule_time, "cached_foto": cached_foto,
         "cache_bust": int(get_now_gmt3().timestamp()),
-    })
+    }, status_code=status_code)
 
 # ---------------------------------------------------------------------------
 # API — Álbum de Fotos (RF01)
 # ---------------------------------------------------------------------------
 
+async def _save_upload_or_http_error(foto):
+    try:
+        return await save_upload(foto, UPLOAD_FOLDER)
+    except UploadRejected as e:
+        raise HTTPException(e.status_code, str(e))
+
 @app.get("/api/album")
-async def api_album_list(request: Request, _=Depends(require_login)):
-    return {"ok": True, "photos": _read_json(ALBUM_FILE, [])}
+async def api_album_list(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    _=Depends(require_login),
+):
+    # Sem cursor/limit: lista completa (compatível com a UI); com eles, página + next_cursor
+    if cursor is None and limit is None:
+        return {"ok": True, "photos": [_with_thumbnails(p) for p in state.album.all()]}
+    photos, next_cursor = _page(state.album, cursor, limit)
+    return {"ok": True, "photos": [_with_thumbnails(p) for p in photos], "next_cursor": next_cursor}
+
+def _with_thumbnails(photo):
+    return dict(photo, thumbnails=_thumbnail_urls(photo))
+
+def _page(source, cursor, limit):
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(400, "cursor inválido")
+    return source.page(cursor, limit or 100)
 
 @app.post("/api/album", status_code=201)
 async def api_album_add(request: Request, foto: UploadFile = File(...), _=Depends(require_login)):
-    filename = secure_filename(foto.filename)
-    foto_path = os.path.join(UPLOAD_FOLDER, filename)
-    content = await foto.read()
-    with open(foto_path, "wb") as f:
-        f.write(content)
-    entry = album_add_photo(foto_path, foto.filename)
+    stored = await _save_upload_or_http_error(foto)
+    entry = album_add_photo(stored, foto.filename)
     return {"ok": True, "photo": entry}
 
+THUMB_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+@app.get("/thumbs/{photo_id}/{size}.webp")
+async def album_thumbnail(photo_id: str, size: int, request: Request, _=Depends(require_login)):
+    photo = state.album.get(photo_id)
+    if not photo or size not in thumbnails.THUMB_SIZES:
+        raise HTTPException(404, "Miniatura não encontrada")
+    version = thumbnails.thumbnail_version(photo["path"], photo.get("sha256"))
+    path = thumbnails.thumbnail_path(THUMBNAILS_FOLDER, version, size) if version else ""
+    if version and not os.path.exists(path) and os.path.exists(photo["path"]):
+        # Backfill preguiçoso: fotos antigas ganham miniatura no primeiro acesso
+        await run_in_threadpool(_generate_thumbnails, photo["path"], version)
+    if not path or not os.path.exists(path):
+        raise HTTPException(404, "Miniatura não encontrada")
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": THUMB_CACHE_CONTROL})
+
 @app.delete("/api/album/{photo_id}")
 async def api_album_delete(photo_id: str, request: Request, _=Depends(require_login)):
-    album = _read_json(ALBUM_FILE, [])
-    entry = next((p for p in album if p["id"] == photo_id), None)
+    entry = state.album.remove(photo_id)
     if not entry:
         raise HTTPException(404, "Foto não encontrada")
-    if os.path.exists(entry["path"]):
-        try:
-            os.remove(entry["path"])
-        except Exception:
-            pass
-    _write_json(ALBUM_FILE, [p for p in album if p["id"] != photo_id])
+    photo_index.remove(photo_id)
+    scheduler.wake()  # invalida pré-render que usava a foto
+    _release_photo(entry["path"])
     return {"ok": True}
 
 # ---------------------------------------------------------------------------
@@ -504,31 +1255,43 @@ async def api_album_delete(photo_id: str, request: Request, _=Depends(require_lo
 
 @app.get("/api/messages")
 async def api_messages_list(request: Request, _=Depends(require_login)):
-    return {"ok": True, "messages": _read_json(MESSAGES_FILE, [])}
+    return {"ok": True, "messages": state.messages.all()}
 
 @app.post("/api/messages", status_code=201)
 async def api_messages_add(body: MessageBody, request: Request, _=Depends(require_login)):
     if not body.frase_superior.strip():
         raise HTTPException(400, "frase_superior é obrigatória")
-    messages = _read_json(MESSAGES_FILE, [])
-    entry = {
+    entry = state.messages.add({
         "id": str(uuid.uuid4()),
         "frase_superior": body.frase_superior.strip(),
         "frase_inferior": body.frase_inferior.strip(),
         "created_at": get_now_gmt3().isoformat(),
-    }
-    messages.append(entry)
-    _write_json(MESSAGES_FILE, messages)
+    })
+    scheduler.wake()
     return {"ok": True, "message": entry}
 
 @app.delete("/api/messages/{message_id}")
 async def api_messages_delete(message_id: str, request: Request, _=Depends(require_login)):
-    messages = _read_json(MESSAGES_FILE, [])
-    if not any(m["id"] == message_id for m in messages):
+    if not state.messages.remove(message_id):
         raise HTTPException(404, "Mensagem não encontrada")
-    _write_json(MESSAGES_FILE, [m for m in messages if m["id"] != message_id])
+    scheduler.wake()
     return {"ok": True}
 
+# ---------------------------------------------------------------------------
+# API — Histórico de renders
+# ---------------------------------------------------------------------------
+
+@app.get("/api/history")
+async def api_history(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    _=Depends(require_login),
+):
+    # Mais recentes primeiro; next_cursor=None na última página
+    items, next_cursor = _page(state.history, cursor, limit)
+    return {"ok": True, "history": items, "next_cursor": next_cursor}
+
 # ---------------------------------------------------------------------------
 # API — Auto Scheduler (RF02 + RF04 + RF07)
 # ---------------------------------------------------------------------------
@@ -539,27 +1302,29 @@ async def api_auto_scheduler_status(request: Request, _=Depends(require_login)):
 
 @app.post("/api/auto-scheduler/toggle")
 async def api_auto_scheduler_toggle(request: Request, _=Depends(require_login)):
-    cfg = _get_auto_cfg()
-    cfg["enabled"] = not cfg.get("enabled", False)
-    if cfg["enabled"] and not cfg.get("next_run"):
-        cfg["next_run"] = get_now_gmt3().isoformat()
-    _save_auto_cfg(cfg)
+    with state.transaction():
+        cfg = _get_auto_cfg()
+        cfg["enabled"] = not cfg.get("enabled", False)
+        if cfg["enabled"] and not cfg.get("next_run"):
+            cfg["next_run"] = get_now_gmt3().isoformat()
+        _save_auto_cfg(cfg)
     return {"ok": True, "enabled": cfg["enabled"]}
 
 @app.post("/api/auto-scheduler/config")
 async def api_auto_scheduler_config(body: AutoSchedulerConfigBody, request: Request, _=Depends(require_login)):
-    cfg = _get_auto_cfg()
-    if body.interval_hours is not None:
-        cfg["interval_hours"] = max(1, body.interval_hours)
-    if body.dark_mode is not None:
-        cfg["dark_mode"] = body.dark_mode
-    if body.cleanup_enabled is not None:
-        cfg["cleanup_enabled"] = body.cleanup_enabled
-        if body.cleanup_enabled and not cfg.get("cleanup_next_run"):
-            cfg["cleanup_next_run"] = get_now_gmt3().isoformat()
-    if body.cleanup_interval_hours is not None:
-        cfg["cleanup_interval_hours"] = max(1, body.cleanup_interval_hours)
-    _save_auto_cfg(cfg)
+    with state.transaction():
+        cfg = _get_auto_cfg()
+        if body.interval_hours is not None:
+            cfg["interval_hours"] = max(1, body.interval_hours)
+        if body.dark_mode is not None:
+            cfg["dark_mode"] = body.dark_mode
+        if body.cleanup_enabled is not None:
+            cfg["cleanup_enabled"] = body.cleanup_enabled
+            if body.cleanup_enabled and not cfg.get("cleanup_next_run"):
+                cfg["cleanup_next_run"] = get_now_gmt3().isoformat()
+        if body.cleanup_interval_hours is not None:
+            cfg["cleanup_interval_hours"] = max(1, body.cleanup_interval_hours)
+        _save_auto_cfg(cfg)
     return {"ok": True, "config": cfg}
 
 # ---------------------------------------------------------------------------
@@ -574,12 +1339,8 @@ async def api_send_raw_upload(
 ):
     foto_path = ""
     if foto and foto.filename:
-        filename = secure_filename(foto.filename)
-        foto_path = os.path.join(UPLOAD_FOLDER, filename)
-        content = await foto.read()
-        with open(foto_path, "wb") as f:
-            f.write(content)
-        album_add_photo(foto_path, foto.filename)
+        stored = await _save_upload_or_http_error(foto)
+        foto_path = album_add_photo(stored, foto.filename)["path"]
 
     if not foto_path:
         # Tenta ler photo_id do corpo JSON
@@ -589,8 +1350,7 @@ async def api_send_raw_upload(
         except Exception:
             photo_id = ""
         if photo_id:
-            album = _read_json(ALBUM_FILE, [])
-            found = next((p for p in album if p["id"] == photo_id), None)
+            found = state.album.get(photo_id)
             if found:
                 foto_path = found["path"]
 
@@ -598,10 +1358,10 @@ async def api_send_raw_upload(
         raise HTTPException(400, "Foto não encontrada")
 
     try:
-        metadata = process_image_generation_from_path(foto_path, "", "", False, raw=True)
+        metadata = await process_image_generation_async(foto_path, "", "", False, raw=True)
         return {"ok": True, "data": metadata}
     except Exception as e:
-        raise HTTPException(500, str(e))
+        raise _render_http_error(e)
 
 # ---------------------------------------------------------------------------
 # API — Geração com overlay
@@ -614,20 +1374,140 @@ async def api_generate(
     frase_superior: str = Form(""),
     frase_inferior: str = Form(""),
     dark_mode: str = Form("false"),
+    quality: str = Form(""),
+    layout: str = Form(""),
     _=Depends(require_login),
 ):
-    filename = secure_filename(foto.filename)
-    foto_path = os.path.join(UPLOAD_FOLDER, filename)
-    content = await foto.read()
-    with open(foto_path, "wb") as f:
-        f.write(content)
+    if quality and quality not in QUALITY_PRESETS:
+        raise HTTPException(400, f"quality deve ser um de: {', '.join(QUALITY_PRESETS)}")
+    if layout and layout not in available_layouts():
+        raise HTTPException(400, f"layout deve ser um de: {', '.join(available_layouts())}")
+    foto_path = (await _save_upload_or_http_error(foto))["path"]
     try:
-        metadata = process_image_generation_from_path(
-            foto_path, frase_superior, frase_inferior, dark_mode.lower() == "true"
+        metadata = await process_image_generation_async(
+            foto_path, frase_superior, frase_inferior, dark_mode.lower() == "true",
+            quality=quality or None, layout=layout or None,
         )
         return {"ok": True, "versao": metadata["versao"], "data": metadata}
     except Exception as e:
-        raise HTTPException(500, str(e))
+        raise _render_http_error(e)
+
+@app.get("/api/layouts")
+async def api_layouts(request: Request, _=Depends(require_login)):
+    return {"ok": True, "layouts": available_layouts()}
+
+# ---------------------------------------------------------------------------
+# API — Render em lote
+# ---------------------------------------------------------------------------
+
+def _batch_task(index, item):
+    photo = state.album.get(item.photo_id)
+    if not photo:
+        raise HTTPException(400, f"items[{index}]: foto não encontrada")
+    if item.message_id:
+        message = state.messages.get(item.message_id)
+        if not message:
+            raise HTTPException(400, f"items[{index}]: mensagem não encontrada")
+        frase_superior, frase_inferior = message["frase_superior"], message["frase_inferior"]
+    else:
+        frase_superior, frase_inferior = item.frase_superior or "", item.frase_inferior or ""
+    if item.quality and item.quality not in QUALITY_PRESETS:
+        raise HTTPException(400, f"items[{index}]: quality deve ser um de: {', '.join(QUALITY_PRESETS)}")
+    if item.layout and item.layout not in available_layouts():
+        raise HTTPException(400, f"items[{index}]: layout deve ser um de: {', '.join(available_layouts())}")
+    if item.target_time:
+        try:
+            datetime.fromisoformat(item.target_time)
+        except ValueError:
+            raise HTTPException(400, f"items[{index}]: target_time inválido")
+    return {
+        "foto_path": photo["path"],
+        "frase_superior": frase_superior,
+        "frase_inferior": frase_inferior,
+        "dark_mode": item.dark_mode,
+        "quality": item.quality or None,
+        "layout": item.layout or None,
+        "target_time": item.target_time,
+    }
+
+@app.post("/api/render/batch", status_code=202)
+async def api_render_batch(body: BatchRenderBody, request: Request, _=Depends(require_login)):
+    """Itens com target_time viram agendamentos (pré-renderizados); os demais são renderizados já."""
+    if not body.items:
+        raise HTTPException(400, "items vazio")
+    if len(body.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(400, f"Máximo de {BATCH_MAX_ITEMS} itens por lote")
+    tasks = [_batch_task(i, item) for i, item in enumerate(body.items)]
+    scheduled = [t for t in tasks if t["target_time"]]
+    for t in scheduled:
+        save_schedule(t["foto_path"], t["frase_superior"], t["frase_inferior"], t["dark_mode"], t["target_time"])
+    job = batch_runner.submit([t for t in tasks if not t["target_time"]], make_zip=body.zip,
+                              scheduled=len(scheduled))
+    return {"ok": True, "job": job}
+
+@app.get("/api/render/cache")
+async def api_render_cache(request: Request, _=Depends(require_login)):
+    return {"ok": True, "cache": render_cache.stats()}
+
+@app.get("/api/render/batch/{job_id}")
+async def api_render_batch_status(job_id: str, request: Request, _=Depends(require_login)):
+    # O job pode rodar em outro worker: relê o estado sem esperar o aviso do peer_bus
+    state.refresh()
+    job = batch_runner.get(job_id)
+    if not job:
+        raise HTTPException(404, "Lote não encontrado")
+    return {"ok": True, "job": job}
+
+@app.get("/api/render/batch/{job_id}/zip")
+async def api_render_batch_zip(job_id: str, request: Request, _=Depends(require_login)):
+    state.refresh()
+    job = batch_runner.get(job_id)
+    if not job or not job["zip"]:
+        raise HTTPException(404, "Lote não encontrado")
+    if job["finished_at"] is None:
+        raise HTTPException(409, "Lote ainda em andamento")
+    if not os.path.exists(batch_runner.zip_path(job_id)):
+        raise HTTPException(410, "Lote interrompido antes de gerar o zip")
+    return FileResponse(batch_runner.zip_path(job_id), media_type="application/zip",
+                        filename=f"lote-{job_id}.zip")
+
+# ---------------------------------------------------------------------------
+# API — Devices (frota)
+# ---------------------------------------------------------------------------
+
+def _public_device(device):
+    return {k: v for k, v in device.items() if k != "token_hash"}
+
+@app.get("/api/devices")
+async def api_devices_list(request: Request, _=Depends(require_login)):
+    return {"ok": True, "devices": [_public_device(d) for d in state.devices.all()]}
+
+@app.post("/api/devices", status_code=201)
+async def api_devices_add(body: DeviceBody, request: Request, _=Depends(require_login)):
+    error = fleet.validate_device(body.width, body.height, body.rotation, body.panel, eink.PANELS)
+    if error:
+        raise HTTPException(400, error)
+    token = fleet.new_token()
+    device = state.devices.add({
+        "id": str(uuid.uuid4()),
+        "name": body.name.strip() or "device",
+        "token_hash": fleet.hash_token(token),
+        "width": body.width,
+        "height": body.height,
+        "panel": body.panel,
+        "dark_mode": body.dark_mode,
+        "rotation": body.rotation,
+        "created_at": get_now_gmt3().isoformat(),
+    })
+    _ensure_device_frame(device)
+    # O token só é mostrado aqui; no estado fica apenas o hash
+    return {"ok": True, "device": _public_device(device), "token": token}
+
+@app.delete("/api/devices/{device_id}")
+async def api_devices_delete(device_id: str, request: Request, _=Depends(require_login)):
+    if not state.devices.remove(device_id):
+        raise HTTPException(404, "Device não encontrado")
+    return {"ok": True}
 
 # ---------------------------------------------------------------------------
 # Imagem atual para o frontend (sessão, sem bearer)
@@ -635,10 +1515,9 @@ async def api_generate(
 
 @app.get("/current-image")
 async def current_image(request: Request, _=Depends(require_login)):
-    if not os.path.exists(DATA_FILE):
+    data = state.latest.get()
+    if not data:
         raise HTTPException(404, "Nenhuma imagem disponível")
-    with open(DATA_FILE) as f:
-        data = json.load(f)
     filepath = os.path.join(IMAGES_FOLDER, data["arquivo"])
     if not os.path.exists(filepath):
         raise HTTPException(404, "Arquivo não encontrado")
@@ -646,35 +1525,403 @@ async def current_image(request: Request, _=Depends(require_login)):
 
 @app.get("/current-status")
 async def current_status(request: Request, _=Depends(require_login)):
-    if not os.path.exists(DATA_FILE):
+    data = state.latest.get()
+    if not data:
         return {"disponivel": False}
-    with open(DATA_FILE) as f:
-        data = json.load(f)
     return {"disponivel": True, **data}
 
 # ---------------------------------------------------------------------------
-# API — Status e Imagem (RF08 — inalteradas)
+# Cache HTTP (ETag / Last-Modified / 304) para o device
+# ---------------------------------------------------------------------------
+
+DEVICE_CACHE_CONTROL = "no-cache"  # sempre revalida, mas 304 não reenvia o corpo
+
+def _is_not_modified_etag(if_none_match, etag):
+    tags = [t.strip().removeprefix("W/") for t in (if_none_match or "").split(",")]
+    return "*" in tags or etag in tags
+
+def _is_not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match tem precedência sobre If-Modified-Since (RFC 9110)
+        return _is_not_modified_etag(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _cache_headers(etag, last_modified):
+    return {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": DEVICE_CACHE_CONTROL}
+
+# ---------------------------------------------------------------------------
+# Métricas (Prometheus)
+# ---------------------------------------------------------------------------
+
+@metrics.registry.collector
+def _app_metrics():
+    engine = render_engine.stats()
+    cache = render_cache.stats()
+    sched = scheduler.stats()
+    hot = hot_frames.stats()
+    return [
+        ("render_queue_pending", "Jobs no render engine (rodando + na fila)", "gauge", [({}, engine["pending"])]),
+        ("render_queue_capacity", "Capacidade do render engine", "gauge", [({}, engine["capacity"])]),
+        ("render_rejected_total", "Jobs recusados com a fila cheia (503)", "counter", [({}, engine["rejected"])]),
+        ("render_timeouts_total", "Jobs que estouraram RENDER_TIMEOUT", "counter", [({}, engine["timeouts"])]),
+        ("render_cache_requests_total", "Consultas ao cache de render", "counter",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("render_cache_evictions_total", "Entradas removidas do cache de render (LRU)", "counter",
+         [({}, cache["evictions"])]),
+        ("render_cache_bytes", "Tamanho do cache de render em disco", "gauge", [({}, cache["bytes"])]),
+        ("render_cache_entries", "Frames no cache de render", "gauge", [({}, cache["entries"])]),
+        ("hot_frame_requests_total", "Leituras de frames publicados pela memória", "counter",
+         [({"result": "hit"}, hot["hits"]), ({"result": "miss"}, hot["misses"])]),
+        ("hot_frame_bytes", "Bytes de frames publicados em memória", "gauge", [({}, hot["bytes"])]),
+        ("scheduler_pending_jobs", "Prazos no heap do scheduler", "gauge", [({}, sched["pending"])]),
+        ("scheduler_leader", "1 se este worker roda o scheduler", "gauge", [({}, int(leader.is_leader))]),
+        ("peer_notifications_total", "Avisos de mudança de estado entre workers", "counter",
+         [({"direction": "sent"}, peer_bus.sent), ({"direction": "received"}, peer_bus.received)]),
+        ("scheduler_next_deadline_seconds", "Próximo prazo (epoch)", "gauge",
+         [({}, sched["next_deadline"])] if sched["next_deadline"] else []),
+        ("device_waiters", "Conexões long-poll/SSE esperando nova versão", "gauge",
+         [({}, version_notifier.waiting + sum(n.waiting for n in list(profile_notifiers.values())))]),
+    ]
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    if METRICS_TOKEN and request.headers.get("Authorization", "") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return Response(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ---------------------------------------------------------------------------
+# API — Status e Imagem (RF08 — corpos inalterados)
 # ---------------------------------------------------------------------------
 
 @app.get("/api/status")
-async def api_status(request: Request, _=Depends(require_bearer)):
-    if not os.path.exists(DATA_FILE):
+async def api_status(request: Request, device=Depends(require_bearer)):
+    data, mtime, _ = _device_frame(device)
+    if not data:
         return {"disponivel": False}
     try:
-        with open(DATA_FILE) as f:
-            data = json.load(f)
-        return {"disponivel": True, **data}
+        response = JSONResponse({"disponivel": True, **data})
+        digest = hashlib.sha256(response.body).hexdigest()
+        etag = f'"{data.get("versao", "")}-{digest[:16]}"'
+        headers = _cache_headers(etag, formatdate(int(mtime), usegmt=True))
+        if _is_not_modified(request, etag, mtime):
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+        return response
     except Exception as e:
         return {"disponivel": False, "error": str(e)}
 
+@app.get("/api/status/wait")
+async def api_status_wait(
+    request: Request,
+    since: str = "",
+    timeout: float = 30,
+    device=Depends(require_bearer),
+):
+    # Long-poll: responde assim que a versão for diferente de `since` (304 no timeout)
+    data = await _device_frame(device)[2].wait(since, max(0.0, min(timeout, LONGPOLL_MAX_TIMEOUT)))
+    if data is None:
+        return Response(status_code=304, headers={"Cache-Control": "no-store"})
+    return JSONResponse({"disponivel": True, **data}, headers={"Cache-Control": "no-store"})
+
+@app.get("/api/events")
+async def api_events(request: Request, since: str = "", device=Depends(require_bearer)):
+    # Server-Sent Events: um evento "version" por nova imagem, comentário de keep-alive no ocioso
+    async def stream():
+        last = request.headers.get("last-event-id") or since
+        while not await request.is_disconnected():
+            # Perfil reavaliado a cada volta (device que segue o dark mode muda de perfil)
+            data = await _device_frame(device)[2].wait(last, SSE_KEEPALIVE)
+            if data is None:
+                yield ": keep-alive\n\n"
+                continue
+            last = data.get("versao", "")
+            payload = json.dumps({"disponivel": True, **data}, ensure_ascii=False)
+            yield f"id: {last}\nevent: version\ndata: {payload}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.get("/api/image")
-async def api_image(request: Request, _=Depends(require_bearer)):
-    if not os.path.exists(DATA_FILE):
+async def api_image(
+    request: Request,
+    fmt: str = Query("png", alias="format"),
+    panel: str = "",
+    dither: str = "",
+    device=Depends(require_bearer),
+):
+    data = _device_frame(device)[0]
+    if not data:
         raise HTTPException(404, "Nenhuma imagem disponível")
+    if fmt == "raw":
+        panel = panel or (device or {}).get("panel") or "bw"
+        return await _api_image_raw(request, data, panel, dither or EINK_DITHER)
+    filepath = os.path.join(IMAGES_FOLDER, data["arquivo"])
+    if fmt in variants.VARIANTS:
+        path = variants.variant_path(filepath, fmt)
+        try:
+            blob = await _hot_blob(path, data["versao"], variants.VARIANTS[fmt][1])
+        except OSError:
+            # Variante fora de FRAME_VARIANTS (ou que falhou na publicação): gera agora e guarda
+            if not os.path.exists(filepath):
+                raise HTTPException(404, "Arquivo não encontrado")
+            try:
+                await render_engine.run_async(variants.encode_variants, filepath, [fmt])
+            except Exception as e:
+                raise _render_http_error(e)
+            blob = await _hot_blob(path, data["versao"], variants.VARIANTS[fmt][1])
+        return _blob_response(request, blob, path)
+    if fmt != "png":
+        raise HTTPException(400, f"format deve ser um de: png, {', '.join(variants.VARIANTS)}, raw")
     try:
-        with open(DATA_FILE) as f:
-            data = json.load(f)
-        filepath = os.path.join(IMAGES_FOLDER, data["arquivo"])
-        return FileResponse(filepath, media_type="image/png")
+        # Formato padrão: o PNG publicado, byte a byte, servido da memória
+        blob = await _hot_blob(filepath, data["versao"], "image/png")
+        return _blob_response(request, blob, filepath)
     except Exception as e:
         raise HTTPException(500, str(e))
+
+async def _hot_blob(path, versao, media_type):
+    blob = hot_frames.peek(path, versao)
+    if blob is None:
+        blob = await run_in_threadpool(hot_frames.load, path, versao, media_type)
+    return blob
+
+def _blob_response(request, blob, path, extra_headers=None):
+    headers = _cache_headers(blob.etag, blob.last_modified)
+    if _is_not_modified(request, blob.etag, blob.mtime):
+        return Response(status_code=304, headers=headers)
+    headers.update(extra_headers or {})
+    if request.headers.get("range"):
+        # Pedidos parciais (raros) ficam com o FileResponse, que já trata Range
+        return FileResponse(path, media_type=blob.media_type, headers=headers)
+    return Response(blob.body, media_type=blob.media_type, headers={**headers, "Accept-Ranges": "bytes"})
+
+@app.get("/api/image/delta")
+async def api_image_delta(
+    request: Request,
+    base: str = Query("", alias="from"),
+    panel: str = "",
+    dither: str = "",
+    device=Depends(require_bearer),
+):
+    # Refresh parcial: retângulos sujos desde a versão ``from`` (formato em delta.py);
+    # base desconhecida ou diff grande demais → framebuffer inteiro (X-Frame: full)
+    data = _device_frame(device)[0]
+    if not data:
+        raise HTTPException(404, "Nenhuma imagem disponível")
+    panel = panel or (device or {}).get("panel") or "bw"
+    dither = dither or EINK_DITHER
+    if panel not in eink.PANELS or dither not in eink.DITHERS:
+        raise HTTPException(400, f"panel deve ser um de {', '.join(eink.PANELS)}; dither um de {', '.join(eink.DITHERS)}")
+    if base and base == data["versao"]:
+        return Response(status_code=304, headers={"Cache-Control": "no-store", "X-Versao": base})
+    filepath = os.path.join(IMAGES_FOLDER, data["arquivo"])
+    delta_file = delta.delta_path(filepath, panel, dither)
+    try:
+        blob = await _hot_blob(delta_file, data["versao"], "application/octet-stream") if base else None
+    except OSError:
+        blob = None  # diff grande demais ou frame sem anterior
+    if blob is not None and delta.base_version(blob.body) == base:
+        width, height = (await _hot_blob(filepath, data["versao"], "image/png")).image_size()
+        return Response(blob.body, media_type="application/octet-stream", headers={
+            "Cache-Control": "no-store",
+            "X-Frame": "delta",
+            "X-Versao": data.get("versao", ""),
+            "X-Base-Versao": base,
+            "X-Panel": panel,
+            "X-Panel-Width": str(width),
+            "X-Panel-Height": str(height),
+            "X-Bits-Per-Pixel": str(eink.PANELS[panel]["bits"]),
+        })
+    response = await _api_image_raw(request, data, panel, dither)
+    response.headers["X-Frame"] = "full"
+    return response
+
+async def _api_image_raw(request, data, panel, dither):
+    # Framebuffer empacotado pronto para o painel (ex.: 48000 bytes para bw 800x480)
+    if panel not in eink.PANELS or dither not in eink.DITHERS:
+        raise HTTPException(400, f"panel deve ser um de {', '.join(eink.PANELS)}; dither um de {', '.join(eink.DITHERS)}")
+    filepath = os.path.join(IMAGES_FOLDER, data["arquivo"])
+    fb_path = eink.framebuffer_path(filepath, panel, dither)
+    try:
+        frame = await _hot_blob(filepath, data["versao"], "image/png")
+    except OSError:
+        raise HTTPException(404, "Arquivo não encontrado")
+    try:
+        blob = await _hot_blob(fb_path, data["versao"], "application/octet-stream")
+    except OSError:
+        try:
+            await render_engine.run_async(eink.write_framebuffer, filepath, fb_path, panel, dither)
+        except Exception as e:
+            raise _render_http_error(e)
+        blob = await _hot_blob(fb_path, data["versao"], "application/octet-stream")
+    width, height = frame.image_size()
+    return _blob_response(request, blob, fb_path, {
+        "X-Versao": data.get("versao", ""),
+        "X-Panel": panel,
+        "X-Panel-Width": str(width),
+        "X-Panel-Height": str(height),
+        "X-Bits-Per-Pixel": str(eink.PANELS[panel]["bits"]),
+    })
+
+# ---------------------------------------------------------------------------
+# API — Playlist offline (próximos frames da rotação num download só)
+# ---------------------------------------------------------------------------
+
+def _bundle_timeline(count):
+    """[(epoch de exibição, tipo, entradas do render)] das próximas ``count`` trocas de frame."""
+    cfg = _get_auto_cfg()
+    now = time.time()
+    interval = int(cfg.get("interval_hours", 1)) * 3600
+    start = max(_parse_deadline(cfg.get("next_run")), now)
+    timeline = [
+        (start + i * interval, "auto",
+         _source(photo["path"], message["frase_superior"], message["frase_inferior"], cfg.get("dark_mode", False)))
+        for i, (photo, message) in enumerate(_plan_rotation(count))
+    ]
+    # Jobs manuais publicam no meio da rotação (e consomem uma versão)
+    end = timeline[-1][0] if timeline else now
+    for job in state.schedule.all():
+        at = max(_parse_deadline(job.get("target_time")), now)
+        if at <= end:
+            timeline.append((at, "job", _source(job["foto_path"], job["frase_superior"], job["frase_inferior"],
+                                                job["dark_mode"])))
+    timeline.sort(key=lambda t: t[0])
+    return timeline[:count]
+
+def _bundle_items(timeline, device):
+    # Mesma chave que a publicação vai calcular no dia da exibição: um lado reaproveita o render do outro
+    items = []
+    for at, kind, source in timeline:
+        profile = fleet.profile_of(device or {}, source)
+        size = (profile["width"], profile["height"])
+        day = datetime.fromtimestamp(at).strftime("%Y-%m-%d")  # mesmo relógio do contador de dias
+        key = render_key(source["foto_path"], source["frase_superior"], source["frase_inferior"],
+                         profile["dark_mode"], profile["raw"], size=size, rotation=profile["rotation"], dia=day)
+        items.append({"at": at, "kind": kind, "source": source, "profile": profile, "day": day, "key": key})
+    return items
+
+def _build_bundle_frames(items, panel, dither):
+    """Renderiza o que falta (bundle → cache de render → render engine); {chave: caminho} dos prontos."""
+    panels = sorted(set(EINK_PANELS) | ({panel} if panel else set()))
+    ready, futures = {}, {}
+    for item in items:
+        key = item["key"]
+        if key is None or key in ready or key in futures.values():
+            continue
+        png = bundle.frame_path(BUNDLE_FOLDER, key)
+        path = bundle.frame_path(BUNDLE_FOLDER, key, panel, dither)
+        if not os.path.exists(png):
+            render_cache.fetch(key, png, panels, dither)
+        if os.path.exists(path):
+            os.utime(path)
+            ready[key] = path
+            continue
+        try:
+            if os.path.exists(png):
+                # PNG pronto, falta só o framebuffer deste painel
+                future = render_engine.submit(eink.write_framebuffer, png, path, panel, dither, block=True)
+            else:
+                source, profile = item["source"], item["profile"]
+                future = render_engine.submit(
+                    render_to_file, source["foto_path"], source["frase_superior"], source["frase_inferior"],
+                    profile["dark_mode"], png, profile["raw"], panels=panels, dither=dither,
+                    size=(profile["width"], profile["height"]), rotation=profile["rotation"], dia=item["day"],
+                    block=True,
+                )
+        except Exception as e:
+            print(f"[Bundle] Erro ao enfileirar {key[:12]}: {e}")
+            continue
+        futures[future] = key
+    for future in as_completed(futures):
+        key = futures[future]
+        try:
+            future.result()
+        except Exception as e:
+            print(f"[Bundle] Erro ao renderizar {key[:12]}: {e}")
+            continue
+        png = bundle.frame_path(BUNDLE_FOLDER, key)
+        render_cache.store(key, png, panels, dither)
+        ready[key] = bundle.frame_path(BUNDLE_FOLDER, key, panel, dither)
+    return ready
+
+def _bundle_manifest(items, current, fmt, panel, dither):
+    # Versões previstas com a mesma regra da publicação, a partir do frame atual do device
+    tz = pytz.timezone("America/Sao_Paulo")
+    versao = (current or {}).get("versao", "")
+    ext = ".bin" if panel else ".png"
+    frames = []
+    for i, item in enumerate(items):
+        when = datetime.fromtimestamp(item["at"], tz)
+        versao = _version_after(versao, when.strftime("%Y-%m-%d"))
+        frames.append({
+            "dia": when.strftime("%Y-%m-%d"), "horario": when.strftime("%H:%M:%S"), "versao": versao,
+            "arquivo": f"{i:03d}-{versao}{ext}", "display_at": when.isoformat(timespec="seconds"), "tipo": item["kind"],
+            "key": item["key"],
+        })
+    profile = items[0]["profile"] if items else fleet.profile_of({}, {})
+    width, height = profile["width"], profile["height"]
+    if profile["rotation"] in (90, 270):
+        width, height = height, width  # framebuffer na orientação nativa do painel
+    manifest = {"versao_atual": (current or {}).get("versao"), "format": fmt, "width": width, "height": height,
+                "frames": frames}
+    if panel:
+        manifest.update(panel=panel, dither=dither, bits_per_pixel=eink.PANELS[panel]["bits"])
+    return manifest
+
+def _make_bundle(count, device, fmt, panel, dither, if_none_match):
+    """(corpo do zip ou None se o device já tem este bundle, ETag)."""
+    current = _device_frame(device)[0]
+    items = _bundle_items(_bundle_timeline(count), device)
+    manifest = _bundle_manifest(items, current, fmt, panel, dither)
+    # flock: duas montagens (de qualquer worker) não renderizam no mesmo arquivo
+    with cluster.file_lock(os.path.join(CLUSTER_DIR, "bundle.lock")):
+        ready = _build_bundle_frames(items, panel, dither)
+        # Frame que falhou fica de fora (e muda o ETag: o próximo download tenta de novo)
+        pairs = [(item, frame) for item, frame in zip(items, manifest["frames"]) if item["key"] in ready]
+        manifest["frames"] = [frame for _, frame in pairs]
+        digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+        etag = f'"bundle-{digest[:16]}"'
+        if _is_not_modified_etag(if_none_match, etag):
+            return None, etag
+        body = bundle.build_archive(manifest, {frame["arquivo"]: ready[item["key"]] for item, frame in pairs})
+        bundle.prune(BUNDLE_FOLDER, {i["key"] for i in items if i["key"]})
+    return body, etag
+
+@app.get("/api/bundle")
+async def api_bundle(
+    request: Request,
+    count: int = 24,
+    fmt: str = Query("png", alias="format"),
+    panel: str = "",
+    dither: str = "",
+    device=Depends(require_bearer),
+):
+    # Próximos ``count`` frames do auto scheduler (com os jobs manuais no meio) num zip com
+    # manifest.json: o device baixa uma vez e troca de frame sozinho nos horários do manifest
+    if not 1 <= count <= BUNDLE_MAX_COUNT:
+        raise HTTPException(400, f"count deve estar entre 1 e {BUNDLE_MAX_COUNT}")
+    if fmt not in ("png", "raw"):
+        raise HTTPException(400, "format deve ser png ou raw")
+    if not _get_auto_cfg().get("enabled"):
+        raise HTTPException(409, "Auto scheduler desativado: não há rotação para antecipar")
+    panel = (panel or (device or {}).get("panel") or "bw") if fmt == "raw" else None
+    dither = dither or EINK_DITHER
+    if panel and (panel not in eink.PANELS or dither not in eink.DITHERS):
+        raise HTTPException(400, f"panel deve ser um de {', '.join(eink.PANELS)}; dither um de {', '.join(eink.DITHERS)}")
+    body, etag = await run_in_threadpool(
+        _make_bundle, count, device, fmt, panel, dither, request.headers.get("if-none-match"),
+    )
+    headers = {"ETag": etag, "Cache-Control": DEVICE_CACHE_CONTROL}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = 'attachment; filename="bundle.zip"'
+    return Response(body, media_type="application/zip", headers=headers)
@@ -0,0 +1,189 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+
+from picture import render_to_file
+from render_cache import render_key
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class BatchRunner:
+    """Jobs de render em lote com progresso no estado compartilhado.
+
+    Cada job roda numa thread própria do worker que o recebeu, distribuindo
+    as renderizações no render engine com no máximo ``max_in_flight`` em
+    andamento (o resto da fila fica livre para requisições interativas). O
+    registro (status, contagens, erros, saídas) fica em ``jobs`` (coleção do
+    state store, ex.: ``state.batch_jobs``) e os PNGs em
+    ``output_dir/<job_id>/`` (mais ``<job_id>.zip`` ao lado, se pedido): com
+    vários workers do uvicorn, qualquer um responde progresso e download.
+    Só os ``keep`` jobs mais recentes são mantidos. Com ``cache``
+    (RenderCache), frames já renderizados não voltam para a fila.
+    """
+
+    def __init__(self, engine, output_dir, jobs, max_in_flight=2, keep=20, cache=None):
+        self.engine = engine
+        self.cache = cache
+        self.output_dir = output_dir
+        self.jobs = jobs
+        self.max_in_flight = max(1, max_in_flight)
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._running = {}  # job_id → registro em memória (só o worker dono grava)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job and self._orphaned(job):
+            job.update(self._interrupted(job), finished_at=job["created_at"])
+        return job
+
+    def _orphaned(self, job):
+        # Job que ficou em andamento num worker que morreu (ou neste, antes de reiniciar)
+        if job["finished_at"] is not None:
+            return False
+        if job["owner"] == os.getpid():
+            with self._lock:
+                return job["id"] not in self._running
+        return not _pid_alive(job["owner"])
+
+    @staticmethod
+    def _interrupted(job):
+        error = {"index": None, "error": "O worker que rodava o lote parou antes de terminar"}
+        return {"status": "failed", "errors": job["errors"] + [error]}
+
+    def fail_orphans(self):
+        """Grava como falhos os jobs de workers mortos (ex.: ao assumir a liderança)."""
+        orphans = [job for job in self.jobs.all() if self._orphaned(job)]
+        for job in orphans:
+            self.jobs.update(job["id"], **self._interrupted(job), finished_at=time.time())
+        return len(orphans)
+
+    def known(self, name):
+        """``name`` (arquivo/diretório em ``output_dir``) pertence a um job registrado?"""
+        return self.jobs.get(name.split(".", 1)[0]) is not None
+
+    def zip_path(self, job_id):
+        return os.path.join(self.output_dir, f"{job_id}.zip")
+
+    def submit(self, tasks, make_zip=True, scheduled=0):
+        """``tasks``: dicts com foto_path, frase_superior, frase_inferior, dark_mode, quality, layout."""
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued" if tasks else "done",
+            "total": len(tasks),
+            "done": 0,
+            "failed": 0,
+            "scheduled": scheduled,
+            "errors": [],
+            "outputs": [],
+            "zip": make_zip and bool(tasks),
+            "owner": os.getpid(),
+            "created_at": time.time(),
+            "finished_at": None if tasks else time.time(),
+        }
+        if tasks:
+            with self._lock:
+                self._running[job_id] = job
+        self.jobs.add(job)
+        self._prune()
+        if tasks:
+            threading.Thread(target=self._run, args=(job_id, tasks, make_zip), daemon=True).start()
+        return self.get(job_id)
+
+    def _update(self, job_id, change):
+        # Sob o lock: callbacks de threads diferentes do mesmo job não perdem contagem
+        # nem gravam fora de ordem
+        with self._lock:
+            job = self._running[job_id]
+            change(job)
+            self.jobs.update(job_id, **{k: job[k] for k in ("status", "done", "failed", "errors", "outputs",
+                                                            "finished_at")})
+
+    def _run(self, job_id, tasks, make_zip):
+        job_dir = os.path.join(self.output_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        self._update(job_id, lambda j: j.update(status="running"))
+        slots = threading.Semaphore(self.max_in_flight)
+
+        def finished(output_path):
+            self._update(job_id, lambda j: j.update(
+                done=j["done"] + 1, outputs=j["outputs"] + [os.path.basename(output_path)]))
+
+        def failed(index, error):
+            self._update(job_id, lambda j: j.update(
+                failed=j["failed"] + 1, errors=j["errors"] + [{"index": index, "error": str(error)}]))
+
+        def on_done(index, output_path, key, future):
+            # A vaga só volta depois de contabilizar: o fim do job espera todas as vagas
+            try:
+                future.result()
+            except Exception as e:
+                failed(index, e)
+            else:
+                if self.cache:
+                    self.cache.store(key, output_path)
+                finished(output_path)
+            finally:
+                slots.release()
+
+        for index, task in enumerate(tasks):
+            output_path = os.path.join(job_dir, f"{index:04d}.png")
+            key = None
+            if self.cache:
+                key = render_key(task["foto_path"], task["frase_superior"], task["frase_inferior"],
+                                 task["dark_mode"], quality=task.get("quality"), layout=task.get("layout"))
+                if self.cache.fetch(key, output_path):
+                    finished(output_path)
+                    continue
+            slots.acquire()
+            try:
+                future = self.engine.submit(
+                    render_to_file, task["foto_path"], task["frase_superior"], task["frase_inferior"],
+                    task["dark_mode"], output_path, False, task.get("quality"), layout=task.get("layout"), block=True,
+                )
+            except Exception as e:
+                slots.release()
+                failed(index, e)
+                continue
+            future.add_done_callback(lambda f, i=index, p=output_path, k=key: on_done(i, p, k, f))
+        # wait() nos futures voltaria antes dos callbacks rodarem (contagem e saídas incompletas)
+        for _ in range(self.max_in_flight):
+            slots.acquire()
+
+        if make_zip:
+            # PNG já é comprimido: ZIP_STORED evita gastar CPU à toa
+            tmp = f"{self.zip_path(job_id)}.tmp"
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+                for name in sorted(self._running[job_id]["outputs"]):
+                    zf.write(os.path.join(job_dir, name), name)
+            os.replace(tmp, self.zip_path(job_id))
+        self._update(job_id, lambda j: j.update(
+            outputs=sorted(j["outputs"]), status="failed" if j["failed"] and not j["done"] else "done",
+            finished_at=time.time()))
+        with self._lock:
+            del self._running[job_id]
+
+    def _prune(self):
+        jobs = self.jobs.all()
+        finished = sorted((j for j in jobs if j["finished_at"] is not None), key=lambda j: j["created_at"])
+        expired = finished[:max(0, len(jobs) - self.keep)]
+        for job in self.jobs.remove_many([j["id"] for j in expired]):
+            shutil.rmtree(os.path.join(self.output_dir, job["id"]), ignore_errors=True)
+            try:
+                os.remove(self.zip_path(job["id"]))
+            except OSError:
+                pass
@@ -0,0 +1 @@
+# Benchmarks do pipeline de render e da API dos devices (python -m bench.run)
@@ -0,0 +1,119 @@
+import os
+import sys
+import shutil
+import time
+import asyncio
+import tempfile
+
+from bench.render import summarize
+
+# Carga em /api/status e /api/image com o app no mesmo processo (httpx +
+# ASGITransport, sem rede), enquanto /api/generate mantém o render engine
+# ocupado em segundo plano. O app usa caminhos relativos: roda num diretório
+# temporário com links para templates, fontes e layouts do repo.
+TOKEN = "bench-token"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINKED = ("templates", "fonts", "assets", "layouts")
+
+
+def _prepare_workdir():
+    workdir = tempfile.mkdtemp(prefix="bench-api-")
+    for name in _LINKED:
+        if os.path.exists(os.path.join(ROOT, name)):
+            os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    os.environ.update({
+        "API_BEARER_TOKEN": TOKEN,
+        "USERNAME": "bench",
+        "PASSWORD": "bench",
+        "STORAGE_BACKEND": "json",
+        # Sem caches de render/fonte: cada geração em segundo plano renderiza de verdade
+        "RENDER_CACHE_MB": "0",
+        "SOURCE_CACHE_MB": "0",
+        "SOURCE_CACHE_DIR": "",
+    })
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    return workdir
+
+
+async def _generate(client, source, n):
+    with open(source, "rb") as f:
+        return await client.post("/api/generate", files={"foto": (os.path.basename(source), f)}, data={
+            "frase_superior": f"Bench {n}", "frase_inferior": "carga", "dark_mode": str(n % 2 == 1).lower(),
+        })
+
+
+async def _background_renders(client, source, stop, counts):
+    n = 0
+    while not stop.is_set():
+        r = await _generate(client, source, n)
+        counts["ok" if r.status_code == 200 else "failed"] += 1
+        n += 1
+
+
+async def _load(client, path, requests, concurrency):
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+    latencies, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            r = await client.get(path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if r.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return dict(summarize(latencies), concurrency=concurrency, errors=errors,
+                rps=round(len(latencies) / elapsed, 1))
+
+
+async def _run(source, requests, concurrency, log):
+    import httpx
+    import app as app_module
+
+    app = app_module.app
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            r = await client.post("/login", data={"username": "bench", "password": "bench"})
+            if r.status_code >= 400:
+                raise RuntimeError(f"login falhou: {r.status_code}")
+            r = await _generate(client, source, 0)
+            if r.status_code != 200:
+                raise RuntimeError(f"/api/generate falhou: {r.status_code} {r.text}")
+
+            for path in ("/api/status", "/api/image"):
+                for background in (False, True):
+                    stop, counts = asyncio.Event(), {"ok": 0, "failed": 0}
+                    renders = asyncio.create_task(_background_renders(client, source, stop, counts)) \
+                        if background else None
+                    name = f"{path}/{'rendering' if background else 'idle'}"
+                    results[name] = await _load(client, path, requests, concurrency)
+                    if renders:
+                        stop.set()
+                        await renders
+                        results[name]["background_renders"] = counts["ok"]
+                        results[name]["errors"] += counts["failed"]
+                    log(f"[Bench] {name}: p50 {results[name]['p50_ms']} ms, "
+                        f"p95 {results[name]['p95_ms']} ms, {results[name]['rps']} req/s")
+    return results
+
+
+def run(source, requests=400, concurrency=16, log=print):
+    """Roda num diretório temporário; ``source`` é a foto usada nas gerações."""
+    cwd = os.getcwd()
+    source = os.path.abspath(source)
+    workdir = _prepare_workdir()
+    try:
+        return asyncio.run(_run(source, requests, concurrency, log))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,91 @@
+import io
+import os
+import time
+import resource
+import statistics
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+# Cada caso roda num processo novo: ru_maxrss é o pico do processo inteiro
+# (interpretador + Pillow + o caso), então só isolado ele não mistura os casos.
+
+
+def _maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB no Linux
+
+
+def summarize(samples):
+    """Latências em segundos → estatísticas em ms."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def _run_case(case):
+    # Sem cache de fonte: cada iteração decodifica, redimensiona e borra de novo
+    os.environ["SOURCE_CACHE_MB"] = "0"
+    os.environ["SOURCE_CACHE_DIR"] = ""
+    from PIL import Image
+    import picture
+
+    picture.warm_render_resources(((case["width"], case["height"]),))
+    samples = []
+    with redirect_stdout(io.StringIO()):
+        if case["fn"] == "resize_cover":
+            # Só o resize: a foto já decodificada em resolução cheia
+            with Image.open(case["source"]) as src:
+                img = src.convert("RGBA" if src.mode in ("RGBA", "LA", "PA") else "RGB")
+            for i in range(case["warmup"] + case["iterations"]):
+                start = time.perf_counter()
+                picture.resize_cover(img, case["width"], case["height"], case["quality"])
+                if i >= case["warmup"]:
+                    samples.append(time.perf_counter() - start)
+        else:
+            for i in range(case["warmup"] + case["iterations"]):
+                start = time.perf_counter()
+                picture.picture_frame(
+                    foto_path=case["source"], frase_superior="Bom dia, meu amor",
+                    frase_inferior="dormiu bem?", output_path=case["output"],
+                    dark_mode=case["dark_mode"], quality=case["quality"],
+                    size=(case["width"], case["height"]), mode=case["mode"],
+                )
+                if i >= case["warmup"]:
+                    samples.append(time.perf_counter() - start)
+    return dict(summarize(samples), peak_rss_mb=round(_maxrss() / 2 ** 20, 1))
+
+
+def cases(sources, iterations, warmup, output_dir, quality=None, size=(800, 480)):
+    """{nome do caso: parâmetros} — resize_cover por fonte e picture_frame em light/dark, full e strip."""
+    result = {}
+    for name, path in sources.items():
+        base = {"source": path, "iterations": iterations, "warmup": warmup,
+                "quality": quality, "width": size[0], "height": size[1]}
+        result[f"resize_cover/{name}"] = dict(base, fn="resize_cover")
+        for dark_mode in (False, True):
+            mode = "dark" if dark_mode else "light"
+            # full = composição no frame inteiro; strip = modo de pouca memória
+            for render_mode in ("full", "strip"):
+                suffix = "" if render_mode == "full" else "/strip"
+                result[f"picture_frame/{name}/{mode}{suffix}"] = dict(
+                    base, fn="picture_frame", dark_mode=dark_mode, mode=render_mode,
+                    output=os.path.join(output_dir, f"{name}-{mode}-{render_mode}.png"),
+                )
+    return result
+
+
+def run(sources, iterations=5, warmup=1, output_dir="bench/results/frames", quality=None, log=print):
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name, case in cases(sources, iterations, warmup, output_dir, quality).items():
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results[name] = pool.submit(_run_case, case).result()
+        log(f"[Bench] {name}: p50 {results[name]['p50_ms']} ms, pico {results[name]['peak_rss_mb']} MB")
+    return results
@@ -0,0 +1,142 @@
+"""Benchmarks reprodutíveis do render e da API dos devices.
+
+    python -m bench.run                    # suíte completa, compara com bench/baseline.json
+    python -m bench.run --quick            # fotos menores e menos iterações
+    python -m bench.run --save-baseline    # grava o resultado como novo baseline
+
+O resultado vai para bench/results/latest.json. Métricas que pioraram além de
+``--threshold`` em relação ao baseline saem como regressão e o exit code é 1;
+sem baseline (ou gerado em outro modo) o exit code é 2: rode --save-baseline
+na máquina de referência antes.
+
+Dependências extras (httpx para a carga na API): pip install -r requirements-dev.txt
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+import PIL
+
+from bench import api, render
+from bench.sources import generate_sources
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "results", "latest.json")
+
+# Métrica → (maior é melhor?, diferença absoluta mínima para contar: ruído de medição)
+COMPARED = {
+    "p50_ms": (False, 2.0),
+    "p95_ms": (False, 5.0),
+    "peak_rss_mb": (False, 8.0),
+    "rps": (True, 5.0),
+}
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Lista de regressões (e melhorias) métrica a métrica contra o baseline."""
+    changes = []
+    for section in ("render", "api"):
+        for case, metrics in results.get(section, {}).items():
+            old = baseline.get(section, {}).get(case)
+            if not old:
+                continue
+            for metric, (higher_is_better, floor) in COMPARED.items():
+                if metric not in metrics or not old.get(metric):
+                    continue
+                new_value, old_value = metrics[metric], old[metric]
+                delta = (new_value - old_value) / old_value
+                worse = -delta if higher_is_better else delta
+                if abs(new_value - old_value) < floor or abs(worse) <= threshold:
+                    continue
+                changes.append({
+                    "case": f"{section}:{case}", "metric": metric, "baseline": old_value,
+                    "current": new_value, "change": round(delta, 3), "regression": worse > 0,
+                })
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="fotos menores e menos iterações")
+    parser.add_argument("--iterations", type=int, help="iterações por caso de render (padrão 5, quick 3)")
+    parser.add_argument("--requests", type=int, help="requisições por cenário da API (padrão 400, quick 100)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--quality", choices=("fast", "balanced", "best"), default=None)
+    parser.add_argument("--skip-render", action="store_true")
+    parser.add_argument("--skip-api", action="store_true")
+    parser.add_argument("--sources-dir", default=os.path.join(BENCH_DIR, "sources"),
+                        help="onde gerar (e reaproveitar) as fotos sintéticas")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="piora relativa tolerada (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    iterations = args.iterations or (3 if args.quick else 5)
+    requests = args.requests or (100 if args.quick else 400)
+    sources = generate_sources(args.sources_dir, quick=args.quick)
+    results = {"environment": _environment(), "quick": args.quick, "started_at": time.time()}
+    if not args.skip_render:
+        results["render"] = render.run(sources, iterations=iterations,
+                                       output_dir=os.path.join(BENCH_DIR, "results", "frames"),
+                                       quality=args.quality)
+    if not args.skip_api:
+        results["api"] = api.run(next(iter(sources.values())), requests=requests,
+                                 concurrency=args.concurrency)
+
+    baseline, missing = None, None
+    if not os.path.exists(args.baseline):
+        missing = f"{args.baseline} não existe"
+    else:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("quick") != args.quick:
+            missing = f"{args.baseline} foi gerado com outro modo (--quick)"
+            baseline = None
+    results["comparison"] = compare(results, baseline, args.threshold) if baseline else None
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"[Bench] Resultado em {args.output}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(dict(results, comparison=None), f, indent=2, ensure_ascii=False)
+        print(f"[Bench] Baseline atualizado: {args.baseline}")
+
+    if baseline is None:
+        if args.save_baseline:
+            return 0
+        print(f"[Bench] Sem comparação: {missing}; grave um baseline com --save-baseline")
+        return 2
+    regressions = [c for c in results["comparison"] if c["regression"]]
+    for c in results["comparison"]:
+        tag = "REGRESSÃO" if c["regression"] else "melhora"
+        print(f"[Bench] {tag}: {c['case']} {c['metric']} {c['baseline']} → {c['current']} ({c['change']:+.0%})")
+    if not results["comparison"]:
+        print("[Bench] Sem diferenças acima do limite em relação ao baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
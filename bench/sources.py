@@ -0,0 +1,47 @@
+import os
+import random
+
+from PIL import Image
+
+# Fotos sintéticas determinísticas (semente fixa): ruído de baixa resolução
+# ampliado com BICUBIC dá textura parecida com foto, sem depender de arquivos
+# externos. Cada entrada: (nome, tamanho, formato, modo, opções do save).
+SOURCES = (
+    ("jpeg_24mp", (6000, 4000), "JPEG", "RGB", {"quality": 90}),
+    ("webp_6mp", (3000, 2000), "WEBP", "RGB", {"quality": 85}),
+    ("png_alpha", (2400, 1600), "PNG", "RGBA", {"compress_level": 6}),
+)
+QUICK_SOURCES = (
+    ("jpeg_6mp", (3000, 2000), "JPEG", "RGB", {"quality": 90}),
+    ("webp_2mp", (1800, 1200), "WEBP", "RGB", {"quality": 85}),
+    ("png_alpha", (1200, 800), "PNG", "RGBA", {"compress_level": 6}),
+)
+
+_EXT = {"JPEG": "jpg", "WEBP": "webp", "PNG": "png"}
+
+
+def synthetic_image(size, mode="RGB", seed=0):
+    rng = random.Random(seed)
+    width, height = size
+    small = (max(2, width // 20), max(2, height // 20))
+    bands = len(mode)
+    img = Image.frombytes(mode, small, rng.randbytes(small[0] * small[1] * bands))
+    if mode == "RGBA":
+        # Alpha suave (nada de pixels totalmente aleatórios no canal de transparência)
+        alpha = Image.linear_gradient("L").resize(small).point(lambda v: 64 + v * 3 // 4)
+        img.putalpha(alpha)
+    return img.resize(size, Image.BICUBIC)
+
+
+def generate_sources(directory, quick=False):
+    """Grava as fotos em ``directory`` (reaproveita as já geradas); devolve {nome: caminho}."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for seed, (name, size, fmt, mode, options) in enumerate(QUICK_SOURCES if quick else SOURCES):
+        path = os.path.join(directory, f"{name}.{_EXT[fmt]}")
+        if not os.path.exists(path):
+            tmp = f"{path}.tmp"
+            synthetic_image(size, mode, seed).save(tmp, fmt, **options)
+            os.replace(tmp, path)
+        paths[name] = path
+    return paths
@@ -0,0 +1,46 @@
+import io
+import os
+import json
+import time
+import zipfile
+
+import eink
+
+# Playlist offline: os próximos frames da rotação num zip só, com um
+# manifest.json (horário de exibição e versão de cada frame). Os frames ficam
+# em disco endereçados pela chave de render (render_key): o próximo bundle só
+# renderiza o que entrou na fila e reaproveita o resto.
+
+# Cada uso toca o mtime; frames de outros perfis (devices) ficam até um dia sem uso
+KEEP_SECONDS = 24 * 3600
+
+
+def frame_path(folder, key, panel=None, dither="floyd"):
+    """PNG do frame ``key`` no diretório de bundles; com ``panel``, o framebuffer dele."""
+    png = os.path.join(folder, f"{key}.png")
+    return eink.framebuffer_path(png, panel, dither) if panel else png
+
+
+def prune(folder, keys, max_age=KEEP_SECONDS):
+    # Frames fora de ``keys`` (já exibidos, replanejados ou de outro perfil) sem uso há ``max_age`` s
+    removed = 0
+    cutoff = time.time() - max_age
+    for entry in os.scandir(folder):
+        try:
+            if entry.name.split(".", 1)[0] not in keys and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def build_archive(manifest, files):
+    """Zip com ``manifest.json`` e ``files`` ({nome no zip: caminho}), em memória."""
+    buf = io.BytesIO()
+    # PNG e framebuffer já são compactos/comprimidos: ZIP_STORED não gasta CPU à toa
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2, ensure_ascii=False))
+        for name, path in files.items():
+            zf.write(path, name)
+    return buf.getvalue()
@@ -0,0 +1,181 @@
+import os
+import time
+import fcntl
+import atexit
+import socket
+import threading
+from contextlib import contextmanager
+
+# Coordenação entre workers do uvicorn (--workers N) na mesma máquina, só com
+# o filesystem de DATA_DIR:
+# - LeaderLock: flock exclusivo num arquivo; quem tem roda o scheduler. O
+#   kernel solta o lock quando o processo morre e os outros tentam de novo a
+#   cada ``retry`` segundos (failover).
+# - PeerBus: um socket unix de datagrama por processo; ``notify()`` avisa os
+#   outros que o estado em disco mudou e cada um recarrega o que tem em memória.
+
+
+@contextmanager
+def file_lock(path):
+    """flock exclusivo em ``path`` (bloqueia até conseguir); vale entre processos e entre threads."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # fechar solta o lock
+
+
+class LeaderLock:
+    """Eleição por flock: ``on_elected`` roda uma vez, no processo que ganhar o lock.
+
+    O descritor fica aberto enquanto o processo viver (O_CLOEXEC: os processos
+    do render engine não herdam o lock). O arquivo guarda o pid do líder.
+    """
+
+    def __init__(self, path, on_elected, retry=5.0):
+        self.path = path
+        self.on_elected = on_elected
+        self.retry = retry
+        self.is_leader = False
+        self._fd = None
+        self._stopped = threading.Event()
+
+    def _try_acquire(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        self.is_leader = True
+        return True
+
+    def start(self):
+        # Primeira tentativa síncrona: com um worker só o scheduler sobe no import, como antes
+        if self._try_acquire():
+            self._elected()
+            return
+        print(f"[Cluster] Processo {os.getpid()} aguardando liderança do scheduler (líder: {self.holder()})")
+        threading.Thread(target=self._loop, name="leader-election", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def holder(self):
+        """pid gravado pelo líder atual (None se ilegível)."""
+        try:
+            with open(self.path, "r") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _loop(self):
+        while not self._stopped.wait(self.retry):
+            if self._try_acquire():
+                self._elected()
+                return
+
+    def _elected(self):
+        print(f"[Cluster] Processo {os.getpid()} é o líder do scheduler")
+        try:
+            self.on_elected()
+        except Exception as e:
+            print(f"[Cluster] Erro ao assumir a liderança: {e}")
+
+
+class PeerBus:
+    """Avisos de "estado mudou" entre processos via ``<directory>/<pid>.sock``.
+
+    ``notify()`` não bloqueia: só marca o aviso, e uma thread envia depois de
+    ``delay`` segundos, então várias gravações seguidas viram um datagrama só.
+    Quem recebe esvazia a fila e chama ``on_change`` uma vez.
+    """
+
+    def __init__(self, directory, on_change, delay=0.05):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        self.on_change = on_change
+        self.delay = delay
+        self.sent = 0
+        self.received = 0
+        self._pending = threading.Event()
+        self._sock = None
+        self._out = None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            os.unlink(self.path)  # pid reaproveitado de um processo que morreu
+        except FileNotFoundError:
+            pass
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._out.setblocking(False)  # peer travado não segura quem publicou
+        atexit.register(self.close)
+        threading.Thread(target=self._recv_loop, name="peer-bus-recv", daemon=True).start()
+        threading.Thread(target=self._send_loop, name="peer-bus-send", daemon=True).start()
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def notify(self):
+        self._pending.set()
+
+    def peers(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        paths = (os.path.join(self.directory, n) for n in names if n.endswith(".sock"))
+        return [p for p in paths if p != self.path]
+
+    def _send_loop(self):
+        while True:
+            self._pending.wait()
+            time.sleep(self.delay)
+            self._pending.clear()
+            self._broadcast(b"state")
+
+    def _broadcast(self, message):
+        for path in self.peers():
+            try:
+                self._out.sendto(message, path)
+                self.sent += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Processo morreu sem remover o socket
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                pass  # fila do peer cheia: ele já tem avisos pendentes e vai reler o disco
+            except OSError as e:
+                print(f"[Cluster] Erro ao avisar {os.path.basename(path)}: {e}")
+
+    def _recv_loop(self):
+        while True:
+            try:
+                self._sock.recv(64)
+            except OSError:
+                return
+            # Esvazia a fila: uma recarga cobre todos os avisos acumulados
+            while True:
+                try:
+                    self._sock.recv(64, socket.MSG_DONTWAIT)
+                except (BlockingIOError, InterruptedError):
+                    break
+                except OSError:
+                    return
+            self.received += 1
+            try:
+                self.on_change()
+            except Exception as e:
+                print(f"[Cluster] Erro ao recarregar estado: {e}")
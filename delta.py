@@ -0,0 +1,140 @@
+import os
+import struct
+
+from PIL import Image, ImageChops
+
+import eink
+
+# Diff entre dois framebuffers do mesmo painel para refresh parcial.
+# A comparação é feita por tiles direto em C (ImageChops + reduce), sem loop
+# por pixel; tiles sujos vizinhos viram retângulos e cada retângulo leva os
+# pixels já empacotados no formato do painel.
+#
+# Arquivo/corpo (inteiros big-endian):
+#   b"EPDD" | u8 versão (1) | u8 bits por pixel | u16 largura | u16 altura
+#   | u16 n + versão base (utf-8) | u16 retângulos
+#   | por retângulo: u16 x, y, largura, altura + pixels (linhas alinhadas em byte)
+MAGIC = b"EPDD"
+FORMAT_VERSION = 1
+TILES = (8, 16)  # múltiplos de 8: x de cada retângulo cai sempre num byte inteiro
+
+
+def delta_path(image_path, panel, dither):
+    # .bin com o mesmo stem do frame: o cleanup remove junto
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}.{panel}.{dither}.delta.bin"
+
+
+def unpack_framebuffer(data, size, panel):
+    """Framebuffer empacotado → imagem "L" com os índices da paleta (0..n-1)."""
+    bits = eink.PANELS[panel]["bits"]
+    indexed = Image.frombytes("P", size, data, "raw", f"P;{bits}" if bits < 8 else "P")
+    return Image.frombytes("L", size, indexed.tobytes())
+
+
+def dirty_tiles(old, new, tile):
+    """(colunas, linhas, bytes com um valor por tile; != 0 = tile mudou)."""
+    changed = ImageChops.difference(old, new).point(lambda v: 255 if v else 0)
+    # Média do tile arredondada: um único pixel 255 já deixa o tile != 0
+    tiles = changed.reduce(tile)
+    return tiles.width, tiles.height, tiles.tobytes()
+
+
+def merge_rects(cols, rows, dirty):
+    """Tiles sujos → retângulos (col, linha, colunas, linhas): faixas por linha, unidas na vertical."""
+    rects, open_runs = [], {}
+    for row in range(rows):
+        runs, col = [], 0
+        line = dirty[row * cols:(row + 1) * cols]
+        while col < cols:
+            if line[col]:
+                start = col
+                while col < cols and line[col]:
+                    col += 1
+                runs.append((start, col))
+            else:
+                col += 1
+        current = {}
+        for run in runs:
+            top = open_runs.pop(run, row)
+            current[run] = top
+        for (start, end), top in open_runs.items():
+            rects.append((start, top, end - start, row - top))
+        open_runs = current
+    for (start, end), top in open_runs.items():
+        rects.append((start, top, end - start, rows - top))
+    return sorted(rects, key=lambda r: (r[1], r[0]))
+
+
+def compute_delta(old_data, new_data, size, panel, base_version, tile=16, max_ratio=0.5):
+    """(retângulos, corpo) do delta entre dois framebuffers; None se a área suja passar de ``max_ratio``."""
+    if tile not in TILES:
+        raise ValueError(f"Tile inválido: {tile} (use {', '.join(map(str, TILES))})")
+    width, height = size
+    old = unpack_framebuffer(old_data, size, panel)
+    new = unpack_framebuffer(new_data, size, panel)
+    cols, rows, dirty = dirty_tiles(old, new, tile)
+
+    rects = []
+    for col, row, ncols, nrows in merge_rects(cols, rows, dirty):
+        x, y = col * tile, row * tile
+        rects.append((x, y, min(ncols * tile, width - x), min(nrows * tile, height - y)))
+    if sum(w * h for _, _, w, h in rects) > max_ratio * width * height:
+        return None
+
+    base = base_version.encode("utf-8")
+    bits = eink.PANELS[panel]["bits"]
+    parts = [struct.pack(">4sBBHHH", MAGIC, FORMAT_VERSION, bits, width, height, len(base)), base,
+             struct.pack(">H", len(rects))]
+    # Índices de volta para "P" e empacotados como o framebuffer inteiro
+    indexed = Image.frombytes("P", size, new.tobytes())
+    for x, y, w, h in rects:
+        parts.append(struct.pack(">HHHH", x, y, w, h))
+        parts.append(eink.pack_framebuffer(indexed.crop((x, y, x + w, y + h)), panel))
+    return rects, b"".join(parts)
+
+
+def base_version(body):
+    """Versão base gravada no cabeçalho de um delta (None se não for um delta válido)."""
+    try:
+        magic, fmt, _, _, _, length = struct.unpack_from(">4sBBHHH", body)
+        if magic != MAGIC or fmt != FORMAT_VERSION:
+            return None
+        return body[12:12 + length].decode("utf-8")
+    except (struct.error, UnicodeDecodeError):
+        return None
+
+
+def write_deltas(base_image, new_image, panels, dither, base_version, tile=16, max_ratio=0.5):
+    # Ponto de entrada picklável para o render engine: um delta por painel com
+    # framebuffer nos dois frames. Devolve {painel: nº de retângulos ou None (frame inteiro)}.
+    with Image.open(new_image) as img:
+        size = img.size
+    with Image.open(base_image) as img:
+        same_size = img.size == size
+    result = {}
+    for panel in panels:
+        output_path = delta_path(new_image, panel, dither)
+        old_fb = eink.framebuffer_path(base_image, panel, dither)
+        new_fb = eink.framebuffer_path(new_image, panel, dither)
+        delta = None
+        if same_size and os.path.exists(old_fb) and os.path.exists(new_fb):
+            with open(old_fb, "rb") as f:
+                old_data = f.read()
+            with open(new_fb, "rb") as f:
+                new_data = f.read()
+            delta = compute_delta(old_data, new_data, size, panel, base_version, tile, max_ratio)
+        if delta is None:
+            try:
+                os.remove(output_path)
+            except OSError:
+                pass
+            result[panel] = None
+            continue
+        rects, body = delta
+        tmp = f"{output_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, output_path)
+        result[panel] = len(rects)
+    return result
@@ -0,0 +1,164 @@
+import os
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+
+# Paletas dos painéis suportados. A ordem define o índice gravado no
+# framebuffer (ex.: bw → bit 1 = branco, como nos painéis Waveshare 7.5").
+PANELS = {
+    "bw": {
+        "bits": 1,
+        "palette": [(0, 0, 0), (255, 255, 255)],
+    },
+    "gray4": {
+        "bits": 2,
+        "palette": [(0, 0, 0), (85, 85, 85), (170, 170, 170), (255, 255, 255)],
+    },
+    "acep7": {
+        "bits": 4,
+        "palette": [
+            (0, 0, 0),        # preto
+            (255, 255, 255),  # branco
+            (0, 255, 0),      # verde
+            (0, 0, 255),      # azul
+            (255, 0, 0),      # vermelho
+            (255, 255, 0),    # amarelo
+            (255, 128, 0),    # laranja
+        ],
+    },
+}
+
+DITHERS = ("floyd", "ordered", "none")
+
+# Matriz de Bayer 8x8 (limiares 0..63)
+_BAYER_8 = [
+    [0, 32, 8, 40, 2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44, 4, 36, 14, 46, 6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [3, 35, 11, 43, 1, 33, 9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47, 7, 39, 13, 45, 5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+]
+
+
+def _check(panel, dither):
+    if panel not in PANELS:
+        raise ValueError(f"Painel inválido: {panel} (use {', '.join(PANELS)})")
+    if dither not in DITHERS:
+        raise ValueError(f"Dither inválido: {dither} (use {', '.join(DITHERS)})")
+
+
+@lru_cache(maxsize=None)
+def _palette_image(panel):
+    colors = PANELS[panel]["palette"]
+    flat = [c for rgb in colors for c in rgb]
+    # Paleta repetida ciclicamente até 256 entradas: índice i ≡ cor i % n
+    flat = (flat * (768 // len(flat) + 1))[:768]
+    pal = Image.new("P", (1, 1))
+    pal.putpalette(flat)
+    return pal
+
+
+@lru_cache(maxsize=None)
+def _index_lut(panel):
+    n = len(PANELS[panel]["palette"])
+    return [i % n for i in range(256)]
+
+
+@lru_cache(maxsize=8)
+def _bayer_offsets(size, spread):
+    # Duas camadas L (positiva e negativa) com o limiar de Bayer centrado em zero,
+    # ladrilhadas no tamanho do frame: o dither ordenado vira add/subtract em C.
+    pos = Image.new("L", (8, 8))
+    neg = Image.new("L", (8, 8))
+    for y, row in enumerate(_BAYER_8):
+        for x, t in enumerate(row):
+            offset = int(((t + 0.5) / 64 - 0.5) * spread)
+            pos.putpixel((x, y), max(0, offset))
+            neg.putpixel((x, y), max(0, -offset))
+
+    def tile(cell):
+        width, height = size
+        row = Image.new("L", (width, 8))
+        for x in range(0, width, 8):
+            row.paste(cell, (x, 0))
+        full = Image.new("L", size)
+        for y in range(0, height, 8):
+            full.paste(row, (0, y))
+        return full
+
+    return tile(pos), tile(neg)
+
+
+@lru_cache(maxsize=None)
+def _gray_lut(panel):
+    # Nível de cinza → índice da cor mais próxima (exato, ao contrário do
+    # lookup aproximado do quantize do Pillow)
+    levels = [rgb[0] for rgb in PANELS[panel]["palette"]]
+    return [min(range(len(levels)), key=lambda i: abs(levels[i] - v)) for v in range(256)]
+
+
+def _is_gray(panel):
+    return all(r == g == b for r, g, b in PANELS[panel]["palette"])
+
+
+def _as_indexed(img_l):
+    return Image.frombytes("P", img_l.size, img_l.tobytes())
+
+
+def _ordered(img, spread):
+    pos, neg = _bayer_offsets(img.size, spread)
+    bands = [ImageChops.subtract(ImageChops.add(b, pos), neg) for b in img.split()]
+    return Image.merge(img.mode, bands)
+
+
+def quantize(img, panel="bw", dither="floyd"):
+    """Reduz a imagem à paleta do painel. Retorna imagem "P" com índices 0..n-1."""
+    _check(panel, dither)
+    colors = PANELS[panel]["palette"]
+
+    if _is_gray(panel):
+        gray = img.convert("L")
+        if dither == "floyd" and panel == "bw":
+            # Floyd–Steinberg nativo do Pillow para 1 bit
+            return _as_indexed(gray.convert("1").convert("L").point(lambda v: 1 if v else 0))
+        if dither == "ordered":
+            gray = _ordered(gray, 256 // (len(colors) - 1))
+        if dither != "floyd":
+            return _as_indexed(gray.point(_gray_lut(panel)))
+        img = gray.convert("RGB")
+    else:
+        img = img.convert("RGB")
+        if dither == "ordered":
+            img = _ordered(img, 128)
+
+    mode = Image.Dither.FLOYDSTEINBERG if dither == "floyd" else Image.Dither.NONE
+    out = img.quantize(palette=_palette_image(panel), dither=mode)
+    return out.point(_index_lut(panel))
+
+
+def pack_framebuffer(indexed, panel="bw"):
+    """Empacota os índices em bits (MSB primeiro, linhas contíguas)."""
+    bits = PANELS[panel]["bits"]
+    return indexed.tobytes("raw", f"P;{bits}" if bits < 8 else "P")
+
+
+def framebuffer_path(image_path, panel, dither):
+    stem, _ = os.path.splitext(image_path)
+    return f"{stem}.{panel}.{dither}.bin"
+
+
+def write_framebuffer(img_or_path, output_path, panel="bw", dither="floyd"):
+    # Ponto de entrada picklável para o render engine (aceita imagem ou caminho)
+    img = img_or_path
+    if isinstance(img_or_path, str):
+        with Image.open(img_or_path) as src:
+            img = src.convert("RGB")
+    data = pack_framebuffer(quantize(img, panel, dither), panel)
+    tmp = f"{output_path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, output_path)
+    return output_path
@@ -0,0 +1,58 @@
+import hashlib
+import secrets
+
+# Cada device (token próprio) tem um perfil de render: resolução, rotação e
+# modo. Devices com o mesmo perfil compartilham o mesmo frame; o perfil do
+# frame principal (800x480, sem rotação) reaproveita a publicação normal.
+DEFAULT_SIZE = (800, 480)
+ROTATIONS = (0, 90, 180, 270)
+MIN_SIZE, MAX_SIZE = 16, 4096
+
+
+def new_token():
+    return secrets.token_urlsafe(24)
+
+
+def hash_token(token):
+    # Só o hash vai para o estado; o token aparece uma única vez, no cadastro
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def profile_of(device, source):
+    """Perfil efetivo de ``device`` para a publicação ``source`` (dark_mode None = segue a publicação)."""
+    raw = bool(source.get("raw"))
+    dark_mode = device.get("dark_mode")
+    if dark_mode is None:
+        dark_mode = source.get("dark_mode", False)
+    return {
+        "width": int(device.get("width") or DEFAULT_SIZE[0]),
+        "height": int(device.get("height") or DEFAULT_SIZE[1]),
+        "rotation": int(device.get("rotation") or 0),
+        "dark_mode": False if raw else bool(dark_mode),
+        "raw": raw,
+    }
+
+
+def profile_key(profile):
+    mode = "raw" if profile["raw"] else ("dark" if profile["dark_mode"] else "light")
+    return f"{profile['width']}x{profile['height']}-{mode}-r{profile['rotation']}"
+
+
+def is_default(profile, source):
+    # Mesmo frame que a publicação principal já gerou
+    return (
+        (profile["width"], profile["height"]) == DEFAULT_SIZE
+        and profile["rotation"] == 0
+        and profile["dark_mode"] == (False if source.get("raw") else bool(source.get("dark_mode")))
+    )
+
+
+def validate_device(width, height, rotation, panel, panels):
+    """Mensagem de erro para um cadastro inválido, ou None."""
+    if not (MIN_SIZE <= width <= MAX_SIZE and MIN_SIZE <= height <= MAX_SIZE):
+        return f"width/height devem estar entre {MIN_SIZE} e {MAX_SIZE}"
+    if rotation not in ROTATIONS:
+        return f"rotation deve ser um de {', '.join(map(str, ROTATIONS))}"
+    if panel is not None and panel not in panels:
+        return f"panel deve ser um de {', '.join(panels)}"
+    return None
@@ -0,0 +1,207 @@
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Templates declarativos em layouts/<nome>.json. Posições e tamanhos são
+# frações (da largura, da altura ou da faixa do overlay), então o mesmo
+# template serve para qualquer resolução de painel.
+LAYOUTS_DIR = "layouts"
+DEFAULT_LAYOUT = "classic"
+
+_SIDES = ("top", "bottom", "left", "right", "center")
+
+
+@dataclass(frozen=True)
+class TextRegion:
+    text: str                   # template com {frase_superior}, {frase_inferior}, {dias}
+    font: str                   # caminho do .ttf
+    size: float                 # fração da altura
+    x: tuple = (0.0, 1.0)       # faixa horizontal (frações da largura)
+    y: float = 0.0              # topo, fração da altura do overlay
+    dy: float = 0.0             # ajuste fino, fração da altura
+    align: str = "center"       # left | center | right
+    padding: float = 0.0        # fração da faixa, em cada lado
+    fit: bool = False           # diminui a fonte até caber na faixa
+    min_size: float = 0.0       # menor fonte do fit, fração da altura
+
+
+@dataclass(frozen=True)
+class ImageRegion:
+    path: str
+    height: float               # fração da altura
+    right: float = 0.0          # distância da borda direita, fração da largura
+    y: float = 0.0              # topo, fração da altura do overlay
+
+
+@dataclass(frozen=True)
+class Layout:
+    name: str
+    overlay_height: float       # fração da altura, faixa inferior com vidro
+    line_width: int = 3
+    lines: tuple = _SIDES
+    colors: dict = field(default_factory=dict)  # {"light"|"dark": {"glass", "line", "text"}}
+    texts: tuple = ()
+    images: tuple = ()
+
+
+def available_layouts():
+    try:
+        return sorted(f[:-5] for f in os.listdir(LAYOUTS_DIR) if f.endswith(".json"))
+    except OSError:
+        return []
+
+
+@lru_cache(maxsize=16)
+def load_layout(name):
+    if name not in available_layouts():
+        raise ValueError(f"Layout inválido: {name} (disponíveis: {', '.join(available_layouts())})")
+    with open(os.path.join(LAYOUTS_DIR, f"{name}.json"), "r") as f:
+        spec = json.load(f)
+    overlay = spec.get("overlay", {})
+    lines = tuple(overlay.get("lines", _SIDES))
+    if not 0 < overlay.get("height", 0) <= 1 or not set(lines) <= set(_SIDES):
+        raise ValueError(f"Layout {name}: overlay inválido")
+    return Layout(
+        name=name,
+        overlay_height=overlay["height"],
+        line_width=int(overlay.get("line_width", 3)),
+        lines=lines,
+        colors={mode: {k: tuple(v) for k, v in c.items()} for mode, c in spec["colors"].items()},
+        texts=tuple(TextRegion(**dict(t, x=tuple(t.get("x", (0.0, 1.0))))) for t in spec.get("texts", ())),
+        images=tuple(ImageRegion(**i) for i in spec.get("images", ())),
+    )
+
+
+@lru_cache(maxsize=16)
+def layout_version(name):
+    # Hash do JSON: editar um template invalida os frames cacheados com ele
+    load_layout(name)
+    with open(os.path.join(LAYOUTS_DIR, f"{name}.json"), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+# ===== MÉTRICAS DE TEXTO (cache por processo) =====
+
+@lru_cache(maxsize=64)
+def get_font(path, size):
+    try:
+        return ImageFont.truetype(path, size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def text_width(path, size, text):
+    # Mesma medida do textbbox usado antes, memorizada por (fonte, tamanho, texto)
+    bbox = get_font(path, size).getbbox(text)
+    return bbox[2] - bbox[0]
+
+
+class _CompiledText:
+    def __init__(self, region, width, height, overlay_top, overlay_height):
+        self.region = region
+        self.left = int(width * region.x[0])
+        self.right = int(width * region.x[1])
+        pad = int((self.right - self.left) * region.padding)
+        self.max_width = self.right - self.left - 2 * pad
+        self.pad = pad
+        self.y = overlay_top + int(overlay_height * region.y) + round(height * region.dy)
+        self.size = int(height * region.size)
+        self.min_size = max(1, int(height * region.min_size)) if region.fit else self.size
+
+    def fit(self, text):
+        """(tamanho da fonte, largura) — o maior tamanho que cabe, até ``min_size``."""
+        path = self.region.font
+        width = text_width(path, self.size, text)
+        if width <= self.max_width or self.min_size >= self.size:
+            return self.size, width
+        # Largura cresce com o tamanho: busca binária pelo maior que cabe
+        lo, hi = self.min_size, self.size - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if text_width(path, mid, text) <= self.max_width:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo, text_width(path, lo, text)
+
+    def x_for(self, width):
+        if self.region.align == "left":
+            return self.left + self.pad
+        if self.region.align == "right":
+            return self.right - self.pad - width
+        return self.left + (self.right - self.left - width) // 2
+
+
+class CompiledLayout:
+    """Layout resolvido para (largura, altura, modo): camada fixa pré-composta e regiões em pixels.
+
+    Tudo que o layout desenha fica na faixa do overlay, então só ela é guardada
+    (acima dela o overlay é transparente).
+    """
+
+    def __init__(self, layout, width, height, dark_mode):
+        colors = layout.colors["dark" if dark_mode else "light"]
+        self.name = layout.name
+        self.size = (width, height)
+        self.text_color = colors["text"]
+        self.overlay_height = int(height * layout.overlay_height)
+        self.overlay_top = height - self.overlay_height
+        self.strip = self._strip(layout, width, height, colors)
+        self.texts = [
+            _CompiledText(t, width, height, self.overlay_top, self.overlay_height) for t in layout.texts
+        ]
+
+    def _strip(self, layout, width, height, colors):
+        # Vidro, linhas e imagens não mudam entre renders: desenhados uma vez,
+        # em coordenadas da faixa (y = 0 no topo do overlay)
+        strip = Image.new("RGBA", (width, self.overlay_height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(strip)
+        bottom, lw, center_x = self.overlay_height, layout.line_width, width // 2
+        draw.rectangle([(0, 0), (width, bottom)], fill=colors["glass"])
+        boxes = {
+            "top": [(0, 0), (width, lw - 1)],
+            "bottom": [(0, bottom - lw), (width, bottom)],
+            "left": [(0, 0), (lw - 1, bottom)],
+            "right": [(width - lw, 0), (width, bottom)],
+            "center": [(center_x - lw // 2, 0), (center_x + lw // 2, bottom)],
+        }
+        for side in layout.lines:
+            draw.rectangle(boxes[side], fill=colors["line"])
+        for region in layout.images:
+            with Image.open(region.path) as src:
+                img = src.convert("RGBA")
+            img_height = int(height * region.height)
+            img = img.resize((int(img_height * img.width / img.height), img_height), Image.LANCZOS)
+            x = width - img.width - round(width * region.right)
+            y = round(self.overlay_height * region.y)
+            strip.paste(img, (x, y), img)
+        return strip
+
+    def _draw_texts(self, overlay, values, offset):
+        draw = ImageDraw.Draw(overlay)
+        for t in self.texts:
+            text = t.region.text.format_map(values)
+            size, width = t.fit(text)
+            draw.text((t.x_for(width), t.y - offset), text, fill=self.text_color,
+                      font=get_font(t.region.font, size))
+        return overlay
+
+    def draw(self, values):
+        """Overlay RGBA do frame inteiro com os textos de ``values`` sobre a camada fixa."""
+        overlay = Image.new("RGBA", self.size, (0, 0, 0, 0))
+        overlay.paste(self.strip, (0, self.overlay_top))
+        return self._draw_texts(overlay, values, 0)
+
+    def draw_strip(self, values):
+        """Só a faixa do overlay (altura ``overlay_height``), para o render em faixa."""
+        return self._draw_texts(self.strip.copy(), values, self.overlay_top)
+
+
+@lru_cache(maxsize=16)
+def compile_layout(name, width, height, dark_mode):
+    return CompiledLayout(load_layout(name), width, height, dark_mode)
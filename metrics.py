@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import threading
+import contextvars
+import multiprocessing
+from contextlib import contextmanager
+
+# Métricas em memória, expostas em /metrics no formato texto do Prometheus
+# (sem dependência extra). LOG_JSON=1 também emite cada evento como uma
+# linha JSON; RENDER_PROFILE=1 despeja o tempo de cada etapa de cada render.
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"
+RENDER_PROFILE = os.getenv("RENDER_PROFILE", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 30, 60, 300, 3600)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # labels → [contagem por bucket..., soma, total]
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def collect(self):
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = (("le", _number(float(bound))),)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, (('le', '+Inf'),))} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    """Métricas registradas + coletores chamados na hora do scrape (gauges de estado)."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """``fn()`` → [(nome, help, tipo, [(dict de labels, valor)])]; usado como decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.type}"]
+            lines += metric.collect()
+        for fn in self._collectors:
+            try:
+                families = fn()
+            except Exception as e:
+                log_event("metrics_collector_error", collector=fn.__name__, error=str(e))
+                continue
+            for name, help, kind, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [
+                    f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}"
+                    for labels, value in samples
+                ]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter("http_requests_total", "Requisições HTTP por rota e status", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "Tempo até o início da resposta, por rota", ("method", "route")
+)
+RENDER_JOBS = registry.counter("render_jobs_total", "Jobs do render engine por função e resultado", ("fn", "status"))
+RENDER_JOB_SECONDS = registry.histogram(
+    "render_job_duration_seconds", "Tempo do job no render engine (fila + execução)", ("fn",)
+)
+RENDER_STAGE_SECONDS = registry.histogram(
+    "render_stage_duration_seconds", "Tempo de cada etapa do render", ("stage",)
+)
+SCHEDULER_LAG = registry.histogram(
+    "scheduler_lag_seconds", "Atraso entre o prazo e a execução do job", ("kind",), LAG_BUCKETS
+)
+SCHEDULER_RUNS = registry.counter("scheduler_runs_total", "Jobs executados pelo scheduler", ("kind", "status"))
+STATE_WRITE_SECONDS = registry.histogram(
+    "state_write_duration_seconds", "Gravação atômica dos JSON de estado", ("file",)
+)
+
+
+def log_event(event, **fields):
+    if LOG_JSON:
+        print(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, ensure_ascii=False), flush=True)
+
+
+# ===== ETAPAS DO RENDER =====
+
+_stages = contextvars.ContextVar("render_stages", default=None)
+
+
+@contextmanager
+def profiled():
+    """Coleta os ``span`` executados dentro do bloco num dict etapa → segundos."""
+    stages = {}
+    token = _stages.set(stages)
+    start = time.perf_counter()
+    try:
+        yield stages
+    finally:
+        stages["total"] = time.perf_counter() - start
+        _stages.reset(token)
+
+
+@contextmanager
+def span(name):
+    # Fora de ``profiled`` não mede nada (custo de uma leitura de ContextVar)
+    stages = _stages.get()
+    if stages is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def observe_render(fn_name, seconds, status, result=None):
+    """Chamado pelo render engine ao fim de cada job; ``result`` pode trazer as etapas do worker."""
+    RENDER_JOBS.inc(fn=fn_name, status=status)
+    RENDER_JOB_SECONDS.observe(seconds, fn=fn_name)
+    stages = result.get("stages") if isinstance(result, dict) else None
+    if stages:
+        for stage, value in stages.items():
+            RENDER_STAGE_SECONDS.observe(value, stage=stage)
+    if RENDER_PROFILE and stages:
+        print(json.dumps({
+            "ts": round(time.time(), 3), "event": "render_profile", "fn": fn_name,
+            "job_seconds": round(seconds, 4), "stages": {k: round(v, 4) for k, v in stages.items()},
+        }), flush=True)
+    else:
+        log_event("render", fn=fn_name, status=status, seconds=round(seconds, 4))
+
+
+def observe_scheduler(key, lag, seconds, status):
+    kind = key.split(":", 1)[0]  # job:<id> → job: sem um label por job
+    SCHEDULER_LAG.observe(max(0.0, lag), kind=kind)
+    SCHEDULER_RUNS.inc(kind=kind, status=status)
+    log_event("scheduler_run", kind=kind, key=key, lag=round(lag, 3), seconds=round(seconds, 4), status=status)
+
+
+# ===== PROCESSO =====
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _rss(pid="self"):
+    try:
+        with open(f"/proc/{pid}/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@registry.collector
+def _process_metrics():
+    samples = []
+    main = _rss()
+    if main is not None:
+        samples.append(({"process": "main"}, main))
+    workers = [_rss(p.pid) for p in multiprocessing.active_children()]
+    if any(w is not None for w in workers):
+        samples.append(({"process": "workers"}, sum(w for w in workers if w)))
+    return [("process_resident_memory_bytes", "RSS do processo principal e dos workers de render", "gauge", samples)]
+
+
+# ===== HTTP =====
+
+class MetricsMiddleware:
+    """Middleware ASGI: contagem e latência por rota (template do path, ex.: /api/album/{photo_id})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                # Latência até os headers: SSE/long-poll não contam a duração do stream
+                status = message["status"]
+                route = getattr(scope.get("route"), "path", None) or "unmatched"
+                seconds = time.perf_counter() - start
+                HTTP_LATENCY.observe(seconds, method=scope["method"], route=route)
+                HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+                log_event("http_request", method=scope["method"], route=route, path=scope["path"],
+                          status=status, seconds=round(seconds, 4))
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
@@ -0,0 +1,59 @@
+import asyncio
+import threading
+
+
+class VersionNotifier:
+    """Avisa quem espera por uma nova versão do frame.
+
+    ``publish`` pode ser chamado de qualquer thread (rotas ou scheduler);
+    cada espera é só um Future no event loop de quem chamou ``wait``, então
+    milhares de conexões em long-poll/SSE não custam uma thread cada.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._waiters = set()
+
+    @property
+    def current(self):
+        with self._lock:
+            return self._data
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return len(self._waiters)
+
+    def publish(self, data):
+        with self._lock:
+            self._data = data
+            waiters, self._waiters = self._waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, data)
+            except RuntimeError:
+                pass  # loop já encerrado
+
+    async def wait(self, since, timeout):
+        """Retorna os dados da versão mais nova que ``since`` ou None no timeout."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._lock:
+            data = self._data
+            if data is not None and data.get("versao") != since:
+                return data
+            self._waiters.add(waiter)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def _resolve(future, data):
+    if not future.done():
+        future.set_result(data)
@@ -0,0 +1,70 @@
+import hashlib
+import threading
+
+from PIL import Image, ImageOps
+
+# Fotos ficam em uploads/<sha[:2]>/<sha256>.<ext>: o mesmo conteúdo vira o mesmo
+# arquivo, independente do nome enviado
+EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "BMP": "bmp", "TIFF": "tif"}
+
+
+def blob_relpath(sha256, fmt):
+    return f"{sha256[:2]}/{sha256}.{EXTENSIONS.get(fmt, 'bin')}"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dhash(path, size=8):
+    """Hash perceptual (difference hash) de 64 bits, em hex; resiste a recompressão e resize."""
+    with Image.open(path) as img:
+        img.draft("L", (size * 16, size * 16))  # JPEG: decodifica já reduzido
+        small = ImageOps.exif_transpose(img).convert("L").resize((size + 1, size), Image.Resampling.BILINEAR)
+    px = small.tobytes()
+    bits = 0
+    for y in range(size):
+        row = px[y * (size + 1):(y + 1) * (size + 1)]
+        for x in range(size):
+            bits = (bits << 1) | (row[x] > row[x + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+class PerceptualIndex:
+    """Índice em memória id → dHash para achar quase-duplicatas por distância de Hamming."""
+
+    def __init__(self, entries=()):
+        self._lock = threading.Lock()
+        self._hashes = {}
+        self.rebuild(entries)
+
+    def rebuild(self, entries):
+        """Troca o índice inteiro pelo de ``entries`` (ex.: álbum relido do disco)."""
+        hashes = {e["id"]: int(e["phash"], 16) for e in entries if e.get("id") and e.get("phash")}
+        with self._lock:
+            self._hashes = hashes
+
+    def add(self, item_id, phash):
+        if item_id and phash:
+            with self._lock:
+                self._hashes[item_id] = int(phash, 16)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._hashes.pop(item_id, None)
+
+    def near(self, phash, max_distance, exclude=None):
+        """ids a até ``max_distance`` bits de ``phash``, mais parecidos primeiro."""
+        if not phash:
+            return []
+        target = int(phash, 16)
+        with self._lock:
+            found = [
+                (bin(target ^ h).count("1"), item_id)
+                for item_id, h in self._hashes.items() if item_id != exclude
+            ]
+        return [item_id for dist, item_id in sorted(found) if dist <= max_distance]
@@ -1,8 +1,45 @@
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import os
+from PIL import Image, ImageFilter, ImageOps
 from datetime import datetime
 
-def resize_cover(img, target_width, target_height):
-    img_ratio = img.width / img.height
+import eink
+from metrics import profiled, span
+from layout import DEFAULT_LAYOUT, compile_layout
+from source_cache import source_cache
+
+BLUR_RADIUS = 3
+# Template de layouts/ usado quando o render não escolhe um
+RENDER_LAYOUT = os.getenv("RENDER_LAYOUT", DEFAULT_LAYOUT)
+DATA_INICIO = "2024-09-21"
+
+# Qualidade do redimensionamento: filtro + reducing_gap (reduce inteiro antes do filtro)
+#   fast     → draft JPEG + BILINEAR após reduce agressivo
+#   balanced → draft JPEG + LANCZOS após reduce (diferença imperceptível)
+#   best     → decodifica em resolução cheia + LANCZOS puro (comportamento antigo)
+RENDER_QUALITY = os.getenv("RENDER_QUALITY", "balanced")
+QUALITY_PRESETS = {
+    "fast": (Image.BILINEAR, 2.0),
+    "balanced": (Image.LANCZOS, 3.0),
+    "best": (Image.LANCZOS, None),
+}
+
+# Modo de composição (a saída é idêntica nos dois):
+#   full  → foto, overlay e composição em RGBA no frame inteiro
+#   strip → foto em RGB; overlay, blur e composição só na faixa do overlay, no
+#           próprio buffer da foto (menos da metade da memória por render).
+#           Fotos com transparência sempre usam full.
+#   auto  → strip quando a estimativa do full passa de RENDER_MEMORY_MB
+RENDER_MODE = os.getenv("RENDER_MODE", "auto")
+RENDER_MEMORY_MB = int(os.getenv("RENDER_MEMORY_MB", "0"))  # orçamento por render; 0 = sem limite
+
+def _quality_preset(quality):
+    quality = quality or RENDER_QUALITY
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Qualidade inválida: {quality} (use fast, balanced ou best)")
+    return quality, QUALITY_PRESETS[quality]
+
+def _cover_size(width, height, target_width, target_height):
+    img_ratio = width / height
     target_ratio = target_width / target_height
 
     if img_ratio > target_ratio:
@@ -13,8 +50,13 @@ def resize_cover(img, target_width, target_height):
         # imagem é mais alta → corta topo/baixo
         new_width = target_width
         new_height = int(new_width / img_ratio)
+    return new_width, new_height
 
-    img = img.resize((new_width, new_height), Image.LANCZOS)
+def resize_cover(img, target_width, target_height, quality=None):
+    _, (resample, reducing_gap) = _quality_preset(quality)
+    new_width, new_height = _cover_size(img.width, img.height, target_width, target_height)
+
+    img = img.resize((new_width, new_height), resample, reducing_gap=reducing_gap)
 
     left = (new_width - target_width) // 2
     top = (new_height - target_height) // 2
@@ -24,170 +66,234 @@ def resize_cover(img, target_width, target_height):
     return img.crop((left, top, right, bottom))
 
 
+def open_cover(foto_path, target_width, target_height, quality=None, mode="RGBA"):
+    """Abre, orienta (EXIF) e recorta a foto no menor tamanho de decode possível.
+
+    JPEGs usam ``draft`` (decodifica em 1/2, 1/4 ou 1/8 direto do DCT, nunca
+    abaixo do tamanho final); os demais formatos passam pelo reduce inteiro
+    do ``reducing_gap`` antes do filtro. A conversão de modo só acontece já
+    em 800x480, evitando uma cópia RGBA da foto em resolução cheia.
+    """
+    quality, _ = _quality_preset(quality)
+    with span("decode"):
+        img = Image.open(foto_path)
+
+        if img.format == "JPEG" and quality != "best":
+            # Orientações 5–8 giram 90°: o draft trabalha nas dimensões do arquivo
+            orientation = img.getexif().get(0x0112, 1)
+            if orientation in (5, 6, 7, 8):
+                draft_target = (target_height, target_width)
+            else:
+                draft_target = (target_width, target_height)
+            img.draft(img.mode, _cover_size(img.width, img.height, *draft_target))
+
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA", "L"):
+            has_alpha = img.mode in ("LA", "PA") or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+
+    with span("resize"):
+        img = resize_cover(img, target_width, target_height, quality)
+        return img.convert(mode) if img.mode != mode else img
+
+
+def _has_alpha(foto_path):
+    # Foto com transparência só dá o mesmo resultado compondo em RGBA (modo full)
+    try:
+        with Image.open(foto_path) as img:
+            return img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    except OSError:
+        return False
+
+
+def estimate_render_bytes(foto_path, size, overlay_height, mode="full", quality=None):
+    """Pico aproximado de memória de um render: decode + redimensionamento ou composição."""
+    width, height = size
+    quality, _ = _quality_preset(quality)
+    with Image.open(foto_path) as img:
+        src_w, src_h = img.size
+        bands = 4 if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info else 3
+        is_jpeg = img.format == "JPEG"
+    if bands == 4:
+        mode = "full"  # ver _has_alpha
+    cover_w, cover_h = _cover_size(src_w, src_h, width, height)
+    scale = 1
+    if is_jpeg and quality != "best":
+        # draft decodifica em 1/2, 1/4 ou 1/8, nunca abaixo do tamanho do cover
+        while scale < 8 and src_w // (scale * 2) >= cover_w and src_h // (scale * 2) >= cover_h:
+            scale *= 2
+    decode = -(-src_w // scale) * -(-src_h // scale) * bands + cover_w * cover_h * bands
+    if mode == "strip":
+        # foto RGB + faixa (recorte, blur e overlay RGBA)
+        compose = width * height * 3 + width * overlay_height * (3 + 3 + 4)
+    else:
+        # cover RGBA, cópia, overlay, composição RGBA e a cópia RGB do save
+        compose = width * height * (4 * 4 + 3)
+    return max(decode, compose)
+
+
+def render_mode(foto_path, size, overlay_height, quality=None):
+    if RENDER_MODE in ("full", "strip"):
+        return RENDER_MODE
+    if not RENDER_MEMORY_MB:
+        return "full"
+    budget = RENDER_MEMORY_MB * 1024 * 1024
+    try:
+        if estimate_render_bytes(foto_path, size, overlay_height, "full", quality) <= budget:
+            return "full"
+        needed = estimate_render_bytes(foto_path, size, overlay_height, "strip", quality)
+    except OSError:
+        return "strip"
+    if needed > budget:
+        print(f"[Render] {os.path.basename(foto_path)}: ~{needed / 2 ** 20:.0f} MB, acima de RENDER_MEMORY_MB mesmo em faixa")
+    return "strip"
+
+
+# ===== RECURSOS DE RENDER (cache por processo) =====
+
+def warm_render_resources(sizes=((800, 480),), layouts=None):
+    # Chamado no startup e como initializer dos workers do render engine
+    for name in layouts or (RENDER_LAYOUT,):
+        for width, height in sizes:
+            for dark_mode in (False, True):
+                compile_layout(name, width, height, dark_mode)
+
+
+def load_source(foto_path, width, height, overlay_top, quality=None, mode="RGBA"):
+    # Cover + faixa do overlay já com blur, via cache (path + mtime + tamanho)
+    quality, _ = _quality_preset(quality)
+    key = source_cache.key_for(foto_path, width, height, overlay_top, BLUR_RADIUS, quality, mode)
+    cached = source_cache.get(key)
+    if cached is not None:
+        return cached
+
+    cover = open_cover(foto_path, width, height, quality, mode)
+
+    # ===== BLUR DO FUNDO (VIDRO REAL) =====
+    with span("blur"):
+        regiao = cover.crop((0, overlay_top, width, height))
+        strip = regiao.filter(ImageFilter.GaussianBlur(radius=BLUR_RADIUS))
+
+    source_cache.put(key, (cover, strip))
+    return cover, strip
+
+
+def dias_juntos(data_inicio=DATA_INICIO, dia=None):
+    # ``dia`` ("%Y-%m-%d") = contador de um dia futuro (playlist offline); None = hoje
+    data_inicial = datetime.strptime(data_inicio, "%Y-%m-%d")
+    hoje = datetime.strptime(dia, "%Y-%m-%d") if dia else datetime.now()
+    return (hoje - data_inicial).days
+
+
 def picture_frame(
     foto_path,
     frase_superior, # max 18 caracteres
     frase_inferior, # max 25 caracteres
-    data_inicio="2024-09-21",
+    data_inicio=DATA_INICIO,
     output_path="resultado.png",
-    dark_mode=False
+    dark_mode=False,
+    quality=None,
+    size=(800, 480),
+    layout=None,
+    mode=None,
+    dia=None
 ):
 
-    img = Image.open(foto_path).convert("RGBA")
-    img = resize_cover(img, 800, 480)
-    width, height = img.size
-
-
-    # ===== CORES =====
+    width, height = size
 
-    white_glass = (255, 255, 255, 255)
-    grey_glass = (0, 0, 0, 200)
+    compiled = compile_layout(layout or RENDER_LAYOUT, width, height, dark_mode)
 
-    white_elements = (255, 255, 255, 255)
-    grey_elements = (0, 0, 0, 255)
+    # ===== CALCULAR DIAS =====
+    dias = dias_juntos(data_inicio, dia)
+    values = {"frase_superior": frase_superior, "frase_inferior": frase_inferior, "dias": dias}
 
-    vidro = white_glass if not dark_mode else grey_glass
-    line_color = grey_elements if not dark_mode else white_elements
-    text_color = grey_elements if not dark_mode else white_elements
+    mode = mode or render_mode(foto_path, size, compiled.overlay_height, quality)
+    if mode == "strip" and not _has_alpha(foto_path):
+        final = _compose_strip(foto_path, compiled, quality, values)
+    else:
+        final = _compose_full(foto_path, compiled, quality, values)
+    if output_path:
+        with span("save"):
+            final.save(output_path, "PNG")
+        print(f"[OK] Imagem criada: {output_path}")
+    print(f"[OK] Dias juntos: {dias}")
+    return final
 
 
-    # ===== CALCULAR DIAS =====
-    data_inicial = datetime.strptime(data_inicio, "%Y-%m-%d")
-    dias = (datetime.now() - data_inicial).days
+def _compose_full(foto_path, compiled, quality, values):
+    width, height = compiled.size
+    overlay_top = compiled.overlay_top
+    cover, strip = load_source(foto_path, width, height, overlay_top, quality)
 
-    # ===== OVERLAY =====
-    overlay_height = int(height * 0.23)
-    overlay_top = height - overlay_height
+    # ===== BLUR DO FUNDO (faixa já borrada vinda do cache) =====
+    img = cover.copy()
+    img.paste(strip, (0, overlay_top))
 
-    # ===== BLUR DO FUNDO (VIDRO REAL) =====
-    regiao = img.crop((0, overlay_top, width, height))
-    regiao_blur = regiao.filter(ImageFilter.GaussianBlur(radius=3))
-    img.paste(regiao_blur, (0, overlay_top))
-
-    # ===== OVERLAY TRANSLÚCIDO =====
-    overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(overlay)
-
-    draw.rectangle(
-        [(0, overlay_top), (width, height)],
-        fill=vidro
-    )
-
-    # ===== LINHAS =====
-
-    line_width = 3
-    center_x = width // 2
-
-    # superior
-    draw.rectangle(
-        [(0, overlay_top), (width, overlay_top + line_width - 1)],
-        fill=line_color
-    )
-    # inferior
-    draw.rectangle(
-        [(0, height - line_width), (width, height)],
-        fill=line_color
-    )
-    # esquerda
-    draw.rectangle(
-        [(0, overlay_top), (line_width -1, height)],
-        fill=line_color
-    )
-    # direita
-    draw.rectangle(
-        [(width - line_width, overlay_top), (width, height)],
-        fill=line_color
-    )
-    # centro
-    draw.rectangle(
-        [(center_x - line_width // 2, overlay_top),
-         (center_x + line_width // 2, height)],
-        fill=line_color
-    )
-
-    # ===== FONTES =====
-    try:
-        fonte_msg_grande = ImageFont.truetype(
-            "fonts/abril-fatface/abril-fatface-latin-400-normal.ttf",
-            int(height * 0.08)
-        )
-        fonte_msg_pequena = ImageFont.truetype(
-            "fonts/Italianno/Italianno-Regular.ttf",
-            # "abril-fatface/abril-fatface-latin-400-normal.ttf",
-            int(height * 0.1)
-            # int(height * 0.048)
-        )
-        fonte_dias = ImageFont.truetype(
-            # "abril-fatface/abril-fatface-latin-400-normal.ttf",
-            "fonts/Italianno/Italianno-Regular.ttf",
-            int(height * 0.12)
-        )
-        fonte_numero = ImageFont.truetype(
-            "fonts/abril-fatface/abril-fatface-latin-400-normal.ttf",
-            int(height * 0.12)
-        )
-    except:
-        fonte_msg_grande = fonte_msg_pequena = fonte_dias = fonte_numero = ImageFont.load_default()
-
-
-    draw_text = ImageDraw.Draw(overlay)
-
-    # ===== LADO ESQUERDO =====
-    bbox = draw_text.textbbox((0, 0), frase_superior, font=fonte_msg_grande)
-    x = (center_x - (bbox[2] - bbox[0])) // 2
-    y = overlay_top + int(overlay_height * 0.1)
-    draw_text.text((x, y), frase_superior, fill=text_color, font=fonte_msg_grande)
-
-    bbox = draw_text.textbbox((0, 0), frase_inferior, font=fonte_msg_pequena)
-    x = (center_x - (bbox[2] - bbox[0])) // 2
-    y = overlay_top + int(overlay_height * 0.45)
-    draw_text.text((x, y), frase_inferior, fill=text_color, font=fonte_msg_pequena)
-
-    # ===== LADO DIREITO =====
-    numero = str(dias)
-    bbox = draw_text.textbbox((0, 0), numero, font=fonte_numero)
-    x = center_x + (center_x - (bbox[2] - bbox[0])) // 2
-    y = overlay_top + int(overlay_height * 0.01) - 4
-
-    draw_text.text((x, y), numero, fill=text_color, font=fonte_numero)
-
-    texto = " dias ao seu lado    "
-    bbox = draw_text.textbbox((0, 0), texto, font=fonte_dias)
-    x = center_x + (center_x - (bbox[2] - bbox[0])) // 2
-    y = overlay_top + int(overlay_height * 0.46) - 5
-    draw_text.text((x, y), texto, fill=text_color, font=fonte_dias)
-    # bbox = draw_text.textbbox((0, 0), texto, font=fonte_dias)
-    # x = center_x + (center_x - (bbox[2] - bbox[0])) // 2
-    # y = overlay_top + int(overlay_height * 0.56)
-    # draw_text.text((x, y), texto, fill=text_color, font=fonte_dias)
-
-    # ===== CORAÇÃO =====
-
-    size = 45
-    offset_x = -10
-    offset_y = 10
-
-
-    heart = Image.open("./assets/red-heart.png").convert("RGBA")
-
-    heart_height = int(height * (size / 1000))
-    heart_ratio = heart.width / heart.height
-    heart_width = int(heart_height * heart_ratio)
-    heart = heart.resize((heart_width, heart_height), Image.LANCZOS)
-
-    margin = 60
-    heart_x = width - heart_width - margin + offset_x
-    heart_y = height - overlay_height + margin + offset_y
-
-    overlay.paste(heart, (heart_x, heart_y), heart)
+    # ===== OVERLAY (camada fixa pré-composta + textos do template) =====
+    with span("text"):
+        overlay = compiled.draw(values)
 
 
     # ===== COMPOSIÇÃO FINAL =====
-    final = Image.alpha_composite(img, overlay)
-    final.convert("RGB").save(output_path, "PNG")
-
-    print(f"[OK] Imagem criada: {output_path}")
-    print(f"[OK] Dias juntos: {dias}")
+    with span("composite"):
+        return Image.alpha_composite(img, overlay).convert("RGB")
+
+
+def _compose_strip(foto_path, compiled, quality, values):
+    # Foto em RGB; só a faixa do overlay passa por RGBA. O paste com máscara
+    # mistura no próprio buffer da foto (mesmo resultado do alpha_composite
+    # sobre fundo opaco) e o encoder grava esse buffer sem cópia RGB.
+    width, height = compiled.size
+    overlay_top = compiled.overlay_top
+    cover, strip = load_source(foto_path, width, height, overlay_top, quality, mode="RGB")
+    # Entrada do cache de fonte é compartilhada entre renders: só copia se ele guarda
+    img = cover.copy() if source_cache.max_bytes else cover
+    img.paste(strip, (0, overlay_top))
+
+    with span("text"):
+        overlay = compiled.draw_strip(values)
+    with span("composite"):
+        img.paste(overlay, (0, overlay_top), overlay)
+    return img
+
+
+# Rotação no sentido horário (montagem do painel) → transpose exato do Pillow
+ROTATIONS = {0: None, 90: Image.ROTATE_270, 180: Image.ROTATE_180, 270: Image.ROTATE_90}
+
+
+def render_to_file(foto_path, frase_superior, frase_inferior, dark_mode, output_path, raw=False, quality=None,
+                   panels=(), dither="floyd", size=(800, 480), rotation=0, layout=None, dia=None):
+    # Ponto de entrada dos jobs do render engine (precisa ser picklável).
+    # ``size`` é o tamanho visto pelo usuário; ``rotation`` gira para a orientação nativa do painel.
+    # Devolve o tempo de cada etapa (o processo principal alimenta /metrics).
+    transpose = ROTATIONS[rotation]
+    with profiled() as stages:
+        if raw:
+            img = open_cover(foto_path, size[0], size[1], quality, mode="RGB")
+        else:
+            img = picture_frame(
+                foto_path=foto_path,
+                frase_superior=frase_superior,
+                frase_inferior=frase_inferior,
+                dark_mode=dark_mode,
+                output_path=None if transpose else output_path,
+                quality=quality,
+                size=size,
+                layout=layout,
+                dia=dia,
+            )
+        if transpose:
+            with span("rotate"):
+                img = img.transpose(transpose)
+        if raw or transpose:
+            with span("save"):
+                img.save(output_path, "PNG")
+
+        # Framebuffers nativos do e-ink gerados junto com o PNG
+        with span("framebuffer"):
+            for panel in panels:
+                eink.write_framebuffer(img, eink.framebuffer_path(output_path, panel, dither), panel, dither)
+    return {"path": output_path, "stages": stages}
 
 
 # EXEMPLO DE USO:
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import eink
+from layout import layout_version
+from picture import RENDER_LAYOUT, RENDER_QUALITY, dias_juntos
+
+# Frames prontos em disco, endereçados pelo hash de tudo que muda o resultado
+# (conteúdo da foto, textos, modo, layout e sua versão, contador de dias...).
+# Um acerto vira hard link (ou cópia) no destino em vez de um novo render;
+# por isso o padrão fica dentro de static/images (mesmo volume no docker).
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "static/images/cache")
+RENDER_CACHE_MB = int(os.getenv("RENDER_CACHE_MB", "256"))
+
+# Mude quando o código de render alterar a saída para as mesmas entradas
+RENDER_CACHE_VERSION = 1
+
+# Idade mínima (s) de um .tmp para ser tratado como resto de crash no scan
+TMP_GRACE = 3600
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+_photo_digests = {}
+
+
+def _photo_digest(foto_path):
+    # Blob endereçado por conteúdo já tem o sha256 no nome; o resto é lido
+    # uma vez e memorizado por (path, mtime, tamanho)
+    stem = os.path.splitext(os.path.basename(foto_path))[0]
+    if _SHA256_RE.match(stem):
+        return stem if os.path.exists(foto_path) else None
+    try:
+        st = os.stat(foto_path)
+    except OSError:
+        return None
+    memo = (os.path.abspath(foto_path), st.st_mtime_ns, st.st_size)
+    digest = _photo_digests.get(memo)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(foto_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if len(_photo_digests) > 1024:
+            _photo_digests.clear()
+        _photo_digests[memo] = digest
+    return digest
+
+
+def render_key(foto_path, frase_superior, frase_inferior, dark_mode, raw=False, quality=None,
+               size=(800, 480), rotation=0, layout=None, dia=None):
+    """Chave do frame que ``render_to_file`` geraria com estes argumentos; None sem foto."""
+    photo = _photo_digest(foto_path)
+    if photo is None:
+        return None
+    parts = [RENDER_CACHE_VERSION, photo, quality or RENDER_QUALITY, list(size), rotation]
+    if raw:
+        parts.append("raw")
+    else:
+        layout = layout or RENDER_LAYOUT
+        parts += [frase_superior, frase_inferior, bool(dark_mode), layout, layout_version(layout), dias_juntos(dia=dia)]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _place(src, dst):
+    # Troca atômica; hard link quando possível (mesmo filesystem), senão cópia
+    try:
+        if os.path.samestat(os.stat(src), os.stat(dst)):
+            return  # já é o mesmo arquivo (rename entre links do mesmo inode não faz nada)
+    except OSError:
+        pass
+    tmp = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class RenderCache:
+    """LRU em disco de frames renderizados (PNG + framebuffers), limitado por bytes.
+
+    O arquivo no cache e o publicado compartilham o inode (hard link): quem
+    renderiza num destino precisa criar um arquivo novo, nunca reescrever o
+    existente — por isso ``fetch`` apaga o destino quando não acerta.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key → (bytes, [arquivos]), menos usado primeiro
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan()
+
+    @property
+    def enabled(self):
+        return bool(self.cache_dir) and self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    def _scan(self):
+        # Reconstrói o índice do disco; mtime (tocado a cada acerto) dá a ordem do LRU
+        found = {}
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".tmp"):
+                # Temporário de um crash; recente pode ser um _place em curso de outro worker
+                if entry.stat().st_mtime < time.time() - TMP_GRACE:
+                    _remove(entry.path)
+                continue
+            st = entry.stat()
+            key = entry.name.split(".", 1)[0]
+            size, files, mtime = found.get(key, (0, [], 0.0))
+            found[key] = (size + st.st_size, files + [entry.path], max(mtime, st.st_mtime))
+        with self._lock:
+            for key in sorted(found, key=lambda k: found[k][2]):
+                size, files, _ = found[key]
+                self._entries[key] = (size, files)
+                self._bytes += size
+            self._prune()
+
+    def fetch(self, key, output_path, panels=(), dither="floyd"):
+        """Coloca o frame de ``key`` em ``output_path`` (e os framebuffers que houver); False se não houver."""
+        if key is None or not self.enabled:
+            return False
+        with self._lock:
+            hit = key in self._entries
+            if hit:
+                self._entries.move_to_end(key)
+        if hit:
+            src = self._path(key)
+            try:
+                _place(src, output_path)
+                for panel in panels:
+                    fb = eink.framebuffer_path(src, panel, dither)
+                    if os.path.exists(fb):
+                        _place(fb, eink.framebuffer_path(output_path, panel, dither))
+                os.utime(src)
+            except OSError:
+                hit = False  # removido por fora: vira miss
+                with self._lock:
+                    self._forget(key)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            for path in (output_path, *(eink.framebuffer_path(output_path, p, dither) for p in panels)):
+                _remove(path)
+        return hit
+
+    def store(self, key, output_path, panels=(), dither="floyd"):
+        """Guarda o frame recém-renderizado em ``output_path`` (e seus framebuffers)."""
+        if key is None or not self.enabled:
+            return
+        pairs = [(output_path, self._path(key))] + [
+            (eink.framebuffer_path(output_path, p, dither), eink.framebuffer_path(self._path(key), p, dither))
+            for p in panels
+        ]
+        files, size = [], 0
+        try:
+            for src, dst in pairs:
+                if os.path.exists(src):
+                    _place(src, dst)
+                    files.append(dst)
+                    size += os.path.getsize(dst)
+        except OSError as e:
+            print(f"[Render Cache] Erro ao gravar {key}: {e}")
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[0]
+                files = sorted(set(files) | set(old[1]))
+                size = sum(os.path.getsize(f) for f in files if os.path.exists(f))
+            self._entries[key] = (size, files)
+            self._bytes += size
+            self.stores += 1
+            self._prune()
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+            for path in entry[1]:
+                _remove(path)
+
+    def _prune(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._forget(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+render_cache = RenderCache(RENDER_CACHE_DIR, RENDER_CACHE_MB * 1024 * 1024)
@@ -0,0 +1,162 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import observe_render
+
+
+def _noop():
+    return None
+
+
+class RenderBusy(Exception):
+    """Fila de renderização cheia (backpressure)."""
+
+
+class RenderTimeout(Exception):
+    """Job de renderização excedeu o tempo limite."""
+
+
+class RenderEngine:
+    """Executor dedicado para renderização fora do event loop.
+
+    - ``workers > 0``: pool de processos (contexto spawn, seguro com threads)
+    - ``workers == 0``: uma thread dedicada (hosts pequenos / debug)
+
+    A fila é limitada a ``workers + queue_size`` jobs; acima disso ``submit``
+    levanta ``RenderBusy`` (ou bloqueia, se ``block=True``). Jobs que
+    estouram o timeout levantam ``RenderTimeout`` para quem espera; um job
+    que já está rodando em outro processo não pode ser interrompido e segue
+    ocupando sua vaga até terminar.
+    """
+
+    def __init__(self, workers=2, queue_size=8, timeout=60.0, initializer=None):
+        self.workers = max(0, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self.timeout = timeout
+        self.initializer = initializer
+        self.capacity = max(1, self.workers) + self.queue_size
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pending = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._timeouts = 0
+
+    # ----- executor -----
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.workers > 0:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=self.initializer,
+                    )
+                else:
+                    if self.initializer:
+                        self.initializer()
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+            return self._executor
+
+    def _reset_executor(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    @staticmethod
+    def _observe(name, start, future):
+        if future.cancelled():
+            status, result = "cancelled", None
+        elif future.exception() is not None:
+            status, result = "error", None
+        else:
+            status, result = "ok", future.result()
+        observe_render(name, time.perf_counter() - start, status, result)
+
+    # ----- API -----
+
+    def submit(self, fn, *args, block=False, **kwargs):
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self._rejected += 1
+            raise RenderBusy("Fila de renderização cheia, tente novamente em instantes")
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+        start = time.perf_counter()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # Um worker morreu: recria o pool e tenta uma vez
+            self._reset_executor(executor)
+            try:
+                future = self._get_executor().submit(fn, *args, **kwargs)
+            except Exception:
+                self._release()
+                raise
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        future.add_done_callback(partial(self._observe, getattr(fn, "__name__", "job"), start))
+        return future
+
+    def run(self, fn, *args, timeout=None, block=True, **kwargs):
+        """Versão síncrona (threads, ex.: scheduler). Bloqueia esperando vaga por padrão."""
+        future = self.submit(fn, *args, block=block, **kwargs)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            with self._lock:
+                self._timeouts += 1
+            raise RenderTimeout(f"Renderização excedeu {timeout or self.timeout}s")
+
+    async def run_async(self, fn, *args, timeout=None, **kwargs):
+        """Versão para rotas async: nunca bloqueia o event loop."""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timeouts += 1
+            raise RenderTimeout(f"Renderização excedeu {timeout or self.timeout}s")
+
+    def warmup(self):
+        # Sobe os workers já no startup (o initializer pré-carrega os recursos)
+        executor = self._get_executor()
+        if isinstance(executor, ProcessPoolExecutor):
+            for _ in range(self.workers):
+                executor.submit(_noop)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "capacity": self.capacity,
+                "pending": self._pending,
+                "submitted": self._submitted,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
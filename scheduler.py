@@ -0,0 +1,119 @@
+import heapq
+import threading
+import time
+
+from metrics import observe_scheduler
+
+
+class Scheduler:
+    """Min-heap de prazos que dorme até o próximo vencimento.
+
+    ``load()`` devolve a lista atual de ``(key, deadline, fn)`` (deadline em
+    epoch) a partir do estado já em memória; o heap é reconstruído só quando
+    ``wake()`` é chamado (API mudou jobs/config) ou depois que um job roda,
+    então ocioso não há I/O nem polling. Jobs rodam em série na thread do
+    scheduler. Um job que roda e não move o próprio prazo (ex.: álbum vazio)
+    é adiado ``retry_delay`` segundos em vez de disparar em loop.
+    """
+
+    def __init__(self, load, retry_delay=30.0, max_sleep=60.0):
+        self._load = load
+        self.retry_delay = retry_delay
+        # Teto do sono: acompanha ajustes do relógio de parede sem polling de estado
+        self.max_sleep = max_sleep
+        self._cond = threading.Condition()
+        self._heap = []
+        self._dirty = True
+        self._stopped = False
+        self._thread = None
+        self._fired = {}
+        self.runs = 0
+
+    # ----- controle -----
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def wake(self):
+        # Chamado após mudanças via API: recarrega o heap e dispara o que venceu já
+        with self._cond:
+            self._dirty = True
+            self._fired.clear()
+            self._cond.notify_all()
+
+    def next_deadline(self):
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pending": len(self._heap),
+                "next_deadline": self._heap[0][0] if self._heap else None,
+                "runs": self.runs,
+            }
+
+    # ----- loop -----
+
+    def _rebuild(self):
+        now = time.time()
+        heap = []
+        for key, deadline, fn in self._load():
+            # Compara com o prazo original (não o adiado): senão o retry dispara duas vezes
+            due = deadline
+            if self._fired.get(key) == deadline:
+                due = max(deadline, now + self.retry_delay)
+            heap.append((due, key, deadline, fn))
+        heapq.heapify(heap)
+        return heap
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                reload, self._dirty = self._dirty, False
+            if reload:
+                # Fora do Condition: load() pega o lock do estado, que as rotas
+                # seguram enquanto chamam wake()
+                try:
+                    heap = self._rebuild()
+                except Exception as e:
+                    print(f"[Scheduler] Erro ao carregar jobs: {e}")
+                    heap = []
+                with self._cond:
+                    self._heap = heap
+
+            with self._cond:
+                if self._stopped:
+                    return
+                if self._dirty:
+                    continue
+                now = time.time()
+                if not self._heap or self._heap[0][0] > now:
+                    timeout = self._heap[0][0] - now if self._heap else self.max_sleep
+                    self._cond.wait(min(timeout, self.max_sleep))
+                    continue
+                deadline, key, original, fn = heapq.heappop(self._heap)
+                self._fired[key] = original
+
+            start = time.time()
+            status = "ok"
+            try:
+                fn()
+            except Exception as e:
+                status = "error"
+                print(f"[Scheduler] Erro em {key}: {e}")
+            observe_scheduler(key, start - deadline, time.time() - start, status)
+            with self._cond:
+                self.runs += 1
+                self._dirty = True
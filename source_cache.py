@@ -0,0 +1,149 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+# Cache de fotos já decodificadas e recortadas (cover 800x480 + faixa com blur).
+# Em memória é por processo (cada worker do render engine tem o seu); em disco
+# é compartilhado entre processos e sobrevive a restarts.
+SOURCE_CACHE_MB = int(os.getenv("SOURCE_CACHE_MB", "64"))
+SOURCE_CACHE_DIR = os.getenv("SOURCE_CACHE_DIR", "")
+SOURCE_CACHE_DISK_MB = int(os.getenv("SOURCE_CACHE_DISK_MB", "256"))
+
+
+def _image_bytes(img):
+    return img.width * img.height * len(img.getbands())
+
+
+class SourceCache:
+    """LRU limitado por bytes de tuplas de imagens, com persistência opcional em disco."""
+
+    def __init__(self, max_bytes, cache_dir="", max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key_for(foto_path, *params):
+        # Caminho + mtime + tamanho: editar/substituir o arquivo invalida a entrada
+        try:
+            st = os.stat(foto_path)
+        except OSError:
+            return None
+        raw = "|".join(str(p) for p in (os.path.abspath(foto_path), st.st_mtime_ns, st.st_size, *params))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    # ----- memória -----
+
+    def _remember(self, key, images):
+        size = sum(_image_bytes(i) for i in images)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (images, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def get(self, key, count=2):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        images = self._load_disk(key, count)
+        if images is not None:
+            self.disk_hits += 1
+            self._remember(key, images)
+            return images
+        self.misses += 1
+        return None
+
+    def put(self, key, images):
+        if key is None:
+            return
+        self._remember(key, images)
+        self._save_disk(key, images)
+
+    # ----- disco -----
+
+    def _disk_paths(self, key, count):
+        return [os.path.join(self.cache_dir, f"{key}.{n}.png") for n in range(count)]
+
+    def _load_disk(self, key, count):
+        if not self.cache_dir:
+            return None
+        images = []
+        try:
+            for path in self._disk_paths(key, count):
+                with Image.open(path) as img:
+                    img.load()
+                    images.append(img.copy())
+        except (OSError, ValueError):
+            return None
+        return tuple(images)
+
+    def _save_disk(self, key, images):
+        if not self.cache_dir:
+            return
+        try:
+            for img, path in zip(images, self._disk_paths(key, len(images))):
+                tmp = f"{path}.{os.getpid()}.tmp"
+                img.save(tmp, "PNG", compress_level=1)
+                os.replace(tmp, path)
+            self._prune_disk()
+        except OSError as e:
+            print(f"[Source Cache] Erro ao gravar {key}: {e}")
+
+    def _prune_disk(self):
+        if not self.max_disk_bytes:
+            return
+        files = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".png"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+
+source_cache = SourceCache(
+    SOURCE_CACHE_MB * 1024 * 1024, SOURCE_CACHE_DIR, SOURCE_CACHE_DISK_MB * 1024 * 1024
+)
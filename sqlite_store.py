@@ -0,0 +1,367 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+from state_store import AUTO_CFG_DEFAULT, FLEET_DEFAULT, _Transactional, _load, _page_limit
+
+# Colunas indexadas de cada coleção; o registro completo fica em ``data`` (JSON),
+# então campos novos não exigem migração (colunas indexadas novas são criadas
+# e preenchidas na abertura).
+COLLECTIONS = {
+    "album": ("created_at", "path", "sha256"),
+    "messages": ("created_at",),
+    "schedule": ("created_at", "target_time"),
+    "devices": ("created_at", "token_hash"),
+    "batch_jobs": ("created_at",),
+}
+
+SCHEMA_VERSION = 1
+
+
+def _add_missing_columns(conn):
+    # Coluna indexada nova numa coleção existente: cria e preenche a partir do JSON
+    for table, columns in COLLECTIONS.items():
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for c in columns:
+            if c not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {c} TEXT")
+                conn.execute(f"UPDATE {table} SET {c} = json_extract(data, '$.{c}')")
+
+
+def _schema():
+    stmts = []
+    for table, columns in COLLECTIONS.items():
+        cols = "".join(f", {c} TEXT" for c in columns)
+        stmts.append(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f"seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE{cols}, data TEXT NOT NULL)"
+        )
+    stmts.append(_add_missing_columns)
+    for table, columns in COLLECTIONS.items():
+        stmts += [f"CREATE INDEX IF NOT EXISTS idx_{table}_{c} ON {table}({c})" for c in columns]
+    stmts += [
+        "CREATE TABLE IF NOT EXISTS documents (name TEXT PRIMARY KEY, data TEXT, updated_at REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS render_history ("
+        "seq INTEGER PRIMARY KEY AUTOINCREMENT, versao TEXT, arquivo TEXT, created_at TEXT, data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_render_history_created_at ON render_history(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_render_history_versao ON render_history(versao)",
+    ]
+    return stmts
+
+
+class SqliteDocument:
+    """Documento JSON numa linha de ``documents``; cacheado em memória (lido a cada poll)."""
+
+    def __init__(self, store, name, default):
+        self._store = store
+        self.name = name
+        self._default = default
+        self._reload()
+        if self._data is None and default is not None:
+            self._write(default)  # ainda na abertura do store: sem transaction()
+
+    def _reload(self):
+        row = self._store._conn.execute(
+            "SELECT data, updated_at FROM documents WHERE name = ?", (self.name,)
+        ).fetchone()
+        self._data = json.loads(row[0]) if row else None
+        self.modified = row[1] if row else 0.0
+
+    def get(self):
+        with self._store.lock:
+            return dict(self._data) if self._data is not None else None
+
+    def set(self, data):
+        with self._store.transaction():
+            return self._write(data)
+
+    def _write(self, data):
+        with self._store.lock:
+            now = time.time()
+            with self._store._conn:
+                self._store._conn.execute(
+                    "INSERT INTO documents (name, data, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                    (self.name, json.dumps(data, ensure_ascii=False), now),
+                )
+            self._data = dict(data) if data is not None else None
+            self.modified = now
+            self._store._committed()
+            return self.get()
+
+    def update(self, **fields):
+        with self._store.transaction():
+            data = dict(self._data or {})
+            data.update(fields)
+            return self.set(data)
+
+
+class SqliteCollection:
+    """Mesma interface de ``JsonCollection``; ordem de inserção = ``seq`` (rowid)."""
+
+    def __init__(self, store, table):
+        self._store = store
+        self.table = table
+        self.columns = COLLECTIONS[table]
+
+    def _query(self, sql, params=()):
+        with self._store.lock:
+            return self._store._conn.execute(sql, params).fetchall()
+
+    def __len__(self):
+        return self._query(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def all(self):
+        return [json.loads(r[0]) for r in self._query(f"SELECT data FROM {self.table} ORDER BY seq")]
+
+    def get(self, item_id):
+        rows = self._query(f"SELECT data FROM {self.table} WHERE id = ?", (item_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def find(self, field, value):
+        if field == "id":
+            return self.get(value)
+        if field in self.columns:
+            where, params = f"{field} = ?", (value,)
+        else:
+            where, params = "json_extract(data, ?) = ?", (f"$.{field}", value)
+        rows = self._query(f"SELECT data FROM {self.table} WHERE {where} ORDER BY seq LIMIT 1", params)
+        return json.loads(rows[0][0]) if rows else None
+
+    def _row(self, item):
+        return (item["id"], *(item.get(c) for c in self.columns), json.dumps(item, ensure_ascii=False))
+
+    def _insert_sql(self):
+        cols = ", ".join(("id", *self.columns, "data"))
+        marks = ", ".join("?" * (len(self.columns) + 2))
+        return f"INSERT INTO {self.table} ({cols}) VALUES ({marks})"
+
+    def add(self, item):
+        item = dict(item)
+        item.setdefault("id", str(uuid.uuid4()))
+        with self._store.lock, self._store._conn:
+            self._store._conn.execute(self._insert_sql(), self._row(item))
+        self._store._committed()
+        return dict(item)
+
+    def add_many(self, items):
+        items = [dict(i, id=i.get("id") or str(uuid.uuid4())) for i in items]
+        with self._store.lock, self._store._conn:
+            self._store._conn.executemany(
+                self._insert_sql().replace("INSERT", "INSERT OR IGNORE", 1), [self._row(i) for i in items]
+            )
+        self._store._committed()
+        return items
+
+    def update(self, item_id, **fields):
+        sets = ", ".join(f"{c} = ?" for c in (*self.columns, "data"))
+        with self._store.lock, self._store._conn:
+            item = self.get(item_id)
+            if item is not None:
+                item.update(fields)
+                self._store._conn.execute(f"UPDATE {self.table} SET {sets} WHERE id = ?",
+                                          (*self._row(item)[1:], item_id))
+        if item is not None:
+            self._store._committed()
+        return item
+
+    def remove(self, item_id):
+        with self._store.lock, self._store._conn:
+            item = self.get(item_id)
+            if item is not None:
+                self._store._conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (item_id,))
+        if item is not None:
+            self._store._committed()
+        return item
+
+    def remove_many(self, item_ids):
+        ids = list(item_ids)
+        if not ids:
+            return []
+        removed = []
+        with self._store.lock, self._store._conn:
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                marks = ", ".join("?" * len(chunk))
+                rows = self._store._conn.execute(
+                    f"SELECT data FROM {self.table} WHERE id IN ({marks})", chunk
+                ).fetchall()
+                removed += [json.loads(r[0]) for r in rows]
+                self._store._conn.execute(f"DELETE FROM {self.table} WHERE id IN ({marks})", chunk)
+        self._store._committed()
+        return removed
+
+    def page(self, cursor=None, limit=100):
+        # Keyset pagination pelo seq: custo constante em qualquer página
+        limit = _page_limit(limit)
+        rows = self._query(
+            f"SELECT seq, data FROM {self.table} WHERE seq > ? ORDER BY seq LIMIT ?",
+            (int(cursor or 0), limit + 1),
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return [json.loads(r[1]) for r in rows], (str(rows[-1][0]) if more else None)
+
+
+class SqliteHistory:
+    """Tabela ``render_history``: uma linha por frame publicado, mais novo primeiro na paginação."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def append(self, entry):
+        with self._store.lock, self._store._conn:
+            cur = self._store._conn.execute(
+                "INSERT INTO render_history (versao, arquivo, created_at, data) VALUES (?, ?, ?, ?)",
+                (entry.get("versao"), entry.get("arquivo"), entry.get("created_at"),
+                 json.dumps(entry, ensure_ascii=False)),
+            )
+        self._store._committed()
+        return dict(entry, seq=cur.lastrowid)
+
+    def page(self, cursor=None, limit=100):
+        limit = _page_limit(limit)
+        with self._store.lock:
+            rows = self._store._conn.execute(
+                "SELECT seq, data FROM render_history WHERE seq < ? ORDER BY seq DESC LIMIT ?",
+                (int(cursor) if cursor else sys.maxsize, limit + 1),
+            ).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        items = [dict(json.loads(r[1]), seq=r[0]) for r in rows]
+        return items, (str(rows[-1][0]) if more else None)
+
+
+class SqliteStore(_Transactional):
+    """Backend SQLite (WAL) com a mesma interface de ``StateStore``.
+
+    Uma conexão compartilhada, serializada por ``lock``; cada mutação é uma
+    transação própria, então não há flush pendente nem reescrita de arquivo
+    inteiro. ``transaction()`` (com ``lock_path``) agrupa leitura + escrita
+    entre workers. Na primeira abertura importa os JSON de ``data_dir`` se existirem.
+    """
+
+    def __init__(self, db_path, data_dir="data", lock_path=None):
+        self.lock = threading.RLock()
+        self.lock_path = lock_path
+        self.on_commit = None
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        with self._conn:
+            for stmt in _schema():
+                if callable(stmt):
+                    stmt(self._conn)
+                else:
+                    self._conn.execute(stmt)
+        fresh = self._conn.execute("PRAGMA user_version").fetchone()[0] == 0
+        if fresh:
+            migrate_json(self._conn, data_dir)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self.album = SqliteCollection(self, "album")
+        self.messages = SqliteCollection(self, "messages")
+        self.schedule = SqliteCollection(self, "schedule")
+        self.auto_cfg = SqliteDocument(self, "auto_scheduler", AUTO_CFG_DEFAULT)
+        self.latest = SqliteDocument(self, "latest", None)
+        self.history = SqliteHistory(self)
+        self.devices = SqliteCollection(self, "devices")
+        self.fleet = SqliteDocument(self, "fleet", FLEET_DEFAULT)
+        self.batch_jobs = SqliteCollection(self, "batch_jobs")
+        self._data_version = self._read_data_version()
+
+    def _read_data_version(self):
+        # Muda quando outra conexão (outro worker) faz commit; commits desta conexão não contam
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def flush(self):
+        pass  # cada mutação já é gravada na sua transação
+
+    def _committed(self):
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def reload(self):
+        # Coleções sempre leem do banco; só os documentos são cacheados
+        with self.lock:
+            self.auto_cfg._reload()
+            self.latest._reload()
+            self.fleet._reload()
+
+    def refresh(self):
+        """Relê os documentos se outro processo gravou no banco; True se mudou."""
+        with self.lock:
+            version = self._read_data_version()
+            if version == self._data_version:
+                return False
+            self._data_version = version
+            self.reload()
+            return True
+
+    def close(self):
+        with self.lock:
+            self._conn.close()
+
+
+def migrate_json(conn, data_dir):
+    """Importa as coleções, auto_scheduler/latest/fleet e render_history de ``data_dir``."""
+    counts = {}
+    with conn:
+        for table, columns in COLLECTIONS.items():
+            items = _load(os.path.join(data_dir, f"{table}.json"), [])
+            rows = []
+            for item in items:
+                item.setdefault("id", str(uuid.uuid4()))
+                rows.append((item["id"], *(item.get(c) for c in columns), json.dumps(item, ensure_ascii=False)))
+            cols = ", ".join(("id", *columns, "data"))
+            marks = ", ".join("?" * (len(columns) + 2))
+            conn.executemany(f"INSERT OR IGNORE INTO {table} ({cols}) VALUES ({marks})", rows)
+            counts[table] = len(rows)
+
+        for name, filename in (("auto_scheduler", "auto_scheduler.json"), ("latest", "latest.json"),
+                               ("fleet", "fleet.json")):
+            path = os.path.join(data_dir, filename)
+            data = _load(path, None)
+            if data is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (name, data, updated_at) VALUES (?, ?, ?)",
+                    (name, json.dumps(data, ensure_ascii=False), os.path.getmtime(path)),
+                )
+                counts[name] = 1
+
+        history = []
+        path = os.path.join(data_dir, "render_history.jsonl")
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    entry.pop("seq", None)
+                    history.append((entry.get("versao"), entry.get("arquivo"), entry.get("created_at"),
+                                    json.dumps(entry, ensure_ascii=False)))
+        conn.executemany(
+            "INSERT INTO render_history (versao, arquivo, created_at, data) VALUES (?, ?, ?, ?)", history
+        )
+        counts["render_history"] = len(history)
+
+    if any(counts.values()):
+        print(f"[SQLite Store] Migrado de {data_dir}: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    # Migração manual: python sqlite_store.py [data_dir] [db_path]
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(data_dir, "picture_frame.db")
+    if os.path.exists(db_path):
+        sys.exit(f"{db_path} já existe; a migração só roda em banco novo")
+    SqliteStore(db_path, data_dir).close()
@@ -0,0 +1,476 @@
+import os
+import json
+import copy
+import uuid
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional, TypedDict
+
+from cluster import file_lock
+from metrics import STATE_WRITE_SECONDS
+
+
+# ---------------------------------------------------------------------------
+# Tipos dos registros persistidos em data/*.json
+# ---------------------------------------------------------------------------
+
+class Photo(TypedDict, total=False):
+    id: str
+    filename: str
+    original_name: str
+    path: str
+    sha256: Optional[str]
+    phash: Optional[str]
+    near_duplicates: list
+    created_at: str
+
+
+class Message(TypedDict, total=False):
+    id: str
+    frase_superior: str
+    frase_inferior: str
+    created_at: str
+
+
+class ScheduleJob(TypedDict, total=False):
+    id: str
+    foto_path: str
+    frase_superior: str
+    frase_inferior: str
+    dark_mode: bool
+    target_time: str
+    created_at: str
+
+
+class AutoSchedulerConfig(TypedDict, total=False):
+    enabled: bool
+    interval_hours: int
+    dark_mode: bool
+    last_photo_id: Optional[str]
+    last_message_id: Optional[str]
+    next_run: Optional[str]
+    cleanup_enabled: bool
+    cleanup_interval_hours: int
+    cleanup_next_run: Optional[str]
+
+
+class Latest(TypedDict):
+    dia: str
+    horario: str
+    versao: str
+    arquivo: str
+
+
+class Device(TypedDict, total=False):
+    id: str
+    name: str
+    token_hash: str
+    width: int
+    height: int
+    panel: Optional[str]
+    dark_mode: Optional[bool]
+    rotation: int
+    created_at: str
+
+
+class BatchJob(TypedDict, total=False):
+    id: str
+    status: str
+    total: int
+    done: int
+    failed: int
+    scheduled: int
+    errors: list
+    outputs: list
+    zip: bool
+    owner: int
+    created_at: float
+    finished_at: Optional[float]
+
+
+class HistoryEntry(TypedDict, total=False):
+    seq: int
+    dia: str
+    horario: str
+    versao: str
+    arquivo: str
+    created_at: str
+
+
+PAGE_LIMIT_MAX = 500
+
+
+def _page_limit(limit):
+    return max(1, min(int(limit or 100), PAGE_LIMIT_MAX))
+
+
+AUTO_CFG_DEFAULT = {
+    "enabled": False, "interval_hours": 1, "dark_mode": False,
+    "last_photo_id": None, "last_message_id": None, "next_run": None,
+    "cleanup_enabled": False, "cleanup_interval_hours": 24, "cleanup_next_run": None,
+    "upcoming": []  # rotação planejada por /api/bundle: [{"photo_id", "message_id"}]
+}
+
+# source = entradas da última publicação; profiles = chave de perfil → frame (como Latest)
+FLEET_DEFAULT = {"source": None, "profiles": {}}
+
+# ---------------------------------------------------------------------------
+# Persistência
+# ---------------------------------------------------------------------------
+
+def _load(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception:
+        return copy.deepcopy(default)
+
+
+def atomic_write_json(path, data):
+    # Escreve num temporário no mesmo diretório e troca com os.replace:
+    # leitores (e um crash no meio) nunca veem um JSON pela metade
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _disk_stamp(path):
+    # Muda a cada os.replace (inode novo) ou append (tamanho): detecta gravação de outro processo
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class _Entry:
+    """Base comum: arquivo, flag de sujo e horário da última alteração."""
+
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self.modified = os.path.getmtime(path) if os.path.exists(path) else 0.0
+        self.disk_stamp = _disk_stamp(path)
+
+    def _changed(self):
+        self.modified = time.time()
+        self._store._mark_dirty(self)
+
+
+class JsonDocument(_Entry):
+    """Um objeto JSON (ex.: auto_scheduler.json, latest.json) mantido em memória."""
+
+    def __init__(self, store, path, default):
+        super().__init__(store, path)
+        self._default = default
+        self._data = _load(path, default)
+        if default is not None and not os.path.exists(path):
+            atomic_write_json(path, self._data)
+            self.disk_stamp = _disk_stamp(path)
+
+    def get(self):
+        with self._store.lock:
+            return copy.copy(self._data)
+
+    def set(self, data):
+        with self._store.transaction():
+            self._data = copy.copy(data)
+            self._changed()
+            return copy.copy(self._data)
+
+    def update(self, **fields):
+        with self._store.transaction():
+            data = dict(self._data or {})
+            data.update(fields)
+            return self.set(data)
+
+    def _snapshot(self):
+        return self._data
+
+    def _reload(self):
+        self._data = _load(self.path, self._default)
+        self.modified = os.path.getmtime(self.path) if os.path.exists(self.path) else 0.0
+        self.disk_stamp = _disk_stamp(self.path)
+
+
+class JsonCollection(_Entry):
+    """Lista de registros com ``id`` e índice em memória (lookup O(1)).
+
+    ``indexes`` lista campos extras com lookup O(1) em ``find`` (ex.: path, sha256).
+    """
+
+    def __init__(self, store, path, indexes=()):
+        super().__init__(store, path)
+        self._items = []
+        self._index = {}
+        self._indexed = tuple(indexes)
+        self._field_index = {}
+        self._reload()
+        if not os.path.exists(path):
+            atomic_write_json(path, self._items)
+            self.disk_stamp = _disk_stamp(path)
+        elif self._assigned_ids:
+            self._store._mark_dirty(self)
+
+    def _reload(self):
+        self._items = _load(self.path, [])
+        self._assigned_ids = False
+        for item in self._items:
+            if not item.get("id"):
+                # Registros antigos (ex.: schedule.json) ganham id na carga
+                item["id"] = str(uuid.uuid4())
+                self._assigned_ids = True
+        self._index = {item["id"]: item for item in self._items}
+        self._reindex_fields()
+        self.modified = os.path.getmtime(self.path) if os.path.exists(self.path) else 0.0
+        self.disk_stamp = _disk_stamp(self.path)
+
+    def _reindex_fields(self):
+        self._field_index = {field: {} for field in self._indexed}
+        for item in self._items:
+            self._index_fields(item)
+
+    def _index_fields(self, item):
+        for field, index in self._field_index.items():
+            value = item.get(field)
+            if value is not None:
+                index.setdefault(value, item)
+
+    def __len__(self):
+        return len(self._items)
+
+    def all(self):
+        with self._store.lock:
+            return [copy.copy(i) for i in self._items]
+
+    def get(self, item_id):
+        with self._store.lock:
+            item = self._index.get(item_id)
+            return copy.copy(item) if item is not None else None
+
+    def find(self, field, value):
+        with self._store.lock:
+            if field in self._field_index:
+                item = self._field_index[field].get(value)
+            else:
+                item = next((i for i in self._items if i.get(field) == value), None)
+            return copy.copy(item) if item is not None else None
+
+    def add(self, item):
+        with self._store.transaction():
+            item = copy.copy(item)
+            item.setdefault("id", str(uuid.uuid4()))
+            self._items.append(item)
+            self._index[item["id"]] = item
+            self._index_fields(item)
+            self._changed()
+            return copy.copy(item)
+
+    def remove(self, item_id):
+        with self._store.transaction():
+            item = self._index.pop(item_id, None)
+            if item is None:
+                return None
+            self._items = [i for i in self._items if i["id"] != item_id]
+            self._reindex_fields()
+            self._changed()
+            return item
+
+    def update(self, item_id, **fields):
+        with self._store.transaction():
+            item = self._index.get(item_id)
+            if item is None:
+                return None
+            item.update(fields)
+            self._reindex_fields()
+            self._changed()
+            return copy.copy(item)
+
+    def page(self, cursor=None, limit=100):
+        # Cursor opaco = posição na lista (o backend SQLite usa o rowid)
+        start = int(cursor) if cursor else 0
+        limit = _page_limit(limit)
+        with self._store.lock:
+            items = [copy.copy(i) for i in self._items[start:start + limit]]
+            more = start + limit < len(self._items)
+        return items, (str(start + limit) if more else None)
+
+    def remove_many(self, item_ids):
+        with self._store.transaction():
+            ids = set(item_ids) & self._index.keys()
+            if not ids:
+                return []
+            removed = [self._index.pop(i) for i in ids]
+            self._items = [i for i in self._items if i["id"] not in ids]
+            self._reindex_fields()
+            self._changed()
+            return removed
+
+    def _snapshot(self):
+        return self._items
+
+
+class JsonHistory:
+    """Histórico de renders em JSON Lines (append-only), mais novo primeiro na paginação."""
+
+    def __init__(self, store, path):
+        self._store = store
+        self.path = path
+        self._items = []
+        self._reload()
+
+    def _reload(self):
+        self._items = []
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        self._items.append(json.loads(line))
+                    except ValueError:
+                        continue
+        self.disk_stamp = _disk_stamp(self.path)
+
+    def append(self, entry):
+        with self._store.transaction():
+            entry = dict(entry, seq=len(self._items) + 1)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._items.append(entry)
+            self.disk_stamp = _disk_stamp(self.path)
+        self._store._committed()
+        return entry
+
+    def page(self, cursor=None, limit=100):
+        limit = _page_limit(limit)
+        with self._store.lock:
+            end = int(cursor) - 1 if cursor else len(self._items)
+            start = max(0, end - limit)
+            items = [copy.copy(i) for i in reversed(self._items[start:end])]
+        return items, (str(items[-1]["seq"]) if start > 0 and items else None)
+
+
+class _Transactional:
+    """``transaction()`` comum aos backends (requer ``lock``, ``lock_path``, ``refresh`` e ``flush``)."""
+
+    lock_path = None
+    _tx_depth = 0
+
+    @contextmanager
+    def transaction(self):
+        """Agrupa leitura + escrita (ex.: calcular versão + salvar latest) sem perder update.
+
+        Com ``lock_path`` a transação mais externa segura o flock do arquivo
+        (vale entre workers), relê o que outro processo gravou antes de
+        começar e grava tudo ao sair. Sem ele equivale a ``with lock``.
+        """
+        with self.lock:
+            if self._tx_depth or not self.lock_path:
+                self._tx_depth += 1
+                try:
+                    yield
+                finally:
+                    self._tx_depth -= 1
+                return
+            with file_lock(self.lock_path):
+                self._tx_depth += 1
+                try:
+                    self.refresh()
+                    yield
+                finally:
+                    self._tx_depth -= 1
+                    self.flush()
+
+
+class StateStore(_Transactional):
+    """Estado do app em memória com persistência write-through.
+
+    Todas as mutações passam por ``transaction()`` (aninhável; use por fora
+    para agrupar leitura + escrita). ``lock`` (RLock) só serializa as threads
+    do processo. Com ``flush_delay > 0`` e sem ``lock_path`` as gravações são
+    agrupadas: várias mutações dentro da janela geram uma única escrita por
+    arquivo; com ``lock_path`` cada transação grava ao sair, antes de soltar
+    o flock. ``on_commit`` (opcional) é chamado depois de cada gravação em disco.
+    """
+
+    def __init__(self, data_dir="data", flush_delay=0.0, lock_path=None):
+        self.lock = threading.RLock()
+        self.flush_delay = flush_delay
+        self.lock_path = lock_path
+        self.on_commit = None
+        self._dirty = set()
+        self._timer = None
+        os.makedirs(data_dir, exist_ok=True)
+
+        self.album = JsonCollection(self, os.path.join(data_dir, "album.json"), indexes=("path", "sha256"))
+        self.messages = JsonCollection(self, os.path.join(data_dir, "messages.json"))
+        self.schedule = JsonCollection(self, os.path.join(data_dir, "schedule.json"))
+        self.auto_cfg = JsonDocument(self, os.path.join(data_dir, "auto_scheduler.json"), AUTO_CFG_DEFAULT)
+        self.latest = JsonDocument(self, os.path.join(data_dir, "latest.json"), None)
+        self.history = JsonHistory(self, os.path.join(data_dir, "render_history.jsonl"))
+        self.devices = JsonCollection(self, os.path.join(data_dir, "devices.json"), indexes=("token_hash",))
+        self.fleet = JsonDocument(self, os.path.join(data_dir, "fleet.json"), FLEET_DEFAULT)
+        self.batch_jobs = JsonCollection(self, os.path.join(data_dir, "batch_jobs.json"))
+        self._entries = [self.album, self.messages, self.schedule, self.auto_cfg, self.latest, self.history,
+                         self.devices, self.fleet, self.batch_jobs]
+        atexit.register(self.flush)
+        self.flush()
+
+    def _mark_dirty(self, entry):
+        with self.lock:
+            self._dirty.add(entry)
+            if self.flush_delay <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self.lock:
+            dirty, self._dirty = self._dirty, set()
+            self._timer = None
+            for entry in dirty:
+                try:
+                    start = time.perf_counter()
+                    atomic_write_json(entry.path, entry._snapshot())
+                    entry.disk_stamp = _disk_stamp(entry.path)
+                    STATE_WRITE_SECONDS.observe(time.perf_counter() - start, file=os.path.basename(entry.path))
+                except Exception as e:
+                    print(f"[State Store] Erro ao gravar {entry.path}: {e}")
+                    self._dirty.add(entry)
+        if dirty:
+            self._committed()
+
+    def _committed(self):
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def reload(self):
+        # Recarrega do disco (ex.: arquivo alterado por outro processo)
+        with self.lock:
+            self.flush()
+            for entry in self._entries:
+                entry._reload()
+
+    def refresh(self):
+        """Como ``reload``, mas só relê os arquivos gravados por outro processo; True se algum mudou."""
+        with self.lock:
+            self.flush()
+            changed = [e for e in self._entries if _disk_stamp(e.path) != e.disk_stamp]
+            for entry in changed:
+                entry._reload()
+            return bool(changed)
+
+
+def open_state_store(backend="json", data_dir="data", flush_delay=0.0, sqlite_path=None, lock_path=None):
+    if backend == "sqlite":
+        from sqlite_store import SqliteStore
+        return SqliteStore(sqlite_path or os.path.join(data_dir, "picture_frame.db"), data_dir, lock_path=lock_path)
+    if backend != "json":
+        raise ValueError(f"STORAGE_BACKEND inválido: {backend} (use json ou sqlite)")
+    return StateStore(data_dir, flush_delay=flush_delay, lock_path=lock_path)
@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from PIL import Image, ImageDraw
+
+# O app usa caminhos relativos e sobe scheduler/render engine no import:
+# roda num diretório temporário com links para templates, fontes e layouts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "test-token"
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)  # módulos do app (batch, state_store...) importáveis direto nos testes
+
+
+@pytest.fixture(scope="session")
+def workdir():
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="pf-test-")
+    for name in ("templates", "fonts", "assets", "layouts"):
+        if os.path.exists(os.path.join(ROOT, name)):
+            os.symlink(os.path.join(ROOT, name), os.path.join(workdir, name))
+    os.makedirs(os.path.join(workdir, "static"), exist_ok=True)
+    os.environ.update({
+        "API_BEARER_TOKEN": TOKEN, "USERNAME": "test", "PASSWORD": "test", "STORAGE_BACKEND": "json",
+        "RENDER_WORKERS": "1", "EINK_PANELS": "bw", "SOURCE_CACHE_DIR": "",
+    })
+    os.chdir(workdir)
+    img = Image.new("RGB", (1200, 900), (90, 140, 200))
+    ImageDraw.Draw(img).ellipse((300, 200, 900, 700), fill=(240, 200, 60))
+    img.save("photo.jpg", quality=90)
+    try:
+        yield workdir
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def client(workdir):
+    from fastapi.testclient import TestClient
+    import app
+
+    with TestClient(app.app) as c:
+        c.post("/login", data={"username": "test", "password": "test"})
+        yield c
+    app.thumbnail_executor.shutdown(wait=True)  # miniaturas pendentes antes de sair do workdir
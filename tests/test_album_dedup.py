@@ -0,0 +1,109 @@
+import os
+import shutil
+
+from PIL import Image, ImageDraw
+
+
+def test_reupload_matches_entry_backfilled_from_old_layout(client):
+    import app
+
+    # Entrada de antes dos uploads por conteúdo: nome de arquivo próprio, sem sha256/phash
+    Image.new("RGB", (640, 480), (30, 160, 90)).save("legacy.jpg", quality=90)
+    legacy_path = os.path.join(app.UPLOAD_FOLDER, "foto_antiga.jpg")
+    shutil.copy("legacy.jpg", legacy_path)
+    legacy = app.state.album.add({
+        "filename": "foto_antiga.jpg", "original_name": "foto_antiga.jpg", "path": legacy_path,
+        "created_at": app.get_now_gmt3().isoformat(),
+    })
+
+    app._backfill_album_hashes()
+    assert app.state.album.get(legacy["id"])["sha256"]
+
+    with open("legacy.jpg", "rb") as f:
+        r = client.post("/api/album", files={"foto": ("legacy.jpg", f, "image/jpeg")})
+    assert r.json()["photo"]["id"] == legacy["id"]
+    assert len([p for p in app.state.album.all() if p["path"] == legacy_path]) == 1
+
+
+def _image(name, color, size=(900, 600)):
+    img = Image.new("RGB", size, color)
+    ImageDraw.Draw(img).rectangle((size[0] // 4, size[1] // 4, size[0] // 2, size[1] - 40), fill=(250, 250, 250))
+    ImageDraw.Draw(img).ellipse((size[0] // 2, 40, size[0] - 40, size[1] // 2), fill=(10, 10, 10))
+    img.save(name, quality=90)
+    return name
+
+
+def _upload(client, path):
+    with open(path, "rb") as f:
+        r = client.post("/api/album", files={"foto": (os.path.basename(path), f, "image/jpeg")})
+    assert r.status_code == 201
+    return r.json()["photo"]
+
+
+def test_reupload_returns_same_entry_and_blob(client):
+    import app
+
+    first = _upload(client, _image("dup.jpg", (120, 40, 40)))
+    second = _upload(client, "dup.jpg")
+    assert second["id"] == first["id"]
+    assert first["path"].startswith(os.path.join(app.UPLOAD_FOLDER, first["sha256"][:2]))
+    assert len([p for p in app.state.album.all() if p["sha256"] == first["sha256"]]) == 1
+
+
+def test_release_keeps_blob_referenced_by_schedule(client):
+    import app
+
+    photo = _upload(client, _image("agendada.jpg", (40, 120, 40)))
+    app.save_schedule(photo["path"], "Bom dia", "", False, "2099-01-01T08:00:00")
+    job = app.state.schedule.find("foto_path", photo["path"])
+
+    assert client.delete(f"/api/album/{photo['id']}").json()["ok"]
+    assert os.path.exists(photo["path"])  # o agendamento ainda usa a foto
+
+    app.state.schedule.remove(job["id"])
+    assert app._release_photo(photo["path"])
+    assert not os.path.exists(photo["path"])
+
+
+def test_deleting_duplicate_entry_keeps_shared_file(client):
+    import app
+
+    photo = _upload(client, _image("compartilhada.jpg", (40, 40, 120)))
+    # Entrada duplicada apontando para o mesmo blob (ex.: importada de um estado antigo)
+    twin = app.state.album.add(dict(photo, id="gemea"))
+
+    assert client.delete(f"/api/album/{twin['id']}").json()["ok"]
+    assert os.path.exists(photo["path"])
+    assert app.state.album.get(photo["id"])
+
+    assert client.delete(f"/api/album/{photo['id']}").json()["ok"]
+    assert not os.path.exists(photo["path"])
+
+
+def test_near_duplicate_is_reported(client):
+    original = _upload(client, _image("original.jpg", (200, 160, 30)))
+    # Mesma foto reduzida e recomprimida: outro sha256, dHash a poucos bits
+    with Image.open("original.jpg") as img:
+        img.resize((450, 300)).save("reduzida.jpg", quality=60)
+    near = _upload(client, "reduzida.jpg")
+    stripes = Image.new("RGB", (900, 600), (30, 60, 200))
+    for x in range(0, 900, 60):
+        ImageDraw.Draw(stripes).rectangle((x, 0, x + 29, 599), fill=(240, 240, 240))
+    stripes.save("outra.jpg", quality=90)
+    other = _upload(client, "outra.jpg")
+
+    assert near["id"] != original["id"]
+    assert original["id"] in near["near_duplicates"]
+    assert original["id"] not in other["near_duplicates"]
+
+
+def test_perceptual_index_orders_by_distance():
+    from photo_store import PerceptualIndex
+
+    index = PerceptualIndex([{"id": "a", "phash": "ff00"}, {"id": "b", "phash": "ff03"}, {"id": "c", "phash": "00ff"},
+                             {"id": "sem-hash"}])
+    assert index.near("ff01", 2) == ["a", "b"]
+    assert index.near("ff01", 2, exclude="a") == ["b"]
+    index.remove("b")
+    assert index.near("ff01", 2) == ["a"]
+    assert index.near(None, 64) == []
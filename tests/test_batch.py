@@ -0,0 +1,86 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from batch import BatchRunner
+from state_store import StateStore
+
+
+class FakeEngine:
+    """Mesmo ``submit`` do RenderEngine; grava um PNG no lugar do render."""
+
+    def __init__(self, fail_on=()):
+        self._pool = ThreadPoolExecutor(max_workers=2)
+        self.fail_on = set(fail_on)
+
+    def submit(self, fn, foto_path, frase_superior, frase_inferior, dark_mode, output_path, *args, block=False, **kw):
+        def render():
+            if frase_superior in self.fail_on:
+                raise RuntimeError(f"falhou {frase_superior}")
+            Image.new("RGB", (8, 8), (200, 10, 10)).save(output_path)
+        return self._pool.submit(render)
+
+
+def _tasks(*texts):
+    return [{"foto_path": "foto.jpg", "frase_superior": t, "frase_inferior": "", "dark_mode": False}
+            for t in texts]
+
+
+def _wait(runner, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.get(job_id)
+        if job["finished_at"] is not None:
+            return job
+        time.sleep(0.02)
+    raise AssertionError("lote não terminou")
+
+
+def test_other_worker_sees_progress_and_zip(tmp_path):
+    data_dir, out = str(tmp_path / "data"), str(tmp_path / "batches")
+    lock = str(tmp_path / "state.lock")
+    runner = BatchRunner(FakeEngine(fail_on={"b"}), out, StateStore(data_dir, lock_path=lock).batch_jobs)
+    job = runner.submit(_tasks("a", "b", "c"), make_zip=True)
+    _wait(runner, job["id"])
+
+    # Outro worker: store próprio sobre o mesmo diretório, sem o job em memória
+    other_state = StateStore(data_dir, lock_path=lock)
+    other = BatchRunner(FakeEngine(), out, other_state.batch_jobs)
+    seen = other.get(job["id"])
+    assert seen["status"] == "done"
+    assert (seen["done"], seen["failed"]) == (2, 1)
+    assert seen["outputs"] == ["0000.png", "0002.png"]
+    assert seen["errors"] == [{"index": 1, "error": "falhou b"}]
+    assert os.path.exists(other.zip_path(job["id"]))
+
+
+def test_job_of_dead_worker_is_reported_failed(tmp_path):
+    state = StateStore(str(tmp_path / "data"))
+    runner = BatchRunner(FakeEngine(), str(tmp_path / "batches"), state.batch_jobs)
+    # pid que não existe mais (acima de pid_max) com o job ainda em andamento
+    state.batch_jobs.add({"id": "orfao", "status": "running", "total": 2, "done": 1, "failed": 0, "scheduled": 0,
+                          "errors": [], "outputs": ["0000.png"], "zip": True, "owner": 2 ** 22 + 1,
+                          "created_at": time.time(), "finished_at": None})
+
+    job = runner.get("orfao")
+    assert job["status"] == "failed" and job["finished_at"] is not None
+    assert runner.fail_orphans() == 1
+    assert state.batch_jobs.get("orfao")["status"] == "failed"
+    assert runner.fail_orphans() == 0
+
+
+def test_prune_keeps_latest_jobs_and_their_files(tmp_path):
+    state = StateStore(str(tmp_path / "data"))
+    out = str(tmp_path / "batches")
+    runner = BatchRunner(FakeEngine(), out, state.batch_jobs, keep=2)
+    ids = []
+    for text in ("a", "b", "c"):
+        ids.append(runner.submit(_tasks(text))["id"])
+        _wait(runner, ids[-1])
+    runner.submit([])  # poda acontece no submit
+
+    assert runner.get(ids[0]) is None
+    assert not os.path.exists(os.path.join(out, ids[0]))
+    assert runner.known(f"{ids[-1]}.zip") and not runner.known(f"{ids[0]}.zip")
@@ -0,0 +1,130 @@
+import os
+import time
+import signal
+import multiprocessing
+
+import pytest
+
+import cluster
+from state_store import open_state_store
+
+spawn = multiprocessing.get_context("spawn")
+
+
+def _open(backend, data_dir, **kw):
+    return open_state_store(backend, data_dir, lock_path=os.path.join(data_dir, "state.lock"), **kw)
+
+
+def _increment(backend, data_dir, rounds):
+    # Worker simulado: read-modify-write no auto_cfg + append de coleção
+    state = _open(backend, data_dir, flush_delay=0.5)
+    for _ in range(rounds):
+        with state.transaction():
+            cfg = state.auto_cfg.get()
+            state.auto_cfg.update(interval_hours=cfg["interval_hours"] + 1)
+        state.messages.add({"frase_superior": "x"})
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_transaction_sees_other_store_writes(tmp_path, backend):
+    a, b = _open(backend, str(tmp_path)), _open(backend, str(tmp_path))
+    with a.transaction():
+        a.auto_cfg.update(interval_hours=5)
+        a.messages.add({"id": "m1", "frase_superior": "oi"})
+
+    # Sem aviso do peer_bus: a transação de b relê o que a gravou antes de alterar
+    with b.transaction():
+        assert b.auto_cfg.get()["interval_hours"] == 5
+        b.auto_cfg.update(interval_hours=b.auto_cfg.get()["interval_hours"] + 1)
+    assert b.messages.get("m1")["frase_superior"] == "oi"
+
+    assert a.refresh() is True
+    assert a.auto_cfg.get()["interval_hours"] == 6
+    assert a.refresh() is False  # nada mudou desde a última leitura
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_concurrent_workers_do_not_lose_updates(tmp_path, backend):
+    data_dir = str(tmp_path)
+    _open(backend, data_dir)
+    workers = [spawn.Process(target=_increment, args=(backend, data_dir, 25)) for _ in range(3)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(60)
+        assert w.exitcode == 0
+
+    state = _open(backend, data_dir)
+    assert state.auto_cfg.get()["interval_hours"] == 1 + 3 * 25
+    assert len(state.messages) == 3 * 25
+
+
+def _read(path):
+    with open(path, "r") as f:
+        return f.read()
+
+
+def test_nested_transaction_flushes_once_at_the_end(tmp_path):
+    state = _open("json", str(tmp_path), flush_delay=60)
+    path = os.path.join(str(tmp_path), "auto_scheduler.json")
+    with state.transaction():
+        state.auto_cfg.update(interval_hours=3)
+        with state.transaction():
+            state.auto_cfg.update(dark_mode=True)
+        mtime = os.stat(path).st_mtime_ns
+        assert '"interval_hours": 3' not in _read(path)
+    assert os.stat(path).st_mtime_ns != mtime
+    assert '"interval_hours": 3' in _read(path)
+
+
+def _hold_leadership(path, ready):
+    lock = cluster.LeaderLock(path, ready.set)
+    lock.start()
+    time.sleep(60)
+
+
+def test_leader_lock_fails_over_when_leader_dies(tmp_path):
+    path = str(tmp_path / "scheduler.lock")
+    ready = spawn.Event()
+    leader = spawn.Process(target=_hold_leadership, args=(path, ready))
+    leader.start()
+    try:
+        assert ready.wait(30)
+        elected = []
+        follower = cluster.LeaderLock(path, lambda: elected.append(os.getpid()), retry=0.05)
+        follower.start()
+        time.sleep(0.2)
+        assert not follower.is_leader and follower.holder() == leader.pid
+
+        os.kill(leader.pid, signal.SIGKILL)  # kernel solta o flock
+        leader.join(10)
+        deadline = time.time() + 5
+        while not follower.is_leader and time.time() < deadline:
+            time.sleep(0.02)
+        assert elected == [os.getpid()]
+        assert follower.holder() == os.getpid()
+        follower.stop()
+    finally:
+        if leader.is_alive():
+            leader.kill()
+
+
+def test_peer_bus_notifies_other_processes(tmp_path):
+    directory = str(tmp_path / "peers")
+    received = []
+    a = cluster.PeerBus(directory, lambda: None, delay=0.01)
+    b = cluster.PeerBus(directory, lambda: received.append(time.time()), delay=0.01)
+    b.path = os.path.join(directory, "outro.sock")  # mesmo processo: um socket por bus
+    a.start()
+    b.start()
+    try:
+        for _ in range(5):
+            a.notify()  # avisos seguidos viram um datagrama (ou poucos)
+        deadline = time.time() + 3
+        while not received and time.time() < deadline:
+            time.sleep(0.01)
+        assert received
+        assert a.peers() == [b.path]
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,109 @@
+import os
+import struct
+
+import pytest
+from PIL import Image, ImageDraw
+
+import delta
+import eink
+
+SIZE = (800, 480)
+
+
+def _framebuffer(panel, boxes=()):
+    """Framebuffer empacotado: fundo índice 1 com ``boxes`` ((x0, y0, x1, y1), índice) por cima."""
+    img = Image.new("P", SIZE, 1)
+    for box, index in boxes:
+        ImageDraw.Draw(img).rectangle(box, fill=index)
+    return eink.pack_framebuffer(img, panel)
+
+
+def _apply(old_data, body, panel):
+    """Cliente de referência: aplica o delta sobre o framebuffer anterior."""
+    _, _, bits, width, height, length = struct.unpack_from(">4sBBHHH", body)
+    assert bits == eink.PANELS[panel]["bits"] and (width, height) == SIZE
+    offset = 12 + length
+    (count,) = struct.unpack_from(">H", body, offset)
+    offset += 2
+    frame = delta.unpack_framebuffer(old_data, SIZE, panel)
+    for _ in range(count):
+        x, y, w, h = struct.unpack_from(">HHHH", body, offset)
+        offset += 8
+        size = (w * bits + 7) // 8 * h
+        frame.paste(delta.unpack_framebuffer(body[offset:offset + size], (w, h), panel), (x, y))
+        offset += size
+    assert offset == len(body)
+    return frame
+
+
+@pytest.mark.parametrize("panel", ["bw", "gray4", "acep7"])
+@pytest.mark.parametrize("tile", delta.TILES)
+def test_applying_delta_reproduces_new_frame(panel, tile):
+    old = _framebuffer(panel, [((100, 50, 300, 120), 0)])
+    new = _framebuffer(panel, [((100, 50, 300, 120), 0), ((500, 300, 517, 333), 0), ((0, 470, 30, 479), 2)])
+
+    rects, body = delta.compute_delta(old, new, SIZE, panel, "v1", tile=tile)
+
+    assert _apply(old, body, panel).tobytes() == delta.unpack_framebuffer(new, SIZE, panel).tobytes()
+    assert all(x % tile == 0 and y % tile == 0 for x, y, _, _ in rects)
+    assert delta.base_version(body) == "v1"
+
+
+def test_only_changed_tiles_are_sent():
+    old = _framebuffer("bw")
+    new = _framebuffer("bw", [((40, 40, 40, 40), 0)])  # um pixel
+    rects, body = delta.compute_delta(old, new, SIZE, "bw", "base", tile=16)
+    assert rects == [(32, 32, 16, 16)]
+    assert len(body) < 64
+
+
+def test_identical_frames_give_empty_delta():
+    data = _framebuffer("bw", [((10, 10, 200, 200), 0)])
+    rects, body = delta.compute_delta(data, data, SIZE, "bw", "base")
+    assert rects == []
+    assert _apply(data, body, "bw").tobytes() == delta.unpack_framebuffer(data, SIZE, "bw").tobytes()
+
+
+def test_large_change_falls_back_to_full_frame():
+    old = _framebuffer("bw")
+    new = _framebuffer("bw", [((0, 0, 799, 300), 0)])
+    assert delta.compute_delta(old, new, SIZE, "bw", "base", max_ratio=0.5) is None
+
+
+def test_merge_rects_joins_adjacent_tiles():
+    # 4x3 tiles: bloco 2x2 no canto + tile solto na última linha
+    dirty = bytes([1, 1, 0, 0,
+                   1, 1, 0, 0,
+                   0, 0, 0, 1])
+    assert delta.merge_rects(4, 3, dirty) == [(0, 0, 2, 2), (3, 2, 1, 1)]
+
+
+def test_invalid_tile_and_body():
+    data = _framebuffer("bw")
+    with pytest.raises(ValueError):
+        delta.compute_delta(data, data, SIZE, "bw", "base", tile=12)
+    assert delta.base_version(b"PNG nao e delta") is None
+    assert delta.base_version(b"") is None
+
+
+def _frame(path, size=SIZE, box=None):
+    img = Image.new("RGB", size, (255, 255, 255))
+    if box:
+        ImageDraw.Draw(img).rectangle(box, fill=(0, 0, 0))
+    img.save(path)
+    eink.write_framebuffer(path, eink.framebuffer_path(path, "bw", "floyd"), "bw", "floyd")
+    return path
+
+
+def test_write_deltas_per_panel_and_fallbacks(tmp_path):
+    base = _frame(str(tmp_path / "base.png"))
+    new = _frame(str(tmp_path / "new.png"), box=(64, 64, 127, 127))
+
+    assert delta.write_deltas(base, new, ["bw", "gray4"], "floyd", "v1") == {"bw": 1, "gray4": None}
+    with open(delta.delta_path(new, "bw", "floyd"), "rb") as f:
+        assert delta.base_version(f.read()) == "v1"
+
+    # Base de outro tamanho (ex.: device que mudou de perfil): sem delta, arquivo antigo some
+    rotated = _frame(str(tmp_path / "rotated.png"), size=(480, 800))
+    assert delta.write_deltas(rotated, new, ["bw"], "floyd", "v0") == {"bw": None}
+    assert not os.path.exists(delta.delta_path(new, "bw", "floyd"))
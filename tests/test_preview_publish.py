@@ -0,0 +1,36 @@
+import os
+
+from conftest import TOKEN
+
+
+def _post(client, action, photo_id, frase_superior):
+    return client.post("/", data={
+        "action": action, "album_photo_id": photo_id, "frase_superior": frase_superior,
+        "frase_inferior": "dormiu bem?",
+    })
+
+
+def test_preview_then_publish_keeps_framebuffers_for_delta(client):
+    import app
+
+    with open("photo.jpg", "rb") as f:
+        r = client.post("/api/album", files={"foto": ("photo.jpg", f, "image/jpeg")})
+    photo_id = r.json()["photo"]["id"]
+    headers = {"Authorization": f"Bearer {TOKEN}"}
+
+    assert _post(client, "instant", photo_id, "Bom dia").status_code == 200
+    base = app.state.latest.get()["versao"]
+
+    # Preview guarda o frame no cache sem framebuffers; publicar o mesmo frame acerta o cache
+    assert _post(client, "preview", photo_id, "Boa noite").status_code == 200
+    assert _post(client, "instant", photo_id, "Boa noite").status_code == 200
+    latest = app.state.latest.get()
+    assert latest["versao"] != base
+
+    frame = os.path.join(app.IMAGES_FOLDER, latest["arquivo"])
+    assert os.path.exists(app.eink.framebuffer_path(frame, "bw", app.EINK_DITHER))
+
+    r = client.get("/api/image/delta", params={"from": base, "panel": "bw"}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["X-Frame"] == "delta"
+    assert len(r.content) < 800 * 480 // 8
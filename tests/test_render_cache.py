@@ -0,0 +1,79 @@
+import os
+import shutil
+
+import pytest
+from PIL import Image
+
+# render_cache cria o diretório do cache (caminho relativo) no import: só dentro do workdir
+
+BASE = dict(frase_superior="Bom dia", frase_inferior="dormiu bem?", dark_mode=False, quality="fast",
+            size=(800, 480), rotation=0, layout="classic", dia="2025-06-01")
+
+CHANGED = [
+    ("frase_superior", "Boa noite"),
+    ("frase_inferior", "até amanhã"),
+    ("dark_mode", True),
+    ("quality", "best"),
+    ("size", (480, 800)),
+    ("rotation", 90),
+    ("layout", "centered"),
+    ("dia", "2025-06-02"),
+]
+
+
+@pytest.fixture
+def photos(workdir):
+    shutil.copy("photo.jpg", "key_a.jpg")
+    Image.new("RGB", (1200, 900), (20, 20, 20)).save("key_b.jpg", quality=90)
+    return "key_a.jpg", "key_b.jpg"
+
+
+@pytest.mark.parametrize("field, value", CHANGED, ids=[c[0] for c in CHANGED])
+def test_render_key_changes_with_each_input(photos, field, value):
+    from render_cache import render_key
+
+    base = render_key(photos[0], **BASE)
+    assert base == render_key(photos[0], **BASE)
+    assert render_key(photos[0], **dict(BASE, **{field: value})) != base
+
+
+def test_render_key_follows_photo_content_and_layout_version(photos, monkeypatch):
+    import render_cache
+    from render_cache import render_key
+
+    base = render_key(photos[0], **BASE)
+    assert render_key(photos[1], **BASE) != base
+    # Mesmo conteúdo em outro caminho: mesma chave
+    shutil.copy(photos[0], "key_copy.jpg")
+    assert render_key("key_copy.jpg", **BASE) == base
+    # Template editado (layout_version muda) invalida a chave
+    monkeypatch.setattr(render_cache, "layout_version", lambda name: "editado")
+    assert render_key(photos[0], **BASE) != base
+
+
+def test_cache_hit_matches_fresh_render(photos, tmp_path):
+    from eink import framebuffer_path
+    from picture import render_to_file
+    from render_cache import RenderCache, render_key
+
+    cache = RenderCache(str(tmp_path / "cache"), 64 * 1024 * 1024)
+    args = (photos[0], BASE["frase_superior"], BASE["frase_inferior"], BASE["dark_mode"])
+    opts = dict(quality=BASE["quality"], layout=BASE["layout"], dia=BASE["dia"])
+    key = render_key(*args, **opts)
+
+    rendered = str(tmp_path / "rendered.png")
+    render_to_file(*args, rendered, panels=("bw",), **opts)
+    cache.store(key, rendered, panels=("bw",))
+
+    fresh, hit = str(tmp_path / "fresh.png"), str(tmp_path / "hit.png")
+    render_to_file(*args, fresh, panels=("bw",), **opts)
+    assert cache.fetch(key, hit, panels=("bw",))
+    with open(fresh, "rb") as a, open(hit, "rb") as b:
+        assert a.read() == b.read()
+    fb_fresh, fb_hit = framebuffer_path(fresh, "bw", "floyd"), framebuffer_path(hit, "bw", "floyd")
+    with open(fb_fresh, "rb") as a, open(fb_hit, "rb") as b:
+        assert a.read() == b.read()
+    assert cache.stats()["hits"] == 1
+
+    assert not cache.fetch(render_key(photos[1], *args[1:], **opts), str(tmp_path / "miss.png"))
+    assert not os.path.exists(tmp_path / "miss.png")
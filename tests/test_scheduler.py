@@ -0,0 +1,156 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from scheduler import Scheduler
+
+
+class Entries:
+    """``load()`` do Scheduler sobre um dict key → [deadline, fn], mutável pelo teste."""
+
+    def __init__(self):
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            return [(key, deadline, fn) for key, (deadline, fn) in self.items.items()]
+
+
+def _run_scheduler(entries, **kw):
+    scheduler = Scheduler(entries, **kw)
+    scheduler.start()
+    return scheduler
+
+
+def _wait_for(predicate, timeout=3.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_runs_due_jobs_in_deadline_order():
+    ran = []
+    entries = Entries()
+    now = time.time()
+    for key, offset in (("b", 0.15), ("a", 0.05), ("c", 0.25)):
+        def job(key=key):
+            ran.append(key)
+            with entries.lock:
+                del entries.items[key]  # job que roda sai da lista (como um agendamento manual)
+        entries.items[key] = [now + offset, job]
+    scheduler = _run_scheduler(entries)
+    try:
+        assert _wait_for(lambda: len(ran) == 3)
+        assert ran == ["a", "b", "c"]
+    finally:
+        scheduler.stop()
+
+
+def test_job_that_keeps_its_deadline_is_retried_after_delay():
+    # Ex.: auto scheduler com álbum vazio não move next_run; não pode disparar em loop
+    ran = []
+    entries = Entries()
+    entries.items["auto"] = [time.time() - 1, lambda: ran.append(time.time())]
+    scheduler = _run_scheduler(entries, retry_delay=0.3)
+    try:
+        assert _wait_for(lambda: len(ran) == 2, timeout=2.0)
+        assert ran[1] - ran[0] >= 0.25
+    finally:
+        scheduler.stop()
+
+
+def test_wake_picks_up_new_deadline_and_clears_retry():
+    ran = []
+    entries = Entries()
+    entries.items["auto"] = [time.time() - 1, lambda: ran.append("auto")]
+    scheduler = _run_scheduler(entries, retry_delay=60)
+    try:
+        assert _wait_for(lambda: ran == ["auto"])
+        # Config mudou pela API: wake() esquece o adiamento e recarrega na hora
+        with entries.lock:
+            entries.items["job:1"] = [time.time(), lambda: ran.append("job:1")]
+        scheduler.wake()
+        assert _wait_for(lambda: "job:1" in ran)
+        assert ran.count("auto") == 2
+    finally:
+        scheduler.stop()
+
+
+def test_failing_job_does_not_stop_the_loop():
+    ran = []
+    entries = Entries()
+
+    def boom():
+        with entries.lock:
+            del entries.items["boom"]
+        raise RuntimeError("falhou")
+
+    now = time.time()
+    entries.items["boom"] = [now, boom]
+    entries.items["ok"] = [now + 0.05, lambda: ran.append("ok")]
+    scheduler = _run_scheduler(entries, retry_delay=60)
+    try:
+        assert _wait_for(lambda: ran == ["ok"])
+        assert scheduler.stats()["runs"] >= 2
+    finally:
+        scheduler.stop()
+
+
+@pytest.fixture
+def paused_app(client, monkeypatch):
+    # Scheduler do app sem entradas durante o teste: os jobs vencidos não disparam de verdade
+    import app
+
+    monkeypatch.setattr(app.scheduler, "_load", lambda: [])
+    app.scheduler.wake()
+    for job in app.state.schedule.all():
+        app.state.schedule.remove(job["id"])
+    yield app
+    for job in app.state.schedule.all():
+        app.state.schedule.remove(job["id"])
+    monkeypatch.undo()
+    app.scheduler.wake()
+
+
+def _add_missed(app, *hours_ago):
+    now = app.get_now_gmt3()
+    return [app.state.schedule.add({"foto_path": "photo.jpg", "frase_superior": f"{h}h", "frase_inferior": "",
+                                    "dark_mode": False,
+                                    "target_time": (now - timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M")})
+            for h in hours_ago]
+
+
+@pytest.mark.parametrize("policy, kept", [("all", {"1h", "2h", "3h"}), ("latest", {"1h"}), ("skip", set())])
+def test_catchup_policy_for_missed_jobs(paused_app, monkeypatch, policy, kept):
+    app = paused_app
+    monkeypatch.setattr(app, "SCHEDULER_CATCHUP", policy)
+    monkeypatch.setattr(app, "SCHEDULER_CATCHUP_GRACE", 60)
+    _add_missed(app, 3, 1, 2)
+    future = app.state.schedule.add({"foto_path": "photo.jpg", "frase_superior": "amanhã", "frase_inferior": "",
+                                     "dark_mode": False, "target_time": "2099-01-01T08:00"})
+
+    app._apply_catchup_policy()
+
+    remaining = {j["frase_superior"] for j in app.state.schedule.all()}
+    assert remaining == kept | {future["frase_superior"]}
+
+
+def test_skip_policy_moves_overdue_auto_run(paused_app, monkeypatch):
+    app = paused_app
+    monkeypatch.setattr(app, "SCHEDULER_CATCHUP", "skip")
+    monkeypatch.setattr(app, "SCHEDULER_CATCHUP_GRACE", 60)
+    before = app.state.auto_cfg.get()
+    overdue = (app.get_now_gmt3() - timedelta(hours=5)).isoformat()
+    app.state.auto_cfg.update(enabled=True, interval_hours=2, next_run=overdue)
+    try:
+        app._apply_catchup_policy()
+        next_run = app._parse_deadline(app.state.auto_cfg.get()["next_run"])
+        assert next_run == pytest.approx(time.time() + 2 * 3600, abs=120)
+    finally:
+        app.state.auto_cfg.set(before)
@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from sqlite_store import SqliteStore, migrate_json
+from state_store import StateStore
+
+
+@pytest.fixture
+def json_state(tmp_path):
+    """data/ no formato JSON com álbum, mensagens, histórico e documentos."""
+    state = StateStore(str(tmp_path / "data"))
+    for i in range(7):
+        state.album.add({"id": f"foto{i}", "path": f"uploads/{i}.jpg", "sha256": f"{i:064x}",
+                         "created_at": f"2025-01-0{i + 1}T10:00:00"})
+    for i in range(3):
+        state.messages.add({"id": f"msg{i}", "frase_superior": f"frase {i}"})
+    for i in range(5):
+        state.history.append({"versao": f"v{i}", "arquivo": f"{i}.png", "created_at": f"2025-01-01T1{i}:00:00"})
+    state.auto_cfg.update(enabled=True, interval_hours=3)
+    state.latest.set({"dia": "2025-01-01", "horario": "14:00", "versao": "v4", "arquivo": "4.png"})
+    return state
+
+
+def _pages(collection, limit):
+    items, cursor = collection.page(limit=limit)
+    pages = [items]
+    while cursor:
+        items, cursor = collection.page(cursor, limit=limit)
+        pages.append(items)
+    return pages
+
+
+def test_migration_round_trip_keeps_order_and_history(json_state, tmp_path):
+    data_dir = str(tmp_path / "data")
+    db = SqliteStore(str(tmp_path / "frame.db"), data_dir)
+
+    assert [p["id"] for p in db.album.all()] == [p["id"] for p in json_state.album.all()]
+    assert db.album.find("sha256", f"{3:064x}")["path"] == "uploads/3.jpg"
+    assert db.messages.all() == json_state.messages.all()
+    assert db.auto_cfg.get()["interval_hours"] == 3
+    assert db.latest.get() == json_state.latest.get()
+
+    # Histórico: mais novo primeiro, seq na ordem de gravação
+    sqlite_history, _ = db.history.page(limit=10)
+    json_history, _ = json_state.history.page(limit=10)
+    assert [h["versao"] for h in sqlite_history] == [h["versao"] for h in json_history]
+    assert [h["versao"] for h in sqlite_history] == ["v4", "v3", "v2", "v1", "v0"]
+    assert [h["seq"] for h in sqlite_history] == [h["seq"] for h in json_history] == [5, 4, 3, 2, 1]
+
+
+def test_migration_runs_only_on_a_fresh_database(json_state, tmp_path):
+    data_dir = str(tmp_path / "data")
+    path = str(tmp_path / "frame.db")
+    SqliteStore(path, data_dir).messages.add({"id": "nova", "frase_superior": "só no banco"})
+    json_state.messages.add({"id": "depois", "frase_superior": "só no JSON"})
+
+    reopened = SqliteStore(path, data_dir)
+    ids = {m["id"] for m in reopened.messages.all()}
+    assert "nova" in ids and "depois" not in ids
+
+
+def test_migrate_json_ignores_broken_history_lines(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    with open(data_dir / "render_history.jsonl", "w") as f:
+        f.write(json.dumps({"versao": "a", "seq": 9}) + "\n{quebrado\n" + json.dumps({"versao": "b"}) + "\n")
+    db = SqliteStore(str(tmp_path / "frame.db"), str(tmp_path / "vazio"))
+    counts = migrate_json(db._conn, str(data_dir))
+    assert counts["render_history"] == 2
+    items, _ = db.history.page()
+    assert [h["versao"] for h in items] == ["b", "a"]
+
+
+@pytest.mark.parametrize("limit", [1, 3, 7, 50])
+def test_keyset_pagination_covers_every_item_once(json_state, tmp_path, limit):
+    db = SqliteStore(str(tmp_path / "frame.db"), str(tmp_path / "data"))
+    expected = [p["id"] for p in db.album.all()]
+
+    for store in (db, json_state):
+        pages = _pages(store.album, limit)
+        assert [p["id"] for page in pages for p in page] == expected
+        assert all(len(page) <= limit for page in pages)
+
+
+def test_keyset_pagination_is_stable_under_deletes(json_state, tmp_path):
+    db = SqliteStore(str(tmp_path / "frame.db"), str(tmp_path / "data"))
+    first, cursor = db.album.page(limit=3)
+    # Remover itens já vistos não desloca a próxima página (cursor é o seq, não a posição)
+    db.album.remove_many([p["id"] for p in first])
+    second, _ = db.album.page(cursor, limit=3)
+    assert [p["id"] for p in second] == ["foto3", "foto4", "foto5"]
+
+
+def test_history_pagination_newest_first(tmp_path):
+    db = SqliteStore(str(tmp_path / "frame.db"), str(tmp_path / "data"))
+    for i in range(5):
+        db.history.append({"versao": f"v{i}", "arquivo": f"{i}.png", "created_at": "2025-01-01T10:00:00"})
+    pages = _pages(db.history, 2)
+    assert [[h["versao"] for h in page] for page in pages] == [["v4", "v3"], ["v2", "v1"], ["v0"]]
+    assert not os.path.exists(tmp_path / "data" / "render_history.jsonl")
@@ -0,0 +1,90 @@
+import hashlib
+import os
+
+import pytest
+from PIL import Image, ImageDraw
+
+import variants
+from variants import HotFrames
+
+
+@pytest.fixture
+def frame(tmp_path):
+    path = str(tmp_path / "frame.png")
+    img = Image.new("RGB", (800, 480), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40, 40, 400, 300), fill=(200, 30, 30))
+    draw.ellipse((450, 100, 750, 400), fill=(20, 20, 20))
+    img.save(path)
+    return path
+
+
+def test_encode_variants_writes_decodable_files(frame):
+    sizes = variants.encode_variants(frame, list(variants.VARIANTS))
+
+    assert set(sizes) == set(variants.VARIANTS)
+    with Image.open(frame) as src:
+        original = src.convert("RGB")
+    for name, (_, media_type) in variants.VARIANTS.items():
+        path = variants.variant_path(frame, name)
+        assert os.path.getsize(path) == sizes[name]
+        with Image.open(path) as img:
+            assert img.size == original.size
+            assert Image.MIME[img.format] == media_type
+            pixels = img.convert("RGB").tobytes()
+        # Sem perdas: mesmos pixels do PNG publicado
+        if name in ("png-opt", "webp"):
+            assert pixels == original.tobytes(), name
+    assert not [f for f in os.listdir(os.path.dirname(frame)) if f.endswith(".tmp")]
+
+
+def test_invalid_variant():
+    with pytest.raises(ValueError):
+        variants._encode(Image.new("RGB", (8, 8)), "jpeg", None)
+
+
+def _write(tmp_path, name, size):
+    path = str(tmp_path / name)
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+    return path
+
+
+def test_hot_frames_hit_skips_disk(tmp_path):
+    cache = HotFrames(1024)
+    path = _write(tmp_path, "a.bin", 100)
+
+    blob = cache.load(path, "v1", "image/png")
+    os.remove(path)  # publicado não muda: o acerto nem olha o disco
+    assert cache.load(path, "v1", "image/png") is blob
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    with pytest.raises(OSError):
+        cache.load(path, "v2", "image/png")  # versão nova é outra chave
+
+
+def test_hot_frames_evicts_least_recent_by_bytes(tmp_path):
+    cache = HotFrames(250)
+    a, b, c = (_write(tmp_path, f"{n}.bin", 100) for n in "abc")
+    cache.load(a, "v", "image/png")
+    cache.load(b, "v", "image/png")
+    cache.peek(a, "v")  # a vira o mais recente
+    cache.load(c, "v", "image/png")
+
+    assert cache.peek(b, "v") is None
+    assert cache.peek(a, "v") is not None and cache.peek(c, "v") is not None
+    assert cache.stats()["bytes"] == 200
+
+    big = _write(tmp_path, "big.bin", 300)
+    assert len(cache.load(big, "v", "image/png").body) == 300  # servido, mas não guardado
+    assert cache.peek(big, "v") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_blob_etag_matches_file_etag(tmp_path):
+    path = _write(tmp_path, "a.bin", 64)
+    blob = HotFrames(1024).load(path, "20250601-1", "image/png")
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    # Mesmo formato do ETag de /api/image servido do arquivo
+    assert blob.etag == f'"20250601-1-{digest[:16]}"'
+    assert blob.mtime == os.path.getmtime(path)
@@ -0,0 +1,54 @@
+import os
+import re
+import hashlib
+
+from PIL import Image, ImageOps
+
+# Miniaturas WebP do álbum: static/thumbnails/<versão>.<tamanho>.webp, onde a
+# versão deriva do conteúdo (sha256 do blob) — a URL pode ser cacheada como imutável
+THUMB_SIZES = (160, 400)
+THUMB_QUALITY = 80
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def thumbnail_version(foto_path, sha256=None):
+    """sha256 do conteúdo; uploads antigos (sem hash) usam caminho + mtime + tamanho."""
+    if sha256:
+        return sha256
+    stem = os.path.splitext(os.path.basename(foto_path))[0]
+    if _SHA256_RE.match(stem):
+        return stem  # blob endereçado por conteúdo
+    try:
+        st = os.stat(foto_path)
+    except OSError:
+        return None
+    raw = f"{os.path.abspath(foto_path)}|{st.st_mtime_ns}|{st.st_size}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def thumbnail_path(thumb_dir, version, size):
+    return os.path.join(thumb_dir, f"{version}.{size}.webp")
+
+
+def make_thumbnails(foto_path, thumb_dir, version, sizes=THUMB_SIZES):
+    """Gera todas as miniaturas com uma única decodificação (reduzida via draft)."""
+    largest = max(sizes)
+    with Image.open(foto_path) as img:
+        img.draft("RGB", (largest * 2, largest * 2))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    for size in sorted(sizes, reverse=True):
+        img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        path = thumbnail_path(thumb_dir, version, size)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        img.save(tmp, "WEBP", quality=THUMB_QUALITY, method=4)
+        os.replace(tmp, path)
+    return [thumbnail_path(thumb_dir, version, size) for size in sizes]
+
+
+def remove_thumbnails(thumb_dir, version, sizes=THUMB_SIZES):
+    for size in sizes:
+        try:
+            os.remove(thumbnail_path(thumb_dir, version, size))
+        except OSError:
+            pass
@@ -0,0 +1,131 @@
+import os
+import uuid
+import hashlib
+
+from PIL import Image
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from werkzeug.utils import secure_filename
+
+from photo_store import blob_relpath, dhash
+
+# Limites de upload: por arquivo, por requisição (corpo inteiro) e em pixels
+# (bombas de descompressão são recusadas pelo cabeçalho, antes de decodificar)
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "50"))
+UPLOAD_MAX_TOTAL_MB = int(os.getenv("UPLOAD_MAX_TOTAL_MB", "64"))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", "64000000"))
+
+CHUNK_SIZE = 1024 * 1024
+ALLOWED_FORMATS = {"JPEG", "MPO", "PNG", "WEBP", "GIF", "BMP", "TIFF"}
+
+
+class UploadRejected(Exception):
+    """Upload recusado; ``status_code`` é o HTTP a devolver (413/415/400)."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def check_image_header(fileobj, max_pixels=UPLOAD_MAX_PIXELS):
+    # Image.open só lê o cabeçalho: formato e dimensões sem decodificar pixels
+    fileobj.seek(0)
+    try:
+        with Image.open(fileobj) as img:
+            fmt, (width, height) = img.format, img.size
+    except Image.DecompressionBombError:
+        raise UploadRejected("Imagem com pixels demais", 413)
+    except (OSError, SyntaxError, ValueError):
+        raise UploadRejected("Arquivo não é uma imagem suportada", 415)
+    if fmt not in ALLOWED_FORMATS:
+        raise UploadRejected(f"Formato {fmt} não suportado", 415)
+    if width * height > max_pixels:
+        raise UploadRejected(f"Imagem com pixels demais ({width}x{height})", 413)
+    fileobj.seek(0)
+    return fmt, width, height
+
+
+def store_upload(fileobj, dest_dir, filename=None, max_bytes=UPLOAD_MAX_MB * 1024 * 1024,
+                 max_pixels=UPLOAD_MAX_PIXELS):
+    """Valida o cabeçalho, copia em blocos calculando o sha256 e move atomicamente para ``dest_dir``.
+
+    Sem ``filename`` o destino é endereçado por conteúdo (``blob_relpath``);
+    ``deduplicated`` indica que o blob já existia.
+    """
+    fmt, width, height = check_image_header(fileobj, max_pixels)
+    tmp = os.path.join(dest_dir, f".upload.{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp, "wb") as out:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"Arquivo excede {max_bytes // (1024 * 1024)} MB", 413)
+                digest.update(chunk)
+                out.write(chunk)
+        sha256 = digest.hexdigest()
+        final_path = os.path.join(dest_dir, filename or blob_relpath(sha256, fmt))
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        deduplicated = os.path.exists(final_path)
+        # Mesmo com o blob existente, o replace (conteúdo idêntico) recria o
+        # arquivo caso um delete concorrente o tenha acabado de remover
+        os.replace(tmp, final_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return {
+        "path": final_path,
+        "size": size,
+        "sha256": sha256,
+        "phash": dhash(final_path),
+        "deduplicated": deduplicated,
+        "format": fmt,
+        "width": width,
+        "height": height,
+    }
+
+
+async def save_upload(upload, dest_dir, **limits):
+    # O parser multipart já fez spool em disco; a cópia roda numa thread,
+    # fora do event loop, e a memória fica em um bloco por upload
+    if not secure_filename(upload.filename or ""):
+        raise UploadRejected("Nome de arquivo inválido")
+    return await run_in_threadpool(store_upload, upload.file, dest_dir, **limits)
+
+
+class BodySizeLimit:
+    """Middleware ASGI: 413 para corpos acima de ``max_bytes`` (Content-Length ou contagem do stream)."""
+
+    def __init__(self, app, max_bytes=UPLOAD_MAX_TOTAL_MB * 1024 * 1024):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            return await self.app(scope, receive, send)
+        detail = f"Requisição excede {self.max_bytes // (1024 * 1024)} MB"
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413)
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise HTTPException(413, detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
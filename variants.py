@@ -0,0 +1,120 @@
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+from PIL import Image
+
+# Codificações extras do frame, geradas uma vez na publicação e gravadas ao
+# lado do PNG (mesmo stem: o cleanup remove junto). O PNG original continua
+# sendo o formato padrão de /api/image, byte a byte.
+VARIANTS = {
+    "png-opt": (".opt.png", "image/png"),          # mesmo conteúdo, zlib 9 + busca de filtros
+    "png-palette": (".palette.png", "image/png"),  # 256 cores adaptativas (com dither)
+    "png-gray": (".gray.png", "image/png"),        # 8 bits de cinza
+    "webp": (".webp", "image/webp"),               # WebP sem perdas
+}
+
+
+def variant_path(image_path, name):
+    stem, _ = os.path.splitext(image_path)
+    return stem + VARIANTS[name][0]
+
+
+def _encode(img, name, fp):
+    if name == "png-opt":
+        img.save(fp, "PNG", optimize=True)
+    elif name == "png-palette":
+        img.quantize(256).save(fp, "PNG", optimize=True)
+    elif name == "png-gray":
+        img.convert("L").save(fp, "PNG", optimize=True)
+    elif name == "webp":
+        img.save(fp, "WEBP", lossless=True, quality=80, method=4)
+    else:
+        raise ValueError(f"Variante inválida: {name} (use {', '.join(VARIANTS)})")
+
+
+def encode_variants(image_path, names):
+    # Ponto de entrada picklável para o render engine: uma decodificação para todas
+    with Image.open(image_path) as src:
+        img = src.convert("RGB")
+    sizes = {}
+    for name in names:
+        path = variant_path(image_path, name)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            _encode(img, name, f)
+        os.replace(tmp, path)
+        sizes[name] = os.path.getsize(path)
+    return sizes
+
+
+class Blob:
+    """Corpo pronto para servir, com os validadores HTTP já calculados."""
+
+    __slots__ = ("body", "etag", "last_modified", "media_type", "mtime")
+
+    def __init__(self, body, versao, mtime, media_type):
+        self.body = body
+        self.mtime = mtime
+        self.media_type = media_type
+        # Mesmo formato do ETag calculado a partir do arquivo (versão + sha256 do conteúdo)
+        self.etag = f'"{versao}-{hashlib.sha256(body).hexdigest()[:16]}"'
+        self.last_modified = formatdate(int(mtime), usegmt=True)
+
+    def image_size(self):
+        # Só o cabeçalho da imagem, direto da memória
+        with Image.open(io.BytesIO(self.body)) as img:
+            return img.size
+
+
+class HotFrames:
+    """LRU em memória dos arquivos publicados, por (caminho, versão), limitado por bytes.
+
+    Arquivos publicados não mudam depois de escritos (cada publicação ganha
+    versão nova), então um acerto não precisa nem de ``stat``.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, path, versao):
+        with self._lock:
+            blob = self._entries.get((path, versao))
+            if blob is not None:
+                self._entries.move_to_end((path, versao))
+                self.hits += 1
+            return blob
+
+    def load(self, path, versao, media_type):
+        """Blob de ``path`` (lê do disco só na primeira vez); OSError se não existir."""
+        blob = self.peek(path, versao)
+        if blob is not None:
+            return blob
+        with open(path, "rb") as f:
+            mtime = os.fstat(f.fileno()).st_mtime
+            blob = Blob(f.read(), versao, mtime, media_type)
+        with self._lock:
+            self.misses += 1
+            if len(blob.body) <= self.max_bytes:
+                old = self._entries.pop((path, versao), None)
+                if old is not None:
+                    self._bytes -= len(old.body)
+                self._entries[(path, versao)] = blob
+                self._bytes += len(blob.body)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted.body)
+        return blob
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}